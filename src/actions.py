@@ -1,26 +1,31 @@
-from typing import List
-import numpy as np
+from typing import List, Tuple
 
-from entities import Entrance, Location, ItemHandler
-from utils import StringUtils
+from entities import Entrance, Item, Location, ItemHandler
+from enums import VerticalEnum
+from utils import LRUCache, StringUtils
 
-def rand(high, low=0):
-    return np.random.randint(low,high+1)
+# the vertical rules (e.g. up => <VerticalUp> => [move] above) pass move their category token, not the word typed
+VerticalMoves = {"<verticalup>": VerticalEnum.Above, "<verticaldown>": VerticalEnum.Below}
+# direction -> the command that goes that way (see ValidActions)
+MoveCommands = {VerticalEnum.Above: "up", VerticalEnum.Below: "down"}
 
-def rand_float():
-    return np.random.random()
+def move_direction(args: Tuple[Tuple[str, ...], ...]) -> str:
+    """
+    The direction parsed move args are for, e.g. (("north",),) => north, (("go", "<verticalup>"),) => above
+    """
+    if not args or not args[0]:
+        return ""
+    direction = args[0][-1]
+    return VerticalMoves.get(direction, direction)
 
 class SpecialCommands(object):
     def info(self, args=None):
-        self.print_output(f"Health:  {self.player.hp}")
-        self.print_output(f"Magic:   {self.player.mp}")
-        self.print_output(f"Attack:  {self.get_attack_points()}")
-        self.print_output(f"Defense: {self.get_defense_points()}")
+        self.emit("stats", (self.player.hp, self.player.mp, self.get_attack_points(), self.get_defense_points()))
 
         self.list_inventory()
 
     def describe(self, args=None):
-        self.print_output(self.location.describe())
+        self.emit("location", self.location.view())
 
     def help(self, args=None):
         self.print_output("Not implemented yet")
@@ -29,6 +34,8 @@ class Actions(object):
 
     def end_game(self, args=None):
         self.print_output("Game Over")
+        if self.play:
+            self.toggle(("over",))
         self.play = False
 
     def fight(self, args):
@@ -44,23 +51,27 @@ class Actions(object):
                 f"The {creature_name} is already dead. You {verb} a rotting carcass. It does not strike back...")
             return
 
+        self.touch_creature(creature)
+        creature_part, player_part = self.creature_part(creature), self.player_part()
+
         # player attacks
-        player_hits = (rand_float() <= self.player.hit_pct)
-        damage = max(0, rand(high=self.get_attack_points()) - rand(creature.defense))
+        player_hits = (self.rng.rand_float() <= self.player.stat("hit_pct"))
+        damage = max(0, self.rng.rand(high=self.get_attack_points()) - self.rng.rand(creature.stat("defense")))
         if not player_hits or damage <= 0:
             self.print_output(f"You attempt to {verb} the {creature.name}, but miss spectacularly...")
         else:
             creature.hp -= damage
             if creature.hp <= 0:
                 creature.is_alive = False
+                self.location.changed()
                 self.print_output(f"You {verb} the {creature.name}, killing it.")
             else:
                 self.print_output(
                     f"You {verb} the {creature.name}, doing {damage} points of damage. The {creature.name} has {creature.hp} health remaining. It is preparing to strike.")
 
         if creature.is_alive:
-            creature_hits = (rand_float() <= creature.hit_pct)
-            damage = max(0, rand(high=creature.attack) - rand(self.get_defense_points()))
+            creature_hits = (self.rng.rand_float() <= creature.stat("hit_pct"))
+            damage = max(0, self.rng.rand(high=creature.stat("attack")) - self.rng.rand(self.get_defense_points()))
             if not creature_hits or damage <= 0:
                 self.print_output(
                     f"The {creature.name} attempts to {creature.attack_verb} you, but you manage to avoid the attack.")
@@ -75,17 +86,56 @@ class Actions(object):
                     self.print_output(
                         f"The {creature.name} tried to {creature.attack_verb} you, doing {damage} damage. You have {self.player.hp} health remaining.")
 
+        self.replace_part(creature_part, self.creature_part(creature))
+        self.replace_part(player_part, self.player_part())
+
     def move(self, args: List[str]):
-        direction:str = args[0][0]
+        direction:str = move_direction(args)
         entrance: Entrance = getattr(self.location, direction, None)
         if not entrance:
             self.print_output(f"Cannot move {direction}!")
             return
-        if entrance.is_locked:
+        if entrance.is_closed:
+            self.print_output(f"Cannot move {direction}, the {entrance.name} is closed.")
+        elif entrance.is_locked:
             self.print_output(f"Cannot move {direction}, the {entrance.name} is locked and requires a {entrance.key_name} to unlock.")
         else:
             self.update_location(entrance.location)
 
+    def travel(self, args: List[str]):
+        name = " ".join(args[0]) if args else ""
+        if self.pager is not None:
+            self.print_output("There are no maps of this world, you will have to find the way yourself")
+            return
+        graph = self.world_graph()
+        world = self.world
+        target = graph.find(name)
+        if target is None or target not in world.visited:
+            self.print_output(f"You don't know the way to any {name or 'such place'}")
+            return
+        here = world.location_ix[id(self.location)]
+        if target == here:
+            self.print_output(f"You are already in the {self.location.name}")
+            return
+        # only through the doors already open, the player unlocks doors themselves
+        path = graph.path(here, target)
+        if path is None:
+            self.print_output(f"You can't find an open way to the {world.locations[target].name}")
+            return
+
+        # runs of moves the same way, e.g. "3 east"
+        runs = []
+        for direction in graph.moves(path):
+            if runs and runs[-1][1] == direction:
+                runs[-1][0] += 1
+            else:
+                runs.append([1, direction])
+        route = ", ".join(direction if n == 1 else f"{n} {direction}" for n, direction in runs)
+        self.print_output(f"You travel {route} to the {world.locations[target].name}")
+        for e in path[:-1]:
+            self.update_location(world.locations[graph.targets[e]], describe=False)
+        self.update_location(world.locations[target])
+
     def unlock(self, args: List[str]):
         entrance: str = args[0][0]
         location: Location = self.location
@@ -99,12 +149,23 @@ class Actions(object):
 
         e_match: Entrance = entrances[0]
         inventory: ItemHandler = self.inventory
-        matching_keys = inventory.get_items(e_match.key_name)
+        # a closed door opens without a key
+        matching_keys = [None] if e_match.is_closed else inventory.get_items(e_match.key_name)
         if not matching_keys:
             self.print_output(f"You need a {e_match.key_name} to open the {e_match.describe()}")
             return
+        was_locked = [(e, e.is_locked) for e in (e_match, e_match.cloney) if e is not None]
+        for e, _ in was_locked:
+            self.touch_entrance(e)
         if e_match.unlock(matching_keys[0]):
-            self.print_output(f"The {e_match.name} was successfully unlocked")
+            # a one way entrance doesn't know the location holding it
+            location.changed()
+            for e, is_locked in was_locked:
+                if e.is_locked != is_locked:
+                    self.toggle(self.entrance_part(e))
+                    self.lock_changed(e)
+            verb = "opened" if matching_keys[0] is None else "unlocked"
+            self.print_output(f"The {e_match.name} was successfully {verb}")
 
 class ItemActions(object):
 
@@ -114,14 +175,11 @@ class ItemActions(object):
         if not item:
             self.print_output(f"No {item_name} found in the {self.location.name}")
         else:
-            existing_item = self.inventory.get_item(item_name)
-            if existing_item:
-                self.print_output(f"You already have {existing_item.describe()} in your inventory")
-            else:
-                self.inventory.add_item(item)
-                item.on_pickup()
-                self.print_output(f"{StringUtils.init_caps(item.describe())} was added to your inventory")
-                self.list_inventory()
+            # items with the same name stack
+            self.inventory.add_item(item)
+            item.on_pickup(self)
+            self.print_output(f"{StringUtils.init_caps(item.describe())} was added to your inventory")
+            self.list_inventory()
 
     def hold(self, args): # grab
         num_items = len(self.hands.get_items())
@@ -151,7 +209,7 @@ class ItemActions(object):
             if item:
                 self.print_output(f"You dropped the {item}")
                 self.location.add_item(item)
-                item.on_drop()
+                item.on_drop(self)
                 self.holding()
             else:
                 self.print_output(f"No {item_name} found in your inventory")
@@ -159,7 +217,7 @@ class ItemActions(object):
         else:
             self.print_output(f"You dropped the {item}")
             self.location.add_item(item)
-            item.on_drop()
+            item.on_drop(self)
             self.list_inventory()
 
     def consume(self, args):
@@ -170,11 +228,21 @@ class ItemActions(object):
             if not item:
                 self.print_output(f"No {item_name} found.")
                 return
-        item.on_consume()
+        # consume callbacks change the player (e.g. the health potion)
+        player_part = self.player_part()
+        item.on_consume(self)
+        # keyed by a count rather than id(item), which a later item can reuse once this one is freed
+        self.consumed += 1
+        for turns in set(m.turns for m in item.effects):
+            effects = [m for m in item.effects if m.turns == turns]
+            # timed effects last for the next turns commands
+            expires = None if turns is None else self.turn + 1 + turns
+            self.player.modifiers.add(("consumed", self.consumed, turns), effects, expires=expires)
+        self.replace_part(player_part, self.player_part())
 
     def drop_all(self, args=None):
-        items = self.inventory.get_items()
-        items += self.hands.get_items()
+        # a new list: get_items returns the inventory's own list
+        items = self.inventory.get_items() + self.hands.get_items()
         self.inventory.clear()
         self.hands.clear()
 
@@ -184,25 +252,105 @@ class ItemActions(object):
         self.holding()
 
     def list_inventory(self, args=None):
-        num_items = len(self.inventory.get_items())
-        if num_items == 0:
-            self.print_output(f"Your inventory is empty.")
-        elif num_items == 1:
-            self.print_output(f"Your inventory has {len(self.inventory.get_items())} item:")
-        else:
-            self.print_output(f"Your inventory has {len(self.inventory.get_items())} items:")
-
-        for item in self.inventory.get_items():
-            self.print_output(f"  {item.describe()}")
+        self.emit("inventory", tuple(self.inventory.get_items()))
 
         # print what your hands are holding also
         if len(self.hands.get_items()) > 0:
             self.holding()
 
     def holding(self, args=None):
-        if len(self.hands.get_items()) > 0:
-            self.print_output(f"You are holding:")
-            for item in self.hands.get_items():
-                self.print_output(f"  {item.describe()}")
-        else:
-            self.print_output(f"You are holding nothing.")
+        self.emit("holding", tuple(self.hands.get_items()))
+
+class ValidActions(object):
+    """
+    Lists the commands that would do something in the current state (like Jericho's get_valid_actions), built from
+    the location, inventory and hands rather than by trying commands. Each candidate is parsed to check the grammar
+    maps it to the intended method and target, and results are cached per state fingerprint.
+    """
+    # NOTE: requires self.valid_actions_cache = None in __init__
+
+    def state_fingerprint(self) -> tuple:
+        # ids are stable while the world is alive, and items are frozen
+        location = self.location
+        return (
+            id(location),
+            tuple([id(i) for i in location.items]),
+            tuple([(id(c), c.is_alive) for c in location.creatures.items]),
+            tuple([(e.is_locked, e.is_visible) for e in location.get_entrances()]),
+            tuple([id(i) for i in self.inventory.items]),
+            tuple([id(i) for i in self.hands.items]),
+        )
+
+    def valid_actions(self, parser) -> List[str]:
+        """
+        :param parser: the Parser or GrammarLayer commands are parsed with
+        :return: commands with an effect (moves, item actions, fights, unlocks); look, info etc. are left out
+        """
+        if self.valid_actions_cache is None:
+            self.valid_actions_cache = LRUCache(256)
+        key = (self.state_fingerprint(), id(parser), parser.version)
+        actions = self.valid_actions_cache.get(key)
+        if actions is None:
+            actions = tuple(cmd for cmd, method, check in self.candidate_actions() if self.__parses_to(parser, cmd, method, check))
+            self.valid_actions_cache.put(key, actions)
+        return list(actions)
+
+    @staticmethod
+    def __parses_to(parser, command: str, method: str, check) -> bool:
+        result = parser.parse(command)
+        return result.is_valid and result.method == method and check(result.args)
+
+    @staticmethod
+    def same_name(name: str):
+        # how ItemHandler.get_items compares names
+        return lambda args: bool(args) and ItemHandler.key(args[0][0]) == ItemHandler.key(name)
+
+    @staticmethod
+    def __by_name(items: List[Item]) -> List[Item]:
+        return list(dict((ItemHandler.key(i.name), i) for i in items).values())
+
+    def candidate_actions(self) -> List[Tuple[str, str, object]]:
+        """
+        :return: (command, method it should parse to, check on the parsed args)
+        """
+        location: Location = self.location
+        candidates = []
+        for direction in location.get_entrance_directions():
+            entrance: Entrance = getattr(location, direction)
+            if entrance.is_visible and not entrance.is_locked:
+                command = MoveCommands.get(direction, f"go {direction}")
+                candidates.append((command, "move", lambda args, d=direction: move_direction(args) == d))
+
+        for creature in location.creatures.get_items():
+            if creature.is_alive:
+                candidates.append((f"attack {creature.name}", "fight", self.same_name(creature.name)))
+
+        # one command per name, whatever the stack size
+        inventory = self.inventory.distinct()
+        hands = self.hands.get_items()
+        in_location = location.distinct()
+        for item in in_location:
+            candidates.append((f"get {item.name}", "pickup", self.same_name(item.name)))
+        if len(hands) < 2:
+            for item in self.__by_name(inventory + in_location):
+                candidates.append((f"hold {item.name}", "hold", self.same_name(item.name)))
+        for item in self.__by_name(inventory + hands):
+            candidates.append((f"drop {item.name}", "drop", self.same_name(item.name)))
+        for item in self.__by_name(inventory + in_location):
+            # consume applies an item's effects even without a callback
+            if item.consume_fn is not None or item.effects:
+                candidates.append((f"drink {item.name}", "consume", self.same_name(item.name)))
+        if inventory or hands:
+            candidates.append(("drop all", "drop_all", lambda args: True))
+
+        entrances = [e for e in location.get_entrances() if e.is_visible and e.is_locked]
+        for entrance in entrances:
+            if entrance.is_closed or self.inventory.count(entrance.key_name):
+                # unlock matches its argument against entrance names, it must pick out just this one
+                verb = "open" if entrance.is_closed else "unlock"
+                candidates.append((f"{verb} {entrance.name}", "unlock",
+                                   lambda args: bool(args) and len([e for e in entrances if args[0][0] in e.name]) == 1))
+
+        # a command can come up twice, e.g. holding an item that is both carried and on the floor
+        seen = set()
+        return [c for c in candidates if not (c[0] in seen or seen.add(c[0]))]
@@ -0,0 +1,137 @@
+import argparse
+import itertools
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from entities import Item, LivingThing, Player, WorldIndex
+from game_world import generate_world
+
+@dataclass
+class CombatResult(object):
+    num_fights: int
+    # fights where the creature died, the player died, or neither within max_turns
+    wins: int
+    losses: int
+    unfinished: int
+    # turns_to_kill[t] = fights won on the t'th attack
+    turns_to_kill: np.ndarray
+    # hp_lost[h] = fights the player lost h health in (capped at the starting hp)
+    hp_lost: np.ndarray
+
+    @property
+    def win_pct(self) -> float:
+        return self.wins / self.num_fights
+
+    @property
+    def loss_pct(self) -> float:
+        return self.losses / self.num_fights
+
+    @property
+    def mean_turns_to_kill(self) -> float:
+        return float(np.arange(len(self.turns_to_kill)) @ self.turns_to_kill) / max(self.wins, 1)
+
+    @property
+    def expected_hp_loss(self) -> float:
+        return float(np.arange(len(self.hp_lost)) @ self.hp_lost) / self.num_fights
+
+def rand_array(rng: np.random.Generator, high, n: int) -> np.ndarray:
+    # same range as BlockRandom.rand: uniform over 0..high inclusive
+    return rng.integers(0, np.asarray(high) + 1, size=n)
+
+def simulate_fights(player: Player, creature: LivingThing, items: Iterable[Item] = (), num_fights: int = 1000000,
+                    max_turns: int = 100, seed: int = None) -> CombatResult:
+    """
+    Plays num_fights fights to the death at once with NumPy arrays, using the rules of Actions.fight: each turn the
+    player attacks, then the creature strikes back if it is still alive. A blow lands if a uniform draw is
+    <= the attacker's hit_pct, and does max(0, rand(attack) - rand(defense)) damage.
+
+    :param player:      the player's starting stats
+    :param creature:    the creature's starting stats
+    :param items:       held items, adding their attack and defense to the player's stats (with its modifiers)
+    :param num_fights:  fights to simulate
+    :param max_turns:   fights still going after this many turns are counted as unfinished
+    :param seed:        seeds the generator, so results are reproducible
+    """
+    rng = np.random.default_rng(seed)
+    items = list(items)
+    attack = player.stat("attack") + sum(item.attack for item in items)
+    defense = player.stat("defense") + sum(item.defense for item in items)
+    player_hit_pct, creature_hit_pct = player.stat("hit_pct"), creature.stat("hit_pct")
+    creature_attack, creature_defense = creature.stat("attack"), creature.stat("defense")
+
+    player_hp = np.full(num_fights, player.hp, dtype=np.int64)
+    creature_hp = np.full(num_fights, creature.hp, dtype=np.int64)
+    turns_to_kill = np.zeros(max_turns + 1, dtype=np.int64)
+    # positions of the fights still going, shrunk as fights end
+    active = np.arange(num_fights)
+    for turn in range(1, max_turns + 1):
+        if len(active) == 0:
+            break
+        n = len(active)
+        # the game draws the damage even when the attack misses
+        hits = rng.random(n) <= player_hit_pct
+        damage = np.maximum(0, rand_array(rng, attack, n) - rand_array(rng, creature_defense, n))
+        creature_hp[active] -= np.where(hits, damage, 0)
+        killed = creature_hp[active] <= 0
+        turns_to_kill[turn] = killed.sum()
+        active = active[~killed]
+
+        n = len(active)
+        hits = rng.random(n) <= creature_hit_pct
+        damage = np.maximum(0, rand_array(rng, creature_attack, n) - rand_array(rng, defense, n))
+        player_hp[active] -= np.where(hits, damage, 0)
+        active = active[player_hp[active] > 0]
+
+    wins = int(turns_to_kill.sum())
+    unfinished = len(active)
+    hp_lost = np.bincount(player.hp - np.maximum(player_hp, 0), minlength=player.hp + 1)
+    return CombatResult(num_fights=num_fights, wins=wins, losses=num_fights - wins - unfinished, unfinished=unfinished,
+                        turns_to_kill=turns_to_kill, hp_lost=hp_lost)
+
+def sweep(player: Player, creature: LivingThing, grid: Dict[str, Sequence], items: Iterable[Item] = (),
+          num_fights: int = 100000, max_turns: int = 100, seed: int = 0) -> List[Tuple[Dict, CombatResult]]:
+    """
+    Simulates fights for every combination of the stats in grid
+
+    :param grid:    "player.<stat>" or "creature.<stat>" -> values to try, e.g. {"creature.hp": [10, 20, 30]}
+    :return: (stats tried, result) per combination, in itertools.product order
+    """
+    items = list(items)
+    results = []
+    for values in itertools.product(*grid.values()):
+        stats = dict(zip(grid.keys(), values))
+        player_stats, creature_stats = {}, {}
+        for key, value in stats.items():
+            who, stat = key.split(".")
+            if who == "player":
+                player_stats[stat] = value
+            elif who == "creature":
+                creature_stats[stat] = value
+            else:
+                raise Exception(f"Unknown stat: {key}, expected player.<stat> or creature.<stat>")
+        result = simulate_fights(replace(player, **player_stats), replace(creature, **creature_stats), items,
+                                 num_fights=num_fights, max_turns=max_turns, seed=seed)
+        results.append((stats, result))
+    return results
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Simulate fights against the creatures of generate_world")
+    arg_parser.add_argument("--fights", type=int, default=1000000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    world = WorldIndex(generate_world())
+    items = [item for location in world.locations for item in location.items if item.attack or item.defense]
+
+    for creature in world.creatures:
+        for held in [[]] + [[item] for item in items] + ([items] if len(items) > 1 else []):
+            start = time.perf_counter()
+            result = simulate_fights(Player(), creature, held, num_fights=args.fights, seed=args.seed)
+            elapsed = time.perf_counter() - start
+            print(f"{creature.name:>8} holding {str(held):<18} win {result.win_pct:6.1%}  "
+                  f"turns {result.mean_turns_to_kill:5.2f}  hp lost {result.expected_hp_loss:6.2f}  "
+                  f"({result.num_fights / elapsed:,.0f} fights/sec)")
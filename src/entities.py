@@ -1,12 +1,14 @@
-from dataclasses import dataclass
-from typing import List, Callable, Union
+import heapq
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Tuple, Union
 
 from enums import CompassEnum, VerticalEnum
 from parser import Parser
+from stats import Modifier, Modifiers
 from utils import StringUtils
 
 
-@dataclass
+@dataclass(slots=True)
 class LivingThing(object):
     name: str = "(LivingThing)"
     desc: str = ""
@@ -17,10 +19,25 @@ class LivingThing(object):
     hit_pct: float = 0.8
     is_alive: bool = True
     attack_verb: str = "strike"
+    # held items, buffs etc, see stat(); made on first use, most creatures never have any
+    modifiers: Modifiers = field(default=None, repr=False, compare=False)
 
     def __repr__(self):
         return self.name
 
+    def stat(self, name: str):
+        """
+        A stat with the modifiers in effect, e.g. stat("attack")
+        """
+        if self.modifiers is None:
+            return getattr(self, name)
+        return getattr(self, name) + self.modifiers.totals.get(name, 0)
+
+    def get_modifiers(self) -> Modifiers:
+        if self.modifiers is None:
+            self.modifiers = Modifiers()
+        return self.modifiers
+
     def describe(self):
         # Description overrides the default behavior
         if len(self.desc) > 0:
@@ -31,41 +48,57 @@ class LivingThing(object):
         else:
             return f"a {self}"
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Item(object):
     name: str = ""
     attack: int = 0
     defense: int = 0
     hp: int = 0
     mp: int = 0
+    # modifiers its consumer gets, e.g. Modifier("attack", 5, turns=10)
+    effects: Tuple[Modifier, ...] = ()
 
-    consume_fn: Callable[['Item'],None] = lambda a: None
-    pickup_fn: Callable[['Item'],None]  = lambda a: None
-    drop_fn: Callable[['Item'],None]    = lambda a: None
+    # called with the item and the GameState of the player using it, None does nothing
+    consume_fn: Callable[['Item','GameState'],None] = None
+    pickup_fn: Callable[['Item','GameState'],None]  = None
+    drop_fn: Callable[['Item','GameState'],None]    = None
 
     def __post_init__(self):
         parser = Parser()
-        item_name = self.name.lower()
+        for left, right in self.grammar_rules(self.name):
+            parser.try_add_new_rule(left=left, right=right)
+
+    @staticmethod
+    def grammar_rules(name: str) -> List[Tuple[str, str]]:
+        """
+        The (left, right) rules an item called name adds, so the parser accepts commands naming it
+        """
+        item_name = name.lower()
         # Allow overriding of default behavior
         if " " in item_name:
             item_name_joined = item_name.replace(" ", "_")
-            parser.try_add_new_rule(left=item_name, right=item_name_joined)
-            parser.try_add_new_rule(left=item_name_joined, right="<PickupAble>")
-        else:
-            parser.try_add_new_rule(left=item_name, right="<PickupAble>")
+            return [(item_name, item_name_joined), (item_name_joined, "<PickupAble>")]
+        return [(item_name, "<PickupAble>")]
 
-    def on_pickup(self):
-        self.pickup_fn(self)
+    def on_pickup(self, game_state):
+        if self.pickup_fn is not None:
+            self.pickup_fn(self, game_state)
 
-    def on_drop(self):
-        self.drop_fn(self)
+    def on_drop(self, game_state):
+        if self.drop_fn is not None:
+            self.drop_fn(self, game_state)
 
-    def on_consume(self):
-        self.consume_fn(self)
+    def on_consume(self, game_state):
+        if self.consume_fn is not None:
+            self.consume_fn(self, game_state)
 
     def __repr__(self):
         return self.name
 
+    def held_modifiers(self) -> Tuple[Modifier, ...]:
+        return tuple(Modifier(stat, amount) for stat, amount in (("attack", self.attack), ("defense", self.defense))
+                     if amount)
+
     def describe(self):
         if self.name[0] in "aeiou":
             desc = f"an {self}"
@@ -78,38 +111,160 @@ class Item(object):
         return desc
 
 class ItemHandler(object):
-    # NOTE: requires implementation of items list - self.items = []
+    """
+    Items (or creatures) kept in stacks by name. Lookup, adding and removing are O(1) for a given name, and any
+    number of things can share a name, e.g. two potions. items lists them all in the order they were added.
+    """
+    # NOTE: subclasses must call ItemHandler.__init__
+    __slots__ = ("stacks", "orders", "next_order", "flat", "observer", "holder_id")
+
     def __init__(self):
-        self.items : List[Item] = []
+        # normalized name -> items with that name, the last added at the end
+        self.stacks: Dict[str, List[Item]] = {}
+        # normalized name -> when each item in its stack was added, counted by next_order
+        self.orders: Dict[str, List[int]] = {}
+        self.next_order = 0
+        # all the items in order, rebuilt on demand after a change
+        self.flat: List[Item] = None
+        # set by a GameState once it indexes the world, told of every item about to be added or removed
+        self.observer = None
+        self.holder_id = None
+
+    @staticmethod
+    def key(name: str) -> str:
+        return name.replace(" ", "_")
+
+    @property
+    def items(self) -> List[Item]:
+        # treat as read only, change through add_item etc
+        if self.flat is None:
+            if len(self.stacks) <= 1:
+                self.flat = [i for stack in self.stacks.values() for i in stack]
+            else:
+                # each stack is in order already, the orders are distinct so items are never compared
+                stacks = [zip(self.orders[key], stack) for key, stack in self.stacks.items()]
+                self.flat = [item for _, item in heapq.merge(*stacks)]
+        return self.flat
+
+    @items.setter
+    def items(self, items: List[Item]):
+        self.stacks, self.orders = {}, {}
+        for order, item in enumerate(items):
+            key = self.key(item.name)
+            self.stacks.setdefault(key, []).append(item)
+            self.orders.setdefault(key, []).append(order)
+        self.next_order = len(items)
+        self.changed()
 
     def get_items(self, pattern:str = None)->List[Item]:
         if pattern:
-            return [i for i in self.items if i.name.replace(" ", "_") == pattern.replace(" ", "_")]
+            return list(self.stacks.get(self.key(pattern), ()))
         return self.items
 
     def get_item(self, item_name: str)->Union[Item, None]:
-        match = self.get_items(pattern=item_name)
-        if match:
-            assert len(match) == 1, f"Should only match one item: {item_name}"
-            return match[0]
-        else:
+        """
+        The last added item with the name, the one remove_item takes
+        """
+        stack = self.stacks.get(self.key(item_name))
+        return stack[-1] if stack else None
+
+    def count(self, item_name: str) -> int:
+        return len(self.stacks.get(self.key(item_name), ()))
+
+    def distinct(self) -> List[Item]:
+        """
+        One item per name, the one get_item returns
+        """
+        return [stack[-1] for stack in self.stacks.values()]
+
+    def add_item(self, item: Item)->None:
+        key = self.key(item.name)
+        stack = self.stacks.get(key)
+        if stack is None:
+            stack = self.stacks[key] = []
+            self.orders[key] = []
+        if self.observer is not None:
+            self.observer.item_moving(self.holder_id, item, len(stack))
+        stack.append(item)
+        self.orders[key].append(self.next_order)
+        self.next_order += 1
+        self.changed()
+
+    def remove_item(self, item_name: str):
+        """
+        Removes the last added item with the name
+
+        :return: the item, None if there is none
+        """
+        key = self.key(item_name)
+        stack = self.stacks.get(key)
+        if not stack:
             return None
+        item = stack[-1]
+        if self.observer is not None:
+            self.observer.item_moving(self.holder_id, item, len(stack) - 1)
+        stack.pop()
+        self.orders[key].pop()
+        if not stack:
+            del self.stacks[key]
+            del self.orders[key]
+        self.changed()
+        return item
+
+    def clear(self):
+        if self.observer is not None:
+            for stack in self.stacks.values():
+                for i, item in enumerate(stack):
+                    self.observer.item_moving(self.holder_id, item, i)
+        self.stacks, self.orders = {}, {}
+        self.changed()
+
+    def changed(self):
+        """
+        Called after every change to the items, subclasses extend it to drop their own caches
+        """
+        self.flat = None
+
+class Hands(ItemHandler):
+    """
+    The items a LivingThing holds, whose attack and defense count towards its stats while held
+    """
+    __slots__ = ("owner",)
+
+    def __init__(self, owner: LivingThing):
+        super().__init__()
+        self.owner = owner
 
     def add_item(self, item: Item)->None:
-        self.items.append(item)
+        super().add_item(item)
+        self.owner.get_modifiers().add(("held", id(item)), item.held_modifiers())
 
     def remove_item(self, item_name: str):
-        item = self.get_item(item_name)
+        item = super().remove_item(item_name)
         if item:
-            self.items.remove(item)
-            return item
-        else:
-            return None
+            self.owner.get_modifiers().remove(("held", id(item)))
+        return item
 
     def clear(self):
-        self.items = []
+        for item in self.items:
+            self.owner.get_modifiers().remove(("held", id(item)))
+        super().clear()
 
-@dataclass
+class Creatures(ItemHandler):
+    """
+    The creatures in a Location, which is told of every change so its description is rebuilt
+    """
+    __slots__ = ("location",)
+
+    def __init__(self, location: 'Location'):
+        super().__init__()
+        self.location = location
+
+    def changed(self):
+        super().changed()
+        self.location.changed()
+
+@dataclass(slots=True)
 class Player(LivingThing):
     hp: int = None
     max_hp: int = 100
@@ -117,11 +272,12 @@ class Player(LivingThing):
     defense: int = 5
 
     def __post_init__(self):
+        self.get_modifiers()
         if self.hp is None:
             self.hp = self.max_hp
         assert  self.hp <= self.max_hp, f"Hp:{self.hp} cannpt be greater than max_hp:{self.max_hp}"
 
-@dataclass
+@dataclass(slots=True)
 class Entrance(object):
     location: 'Location'
 
@@ -130,7 +286,7 @@ class Entrance(object):
     name: str = None
     short_name: str = ""
 
-    # name of item needed to unlock
+    # name of item needed to unlock, None for a closed door that opens without one
     key_name: str = "-"
     cloney: 'Entrance' = None
 
@@ -147,25 +303,36 @@ class Entrance(object):
             self.short_name = self.name.lower().strip().split(" ")[-1]
 
         parser = Parser()
-        parser.try_add_new_rule(left=self.name, right="<Unlockable>")
-        parser.try_add_new_rule(left=self.short_name, right="<Unlockable>")
+        for left, right in self.grammar_rules(self.name, self.short_name):
+            parser.try_add_new_rule(left=left, right=right)
+
+    @staticmethod
+    def grammar_rules(name: str, short_name: str) -> List[Tuple[str, str]]:
+        return [(name, "<Unlockable>"), (short_name, "<Unlockable>")]
+
+    @property
+    def is_closed(self) -> bool:
+        return self.is_locked and self.key_name is None
 
     def describe(self):
         if self.is_locked:
-            return f"locked {self.name}"
+            return f"closed {self.name}" if self.key_name is None else f"locked {self.name}"
         return self.name
 
-    def unlock(self, item: Item):
+    def unlock(self, item: Item = None):
         """
         Unlocks the Entrance if locked
 
-        :param item: item used to unlock the Entrance
+        :param item: item used to unlock the Entrance, None to open a closed one
         :return:
         """
-        if item.name == self.key_name:
+        if self.key_name is None or (item is not None and item.name == self.key_name):
             self.is_locked = False
+            self.location.changed()
             if self.cloney:
                 self.cloney.is_locked = False
+                # each side of a two way entrance leads to the location holding the other
+                self.cloney.location.changed()
             return True
         return False
 
@@ -179,14 +346,13 @@ class Entrance(object):
         e.cloney = self
         return e
 
-@dataclass
+@dataclass(slots=True)
 class Location(ItemHandler):
     name: str = "(Name)"
     initial_desc: str = ""
     desc: str = "(Desc)"
 
-    items = None
-    creatures = None
+    creatures: 'Creatures' = field(default=None, init=False, repr=False, compare=False)
 
     north: Entrance = None
     south: Entrance = None
@@ -198,55 +364,78 @@ class Location(ItemHandler):
 
     visited: bool = False
 
+    # visited -> LocationView, until the items, creatures or entrances change (see changed)
+    views: Dict[bool, 'LocationView'] = field(default=None, init=False, repr=False, compare=False)
+
     @staticmethod
     def Default():
         return Location()
 
+    @staticmethod
+    def grammar_rules(name: str) -> List[Tuple[str, str]]:
+        """
+        The (left, right) rules a location called name adds, so "go to <name>" parses (see GameState.index_world).
+        None for the placeholder name, or a name with a stop word in it, as those are dropped from commands.
+        """
+        room_name = name.lower()
+        words = room_name.split(" ")
+        if name == "(Name)" or not room_name or any(w in Parser.StopWords for w in words):
+            return []
+        return [(room_name, "<Room>")]
+
     def add_north(self, entrance: Entrance, two_way=True):
         self.north = entrance
+        self.changed()
         if two_way:
             cloney = entrance.clone()
             cloney.location = self
             entrance.location.south = cloney
+            entrance.location.changed()
 
     def add_south(self, entrance: Entrance, two_way=True):
         self.south = entrance
+        self.changed()
         if two_way:
             cloney = entrance.clone()
             cloney.location = self
             entrance.location.north = cloney
+            entrance.location.changed()
 
     def add_east(self, entrance: Entrance, two_way=True):
         self.east = entrance
-
+        self.changed()
         if two_way:
             cloney = entrance.clone()
             cloney.location = self
             entrance.location.west = cloney
+            entrance.location.changed()
 
     def add_west(self, entrance: Entrance, two_way=True):
         self.west = entrance
-
+        self.changed()
         if two_way:
             cloney = entrance.clone()
             cloney.location = self
             entrance.location.east = cloney
+            entrance.location.changed()
 
     def add_above(self, entrance: Entrance, two_way=True):
         self.above = entrance
-
+        self.changed()
         if two_way:
             cloney = entrance.clone()
             cloney.location = self
             entrance.location.below = cloney
+            entrance.location.changed()
 
     def add_below(self, entrance: Entrance, two_way=True):
         self.below = entrance
-
+        self.changed()
         if two_way:
             cloney = entrance.clone()
             cloney.location = self
             entrance.location.above = cloney
+            entrance.location.changed()
 
     def add_creature(self, creature):
         self.creatures.add_item(creature)
@@ -255,7 +444,9 @@ class Location(ItemHandler):
         return self.creatures.remove_item(creature_name)
 
     def get_creature(self, creature_name):
-        return self.creatures.get_item(creature_name)
+        # the first one still alive, if several share the name
+        creatures = self.creatures.get_items(creature_name)
+        return next((c for c in creatures if c.is_alive), creatures[0] if creatures else None)
 
     def __post_init__(self):
         self.initial_desc = self.initial_desc.strip()
@@ -263,8 +454,8 @@ class Location(ItemHandler):
         if not self.initial_desc:
             self.initial_desc = self.desc
         self.name = self.name.strip()
-        self.items = []
-        self.creatures = ItemHandler()
+        ItemHandler.__init__(self)
+        self.creatures = Creatures(self)
 
     def get_entrances(self)->List[Entrance]:
         directions = self.get_entrance_directions()
@@ -286,43 +477,157 @@ class Location(ItemHandler):
             entrances.append(VerticalEnum.Below)
         return entrances
 
-    def describe(self):
-        def describe_item_list(items):
-            if len(items) == 1:
-                str_items = items[0].describe()
-            elif len(items) > 1:
-                str_items = ", ".join([i.describe() for i in items[:-1]])
-                str_items += f" and {items[-1].describe()}"
-            return str_items
+    def changed(self):
+        ItemHandler.changed(self)
+        self.views = None
 
-        # Description
-        out_val = StringUtils.init_caps(self.name)
-        if not self.visited:
-            self.visited = True
-            out_val += f"\n{self.initial_desc}"
-        else:
-            out_val += f"\n{self.desc}"
-
-        # Entrances - paths into an out of location
+    def view(self) -> 'LocationView':
+        """
+        Captures what describe shows, marking the location visited. Views are cached, so looking around a
+        location that hasn't changed since costs a dict lookup.
+        """
+        views = self.views
+        if views is None:
+            views = self.views = {}
+        view = views.get(self.visited)
+        if view is None:
+            view = views[self.visited] = self.build_view()
+        self.visited = True
+        return view
+
+    def build_view(self) -> 'LocationView':
+        desc = self.desc if self.visited else self.initial_desc
+        entrances = []
         for direction in self.get_entrance_directions():
             # Use direction name to get correct property
             entrance: Entrance = getattr(self, direction)
             if not entrance.is_visible:
                 continue
+            if direction not in VerticalEnum.Values and direction not in CompassEnum.Values:
+                raise Exception(f"Unknown location name: {direction}")
+            entrances.append((direction, entrance.describe()))
+        return LocationView(self.name, desc, tuple(entrances), tuple(self.creatures.get_items()), tuple(self.get_items()))
+
+    def describe(self):
+        return self.view().render()
+
+@dataclass(slots=True)
+class LocationView(object):
+    """
+    A Location as describe shows it at one moment, only rendered to text when needed (and then only once).
+    Views are shared by every describe until the Location changes, so nothing should modify one.
+    """
+    name: str
+    desc: str
+    # (direction, entrance description) pairs
+    entrances: tuple
+    creatures: tuple
+    items: tuple
+
+    text: str = field(default=None, init=False, repr=False, compare=False)
+
+    @staticmethod
+    def describe_item_list(items):
+        if len(items) == 1:
+            return items[0].describe()
+        return ", ".join([i.describe() for i in items[:-1]]) + f" and {items[-1].describe()}"
+
+    def render(self) -> str:
+        if self.text is None:
+            self.text = self.render_text()
+        return self.text
+
+    def render_text(self) -> str:
+        # Description
+        lines = [StringUtils.init_caps(self.name), self.desc]
+
+        # Entrances - paths into an out of location
+        for direction, entrance in self.entrances:
             if direction in VerticalEnum.Values:
-                out_val += f"\n{StringUtils.init_caps(direction)} is a {entrance.describe()}. "
-            elif direction in CompassEnum.Values:
-                out_val += f"\nTo the {direction} is a {entrance.describe()}. "
+                lines.append(f"{StringUtils.init_caps(direction)} is a {entrance}. ")
             else:
-                raise Exception(f"Unknown location name: {direction}")
+                lines.append(f"To the {direction} is a {entrance}. ")
 
-        creatures = self.creatures.get_items()
-        if creatures:
-            out_val += f"\nInside the {self.name} you find {describe_item_list(creatures)}"
+        if self.creatures:
+            lines.append(f"Inside the {self.name} you find {self.describe_item_list(self.creatures)}")
 
         # Items within the location
-        if len(self.get_items()) > 0:
-            items = self.get_items()
-            out_val += f"\nIn the {self.name} you find {describe_item_list(items)}."
-        return out_val.strip()
-
+        if self.items:
+            lines.append(f"In the {self.name} you find {self.describe_item_list(self.items)}.")
+        return "\n".join(lines).strip()
+
+class WorldIndex(object):
+    """
+    The Locations, Entrances and creatures reachable from a Location, in a fixed order (used by GameState.snapshot)
+
+    Every exit is followed, locked, hidden or one way, visited or not, so this is every Location the player can
+    walk to from start. A Location with no way in from start (e.g. only a one way exit out to it) is left out
+    unless it is passed in others, along with whatever it leads to.
+    """
+    def __init__(self, start: Location, others: Iterable[Location] = ()):
+        self.locations: List[Location] = []
+        self.entrances: List[Entrance] = []
+        # the Location holding each entrance, and each creature (whose descriptions change with them)
+        self.entrance_locations: List[Location] = []
+        # Location is an unhashable dataclass, so track ids
+        self.location_ids = set()
+        for root in [start] + list(others):
+            if id(root) in self.location_ids:
+                continue
+            self.location_ids.add(id(root))
+            pending = [root]
+            while pending:
+                location = pending.pop()
+                self.locations.append(location)
+                for entrance in location.get_entrances():
+                    self.entrances.append(entrance)
+                    self.entrance_locations.append(location)
+                    if id(entrance.location) not in self.location_ids:
+                        self.location_ids.add(id(entrance.location))
+                        pending.append(entrance.location)
+        self.creatures: List[LivingThing] = [c for l in self.locations for c in l.creatures.get_items()]
+        self.creature_locations: List[Location] = [l for l in self.locations for _ in l.creatures.get_items()]
+        # id -> position in the lists above, stable names for the parts of a state hash
+        self.location_ix = {id(l): i for i, l in enumerate(self.locations)}
+        self.entrance_ix = {id(e): i for i, e in enumerate(self.entrances)}
+        self.creature_ix = {id(c): i for i, c in enumerate(self.creatures)}
+        # parts changed since indexing, and their values before the first change (see GameState.snapshot);
+        # keys are ("location", i), ("entrance", i), ("creature", i) with i a position in the lists above
+        self.touched = set()
+        self.original = {}
+        # positions of the visited locations, kept apart as every move can visit one
+        self.visited = set(i for i, l in enumerate(self.locations) if l.visited)
+        # exits as adjacency arrays, built on first use (see GameState.world_graph)
+        self.graph = None
+        # part of a state -> its Zobrist key, cached for the world's games (see StateHash.zobrist_key)
+        self.hash_keys: Dict[tuple, int] = {}
+
+    def __contains__(self, location: Location) -> bool:
+        return id(location) in self.location_ids
+
+if __name__ == "__main__":
+
+    import time
+
+    # benchmark: ItemHandler with 100k items, by distinct names and all in one stack
+    n = 100000
+    for label, names in (("distinct names", [f"item {i}" for i in range(n)]), ("one stack", ["potion"] * n)):
+        items = [Item(name=name) for name in names]
+        handler = ItemHandler()
+        start = time.perf_counter()
+        for item in items:
+            handler.add_item(item)
+        add_secs = time.perf_counter() - start
+
+        probes = names[::100]
+        start = time.perf_counter()
+        for name in probes:
+            handler.get_item(name)
+        get_secs = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for name in probes:
+            handler.remove_item(name)
+        remove_secs = time.perf_counter() - start
+        print(f"{label:>14}: add {add_secs / n * 1e6:.2f} us, get_item {get_secs / len(probes) * 1e6:.2f} us, "
+              f"remove_item {remove_secs / len(probes) * 1e6:.2f} us")
@@ -30,3 +30,10 @@ class VerticalEnum(object, metaclass=Singleton):
 
 add_meta_data(CompassEnum)
 add_meta_data(VerticalEnum)
+
+# direction -> the direction of the way back
+Opposite = {
+    CompassEnum.North: CompassEnum.South, CompassEnum.South: CompassEnum.North,
+    CompassEnum.East: CompassEnum.West, CompassEnum.West: CompassEnum.East,
+    VerticalEnum.Above: VerticalEnum.Below, VerticalEnum.Below: VerticalEnum.Above,
+}
@@ -0,0 +1,194 @@
+import traceback
+from multiprocessing import Pipe, Process
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from entities import Location
+from game_world import generate_world
+from output import render_events
+from parser import GrammarLayer, Parser
+from sessions import Session
+
+class TextEnv(object):
+    """
+    Gym style environment over one world, mirroring Jericho's FrotzEnv: reset() -> (observation, info) and
+    step(command) -> (observation, reward, done, info).
+
+    The game has no score, so the score is the number of distinct locations visited and the reward is its change.
+    """
+    def __init__(self, world_fn: Callable[[], Location] = generate_world, parser: GrammarLayer = None,
+                 max_turns: int = 1000, render: bool = True):
+        """
+        :param world_fn:    builds a new world on each reset, returning the starting Location
+        :param parser:      layer the world's rules are added to (share one between envs to share its parse cache)
+        :param max_turns:   episode length cap
+        :param render:      observations as text; if False they are the raw output events (see output.py)
+        """
+        self.world_fn = world_fn
+        self.parser = parser if parser is not None else Parser().new_layer()
+        self.max_turns = max_turns
+        self.render = render
+        self.session: Session = None
+
+    def observe(self, events):
+        return "\n".join(render_events(events)) if self.render else events
+
+    def score(self) -> int:
+        return len(set(self.session.gs.visited))
+
+    def info(self) -> Dict[str, Any]:
+        return {"moves": self.session.turns, "score": self.score(), "seed": self.session.seed}
+
+    def reset(self, seed: int = None) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Starts a new episode in a fresh world
+
+        :param seed: seeds the episode's dice, a random seed if None (see info()["seed"])
+        """
+        with self.parser:
+            start_location = self.world_fn()
+        self.session = Session(None, self.parser, start_location, max_turns=self.max_turns, seed=seed)
+        return self.observe(self.session.gs.flush()), self.info()
+
+    def get_valid_actions(self) -> List[str]:
+        """
+        Commands that would have an effect in the current state (see GameState.valid_actions)
+        """
+        return self.session.gs.valid_actions(self.parser)
+
+    def step(self, command: str) -> Tuple[Any, float, bool, Dict[str, Any]]:
+        assert self.session is not None, "Call reset before step"
+        score = self.score()
+        events = self.session.handle_events(command)
+        info = self.info()
+        return self.observe(events), float(info["score"] - score), self.session.is_over, info
+
+class VectorEnv(object):
+    """
+    Steps N independent TextEnvs per call, in this process or split across worker processes.
+    Envs whose episode ends are reset straight away: step returns the new episode's first observation, and the
+    final observation of the finished one in info["final_observation"].
+    """
+    def __init__(self, num_envs: int, processes: int = 0, **env_kwargs):
+        """
+        :param num_envs:    number of worlds
+        :param processes:   worker processes to split the envs over, 0 steps them all in this process
+        :param env_kwargs:  passed to each TextEnv (must pickle when processes > 0)
+        """
+        self.num_envs = num_envs
+        self.processes = min(processes, num_envs)
+        # set by close, after which reset and step raise
+        self.closed = False
+        if self.processes == 0:
+            if "parser" not in env_kwargs:
+                env_kwargs["parser"] = Parser().new_layer()
+            self.envs = [TextEnv(**env_kwargs) for _ in range(num_envs)]
+        else:
+            # contiguous slices of the envs, one per worker
+            bounds = np.linspace(0, num_envs, self.processes + 1).astype(int)
+            self.slices = list(zip(bounds[:-1], bounds[1:]))
+            self.conns, self.workers = [], []
+            for lo, hi in self.slices:
+                conn, worker_conn = Pipe()
+                worker = Process(target=vector_worker, args=(worker_conn, hi - lo, env_kwargs), daemon=True)
+                worker.start()
+                worker_conn.close()
+                self.conns.append(conn)
+                self.workers.append(worker)
+
+    def reset(self, seeds: List[int] = None) -> Tuple[List[Any], List[Dict[str, Any]]]:
+        self.__check_open()
+        if seeds is None:
+            seeds = [None] * self.num_envs
+        assert len(seeds) == self.num_envs, f"Expected {self.num_envs} seeds, got {len(seeds)}"
+        if self.processes == 0:
+            results = [env.reset(seed) for env, seed in zip(self.envs, seeds)]
+        else:
+            results = self.__call_workers("reset", seeds)
+        observations, infos = zip(*results)
+        return list(observations), list(infos)
+
+    def step(self, commands: List[str]) -> Tuple[List[Any], List[float], List[bool], List[Dict[str, Any]]]:
+        self.__check_open()
+        assert len(commands) == self.num_envs, f"Expected {self.num_envs} commands, got {len(commands)}"
+        if self.processes == 0:
+            results = step_envs(self.envs, commands)
+        else:
+            results = self.__call_workers("step", commands)
+        observations, rewards, dones, infos = zip(*results)
+        return list(observations), list(rewards), list(dones), list(infos)
+
+    def __check_open(self):
+        if self.closed:
+            raise Exception("VectorEnv is closed, create a new one to keep stepping")
+
+    def __call_workers(self, method: str, args: List[Any]) -> List[Any]:
+        """
+        Sends each worker its slice of args, and re-raises the first exception a worker hit. Every worker is
+        answered first, so the VectorEnv can still be closed (its envs may be part way through the call).
+        """
+        for conn, (lo, hi) in zip(self.conns, self.slices):
+            conn.send((method, args[lo:hi]))
+        results, errors = [], []
+        for conn in self.conns:
+            ok, payload = conn.recv()
+            if ok:
+                results.extend(payload)
+            else:
+                errors.append(payload)
+        if errors:
+            error, worker_traceback = errors[0]
+            raise error from Exception(f"VectorEnv worker traceback:\n{worker_traceback}")
+        return results
+
+    def close(self):
+        if self.closed:
+            return
+        if self.processes > 0:
+            for conn in self.conns:
+                conn.send(("close", None))
+            for worker in self.workers:
+                worker.join()
+        self.envs = []
+        self.closed = True
+
+def step_envs(envs: List[TextEnv], commands: List[str]) -> List[Tuple[Any, float, bool, Dict[str, Any]]]:
+    results = []
+    for env, command in zip(envs, commands):
+        observation, reward, done, info = env.step(command)
+        if done:
+            info["final_observation"] = observation
+            observation, _ = env.reset()
+        results.append((observation, reward, done, info))
+    return results
+
+def vector_worker(conn, num_envs: int, env_kwargs: Dict[str, Any]):
+    """
+    Worker process loop for VectorEnv: owns num_envs envs and answers reset / step / close messages with
+    (True, results), or (False, (exception, traceback)) when handling one raised
+    """
+    env_kwargs = dict(env_kwargs)
+    if "parser" not in env_kwargs:
+        env_kwargs["parser"] = Parser().new_layer()
+    envs = [TextEnv(**env_kwargs) for _ in range(num_envs)]
+    while True:
+        method, args = conn.recv()
+        if method == "close":
+            conn.close()
+            return
+        try:
+            if method == "reset":
+                results = [env.reset(seed) for env, seed in zip(envs, args)]
+            elif method == "step":
+                results = step_envs(envs, args)
+            else:
+                raise Exception(f"Unknown VectorEnv method: {method}")
+        except Exception as e:
+            try:
+                conn.send((False, (e, traceback.format_exc())))
+            except Exception:
+                # the exception does not pickle
+                conn.send((False, (Exception(repr(e)), traceback.format_exc())))
+            continue
+        conn.send((True, results))
@@ -1,55 +1,87 @@
 # # Utils
+import argparse
+from collections import deque
+
 from game_state import GameState
 from game_world import generate_world
 from parser import Parser
+from tw_loader import load_textworld
 from utils import Singleton
+from world_store import PagedWorld, WorldStore
 
-input_list = []
+# scripted input, popped from the front (a deque, so long scripts stay linear)
+input_list = deque()
 def pop_from_list(s):
-    global input_list
     if input_list:
-        item = input_list[0]
-        input_list = input_list[1:]
+        item = input_list.popleft()
         print(f">>> {item}")
         return item
     return "quit"
 
 class Game(object, metaclass=Singleton):
             
-    def __init__(self):
+    def __init__(self, parser=None, seed=None, pager=None, spelling=False):
         self.play = True
         self.loop_num = 0
-        self.gs = GameState()
-        self.parser = Parser()
+        self.gs = GameState(seed=seed, pager=pager)
+        # the world's GrammarLayer when it has one, else the base Parser
+        self.parser = parser if parser is not None else Parser()
+        # typo correction, e.g. "atack trol" => "attack troll"
+        if spelling:
+            self.parser.enable_spelling()
         
     def run(self, init_location):        
         self.gs.update_location(init_location)
+        if self.gs.pager is None:
+            # adds the rooms to the grammar, for "go to <room>"
+            self.gs.index_world(parser=self.parser)
         while self.gs.play:            
             self.loop()
             self.loop_num += 1
             if self.loop_num >= 1000:
                 self.gs.end_game()
+        self.gs.flush()
         
     def get_user_input(self, prompt):
         # self.gs.print_output(prompt + "\n")
         return input(prompt)
 
     def loop(self):
+        # output is written once per turn, before waiting for the next command
+        self.gs.flush()
         user_input = self.get_user_input("\nWhat do you want to do?\n")
         self.gs.print_output(f">>> {user_input}")
 
-        parse_results = self.parser.parse(user_input)
-        if parse_results.is_valid:
-            fn = getattr(self.gs, parse_results.method)
-            fn(parse_results.args)
-        else:
-            self.gs.bad_input()
+        self.gs.run_command(self.parser.parse(user_input))
 
 if __name__ == "__main__":
 
-    game = Game()
-    start_room = generate_world()
-    game.run(start_room)
+    arg_parser = argparse.ArgumentParser(description="Play the game")
+    arg_parser.add_argument("--seed", type=int, default=None, help="seeds the dice, to replay a game")
+    arg_parser.add_argument("--world", default=None, help="a world_store file to play (and save to), loaded as you go")
+    arg_parser.add_argument("--tw", default=None, help="a TextWorld game (JSON) to play, e.g. tw_games/custom_game.json")
+    arg_parser.add_argument("--spelling", action="store_true", help="correct typos in commands")
+    args = arg_parser.parse_args()
+
+    layer = Parser().new_layer()
+    if args.world:
+        pages = PagedWorld(WorldStore(args.world), parser=layer)
+        game = Game(parser=layer, seed=args.seed, pager=pages, spelling=args.spelling)
+        game.run(pages.start())
+        pages.save()
+    elif args.tw:
+        with layer:
+            tw_game = load_textworld(args.tw)
+        game = Game(parser=layer, seed=args.seed, spelling=args.spelling)
+        for item in tw_game.inventory:
+            game.gs.inventory.add_item(item)
+        game.gs.print_output(tw_game.objective)
+        game.run(tw_game.start)
+    else:
+        with layer:
+            start_room = generate_world()
+        game = Game(parser=layer, seed=args.seed, spelling=args.spelling)
+        game.run(start_room)
 
 
 
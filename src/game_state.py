@@ -1,10 +1,26 @@
-from actions import SpecialCommands, Actions, ItemActions
-from entities import ItemHandler, Player, Location
-from utils import Singleton
+from dataclasses import fields
+from typing import Iterable
 
-class GameState(SpecialCommands, Actions, ItemActions, metaclass=Singleton):
+from actions import SpecialCommands, Actions, ItemActions, ValidActions
+from entities import Hands, ItemHandler, Player, Location, WorldIndex
+from output import OutputSink, TextSink
+from rng import BlockRandom
+from state_hash import StateHash
+from world_graph import WorldGraph
 
-    def __init__(self):
+# the Player fields a snapshot records, its modifiers are recorded separately
+PlayerFields = tuple(f.name for f in fields(Player) if f.name != "modifiers")
+
+class GameState(SpecialCommands, Actions, ItemActions, ValidActions, StateHash):
+
+    def __init__(self, sink: OutputSink = None, seed: int = None, pager=None):
+        """
+        :param sink:    receives the output events, flushed once per turn (the console by default)
+        :param seed:    seeds the game's dice (see self.rng.seed), a random seed if None
+        :param pager:   a world_store.PagedWorld the locations come from, told as the player moves
+        """
+        self.sink = sink if sink is not None else TextSink()
+        self.rng = BlockRandom(seed)
         self.player = Player()
         self.location = None
         self.visited = []
@@ -12,27 +28,239 @@ class GameState(SpecialCommands, Actions, ItemActions, metaclass=Singleton):
         # needed for ItemHandler
         # represents the inventory
         self.inventory = ItemHandler()
-        self.hands = ItemHandler()
+        # held items count towards the player's stats
+        self.hands = Hands(self.player)
+        # commands run, timed modifiers expire by it
+        self.turn = 0
+        # items consumed, numbers the modifier sources of their effects
+        self.consumed = 0
+        # built on the first snapshot or use of state_hash
+        self.world: WorldIndex = None
+        self.pager = pager
+        # Zobrist hash, maintained once state_hash is first used
+        self.hash_value: int = None
+        # state fingerprint -> valid actions, built on first use
+        self.valid_actions_cache = None
 
-    def update_location(self, location: Location):
+    def update_location(self, location: Location, describe: bool = True):
+        """
+        :param describe: False when passing through, e.g. on the way somewhere with travel
+        """
+        if self.pager is not None:
+            # loads the rooms around it
+            self.pager.enter(location)
+        old_part = self.location_part(self.location)
+        if self.world is not None and location in self.world:
+            # describe marks it visited
+            self.world.visited.add(self.world.location_ix[id(location)])
         self.location = location
         self.visited.append(self.location.name)
-        self.describe()
+        if describe:
+            self.describe()
+        else:
+            location.visited = True
+
+        if self.world is not None:
+            if location in self.world:
+                self.replace_part(old_part, self.location_part(location))
+            else:
+                # a different world, indexed (and hashed) from scratch
+                self.world_index()
+
+    def world_index(self) -> WorldIndex:
+        """
+        Indexes the world on first use, attaching to its item holders to track changes (see snapshot).
+        A location outside the index starts a new one, if it is in a different world.
+        """
+        if self.world is None:
+            self.index_world()
+        elif self.location not in self.world:
+            world = WorldIndex(self.location)
+            if any(location in self.world for location in world.locations):
+                # re-indexing would renumber the parts of the hash and of every snapshot
+                raise Exception(f"{self.location.name} has no way in from where the world was indexed, "
+                                f"index_world with all of its Locations before playing")
+            self.index_world(world=world)
+        return self.world
+
+    def index_world(self, others: Iterable[Location] = (), world: WorldIndex = None, parser=None):
+        """
+        Indexes the world from the current location, and from others: Locations with no way in from it (see
+        WorldIndex), e.g. every room a generator made. Call before the first snapshot, as existing ones are
+        numbered by the old index.
+
+        :param parser:  the world's GrammarLayer (or Parser), the location names are added to it as <Room>s so
+                        "go to <room>" parses
+        """
+        if self.pager is not None:
+            raise Exception("A paged world is never all in memory, so it can't be indexed")
+        self.world = world if world is not None else WorldIndex(self.location, others)
+        if parser is not None:
+            for location in self.world.locations:
+                for left, right in Location.grammar_rules(location.name):
+                    parser.try_add_new_rule(left=left, right=right)
+        for i, location in enumerate(self.world.locations):
+            location.observer, location.holder_id = self, ("location", i)
+            location.creatures.observer, location.creatures.holder_id = self, ("creatures", i)
+        self.inventory.observer, self.inventory.holder_id = self, ("inventory",)
+        self.hands.observer, self.hands.holder_id = self, ("hands",)
+        if self.hash_value is not None:
+            # parts are named by position in the index, so rehash
+            self.hash_value = self.compute_hash()
+        return self.world
+
+    def world_graph(self) -> WorldGraph:
+        """
+        The world's exits as a graph, for route finding (built on first use, kept in step with the locks)
+        """
+        world = self.world_index()
+        if world.graph is None:
+            world.graph = WorldGraph(world)
+        return world.graph
+
+    def lock_changed(self, entrance):
+        ix = self.world.entrance_ix.get(id(entrance)) if self.world is not None else None
+        if ix is not None and self.world.graph is not None:
+            self.world.graph.set_locked(ix, entrance.is_locked)
+
+    def item_moving(self, holder_id: tuple, item, position: int):
+        """
+        Called by an ItemHandler of the world just before it adds or removes item, at position in its stack
+        """
+        if holder_id[0] in ("location", "creatures"):
+            self.touch(("location", holder_id[1]))
+        self.item_moved(holder_id, item, position)
+
+    def touch(self, key: tuple):
+        # call before changing the part, the first time records its original value
+        world = self.world
+        if key not in world.touched:
+            world.touched.add(key)
+            if key not in world.original:
+                world.original[key] = self.capture(key)
+
+    def touch_entrance(self, entrance):
+        ix = self.world.entrance_ix.get(id(entrance)) if self.world is not None else None
+        if ix is not None:
+            self.touch(("entrance", ix))
+
+    def touch_creature(self, creature):
+        ix = self.world.creature_ix.get(id(creature)) if self.world is not None else None
+        if ix is not None:
+            self.touch(("creature", ix))
+
+    def capture(self, key: tuple):
+        kind, i = key
+        if kind == "location":
+            location = self.world.locations[i]
+            return tuple(location.items), tuple(location.creatures.items)
+        if kind == "entrance":
+            return self.world.entrances[i].is_locked
+        creature = self.world.creatures[i]
+        return creature.hp, creature.is_alive
+
+    def apply(self, key: tuple, value):
+        kind, i = key
+        if kind == "location":
+            location = self.world.locations[i]
+            location.items = list(value[0])
+            location.creatures.items = list(value[1])
+        elif kind == "entrance":
+            self.world.entrances[i].is_locked = value
+            self.world.entrance_locations[i].changed()
+            if self.world.graph is not None:
+                self.world.graph.set_locked(i, value)
+        else:
+            creature = self.world.creatures[i]
+            creature.hp, creature.is_alive = value
+            self.world.creature_locations[i].changed()
+
+    def snapshot(self) -> tuple:
+        """
+        Records only the mutable parts of the game: player, location, inventory and hands, which locations were
+        visited, the dice, plus the locations, locks and creatures changed since the world was indexed. The world's structure
+        is shared, not copied, so the cost grows with what the game has changed rather than with the size of the world.
+        A snapshot can be restored any number of times.
+        """
+        world = self.world_index()
+        return (
+            world, self.location, tuple(self.visited), self.play, self.turn, self.consumed,
+            tuple([getattr(self.player, name) for name in PlayerFields]), self.player.modifiers.getstate(),
+            tuple(self.inventory.items), tuple(self.hands.items), frozenset(world.visited),
+            tuple([(key, self.capture(key)) for key in world.touched]),
+            self.hash_value, self.rng.getstate(),
+        )
+
+    def restore(self, snapshot: tuple):
+        """
+        Puts the game back to the state recorded by snapshot()
+        """
+        (world, location, visited, play, turn, consumed, player, modifiers, inventory, hands, visited_ix, changed,
+            hash_value, rng) = snapshot
+        self.world = world
+        self.location = location
+        self.visited = list(visited)
+        self.play = play
+        self.turn = turn
+        self.consumed = consumed
+        for name, value in zip(PlayerFields, player):
+            setattr(self.player, name, value)
+        self.player.modifiers.setstate(modifiers)
+        self.inventory.items = list(inventory)
+        self.hands.items = list(hands)
+        self.rng.setstate(rng)
+
+        for i in world.visited ^ visited_ix:
+            world.locations[i].visited = i in visited_ix
+        world.visited = set(visited_ix)
+
+        # parts changed now but not when the snapshot was taken go back to their original values
+        touched = world.touched
+        world.touched = set(key for key, _ in changed)
+        for key, value in changed:
+            self.apply(key, value)
+        for key in touched - world.touched:
+            self.apply(key, world.original[key])
+
+        if hash_value is not None:
+            self.hash_value = hash_value
+        elif self.hash_value is not None:
+            # snapshot taken before hashing started
+            self.hash_value = self.compute_hash()
 
     def print_output(self, s):
-        print(s)
+        self.sink.emit("text", s)
+
+    def emit(self, kind, payload):
+        self.sink.emit(kind, payload)
+
+    def flush(self):
+        return self.sink.flush()
+
+    def run_command(self, parse_results):
+        if parse_results.is_valid:
+            fn = getattr(self, parse_results.method)
+            fn(parse_results.args)
+        else:
+            self.bad_input()
+        self.end_turn()
+
+    def end_turn(self):
+        modifiers = self.player.modifiers
+        if modifiers.expiry:
+            # turns remaining are part of the state
+            player_part = self.player_part()
+            self.turn += 1
+            modifiers.tick(self.turn)
+            self.replace_part(player_part, self.player_part())
+        else:
+            self.turn += 1
 
     def bad_input(self):
         self.print_output("User input not recognized")
 
     def get_attack_points(self):
-        atk = self.player.attack
-        for item in self.hands.get_items():
-            atk += item.attack
-        return atk
+        return self.player.stat("attack")
 
     def get_defense_points(self):
-        defense = self.player.defense
-        for item in self.hands.get_items():
-            defense += item.defense
-        return defense
\ No newline at end of file
+        return self.player.stat("defense")
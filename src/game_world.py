@@ -3,8 +3,14 @@
 #     attack: int     = 25
 #     defense: int    = 5
 
+import random
+
 from entities import LivingThing, Item, Location, Entrance
-from game_state import GameState
+
+# module level (rather than inside generate_world) so a stored world can refer to it, see world_store
+def on_consume(self, gs):
+    gs.player.hp = min(gs.player.stat("max_hp"), gs.player.hp + self.hp)
+    gs.print_output(f"Consumed {self.name}. Heath is now: {gs.player.hp}.")
 
 def generate_world():
     dragon = LivingThing(name="dragon", hp=20, attack=35, defense=5, attack_verb="slash")
@@ -12,11 +18,6 @@ def generate_world():
     rat = LivingThing(name="rat", hp=5, attack=12, defense=1, attack_verb="bite")
     snake = LivingThing(name="snake", hp=10, attack=12, defense=1, attack_verb="bite")
 
-    def on_consume(self):
-        gs = GameState()
-        gs.player.hp = min(gs.player.max_hp, gs.player.hp + self.hp)
-        gs.print_output(f"Consumed {self.name}. Heath is now: {gs.player.hp}.")
-
     health_potion = Item(name="potion", hp=50, consume_fn=on_consume)
 
     sword = Item(name="sword", attack=10)
@@ -59,3 +60,39 @@ You are in a room filled with treasure. Gold coins cover the floor, rubies and p
     intro.add_east(Entrance(locn_east, is_locked=True, key_name=gold_key.name, name="wooden door"))
 
     return intro
+
+def generate_grid_world(width=40, height=50, num_locked=6, num_items=4, num_creatures=10, seed=0):
+    """
+    A width x height grid of rooms joined north-south and east-west, with some doors locked by coloured keys
+    placed at random (possibly behind their own door). For testing tools on large worlds, e.g. the Solver.
+
+    :return: the starting Location, the top left room
+    """
+    rng = random.Random(seed)
+    colours = ["red", "blue", "green", "black", "white", "silver", "copper", "iron", "brass", "stone"]
+    assert num_locked <= len(colours), f"At most {len(colours)} locked doors"
+
+    rooms = [[Location(desc=f"You are in a bare room, at {x}, {y}.", name=f"room {x} {y}")
+              for x in range(width)] for y in range(height)]
+    edges = [(x, y, "east") for y in range(height) for x in range(width - 1)] + \
+            [(x, y, "south") for y in range(height - 1) for x in range(width)]
+    locked = dict(zip(rng.sample(range(len(edges)), num_locked), colours))
+    for i, (x, y, direction) in enumerate(edges):
+        if i in locked:
+            colour = locked[i]
+            entrance = lambda location: Entrance(location, is_locked=True, key_name=f"{colour} key", name=f"{colour} door")
+            rng.choice(rng.choice(rooms)).add_item(Item(name=f"{colour} key"))
+        else:
+            entrance = lambda location: Entrance(location)
+        if direction == "east":
+            rooms[y][x].add_east(entrance(rooms[y][x + 1]))
+        else:
+            rooms[y][x].add_south(entrance(rooms[y + 1][x]))
+
+    for name in ["sword", "shield", "torch", "potion"][:num_items]:
+        rng.choice(rng.choice(rooms)).add_item(Item(name=name))
+    # one creature per room at most, fight picks creatures by name
+    for location in rng.sample([location for row in rooms for location in row], num_creatures):
+        name = rng.choice(["rat", "snake"])
+        location.add_creature(LivingThing(name=name, hp=5, attack=12, defense=1, attack_verb="bite"))
+    return rooms[0][0]
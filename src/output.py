@@ -0,0 +1,93 @@
+import sys
+from typing import Any, Callable, Dict, List, TextIO, Tuple
+
+# (kind, payload): one piece of game output, kind says how to render the payload (see Renderers)
+Event = Tuple[str, Any]
+
+def render_text(text: str) -> str:
+    return text
+
+def render_inventory(items: tuple) -> str:
+    if len(items) == 0:
+        lines = ["Your inventory is empty."]
+    elif len(items) == 1:
+        lines = [f"Your inventory has {len(items)} item:"]
+    else:
+        lines = [f"Your inventory has {len(items)} items:"]
+    lines.extend(f"  {item.describe()}" for item in items)
+    return "\n".join(lines)
+
+def render_holding(items: tuple) -> str:
+    if not items:
+        return "You are holding nothing."
+    return "\n".join(["You are holding:"] + [f"  {item.describe()}" for item in items])
+
+def render_stats(stats: tuple) -> str:
+    hp, mp, attack, defense = stats
+    return f"Health:  {hp}\nMagic:   {mp}\nAttack:  {attack}\nDefense: {defense}"
+
+def render_location(view) -> str:
+    return view.render()
+
+# kind -> function turning an event's payload into text
+Renderers: Dict[str, Callable[[Any], str]] = {
+    "text": render_text,
+    "inventory": render_inventory,
+    "holding": render_holding,
+    "stats": render_stats,
+    "location": render_location,
+}
+
+def render(event: Event) -> str:
+    kind, payload = event
+    return Renderers[kind](payload)
+
+def render_events(events: List[Event]) -> List[str]:
+    return [render(e) for e in events]
+
+class OutputSink(object):
+    """
+    Buffers a turn's output as structured events. Nothing is rendered to text here: flush() hands the events
+    to whoever drives the game, which can render them (render_events) or use the payloads directly.
+    """
+    def __init__(self):
+        self.events: List[Event] = []
+
+    def emit(self, kind: str, payload: Any):
+        self.events.append((kind, payload))
+
+    def flush(self) -> List[Event]:
+        """
+        Called once per turn
+
+        :return: the events since the last flush
+        """
+        events = self.events
+        self.events = []
+        return events
+
+class TextSink(OutputSink):
+    """
+    Renders each turn's events and writes them with a single write (and flush) per turn
+    """
+    def __init__(self, stream: TextIO = None):
+        """
+        :param stream: where to write, sys.stdout (looked up at flush time) if None
+        """
+        super().__init__()
+        self.stream = stream
+
+    def flush(self) -> List[Event]:
+        events = super().flush()
+        if events:
+            stream = self.stream if self.stream is not None else sys.stdout
+            stream.write("\n".join(render_events(events)) + "\n")
+            stream.flush()
+        return events
+
+class NullSink(OutputSink):
+    """
+    Discards all output, for runs that only care about the game state
+    """
+    def emit(self, kind: str, payload: Any):
+        pass
@@ -1,6 +1,11 @@
+import hashlib
+import mmap
+import struct
+from array import array
 from dataclasses import dataclass
 from typing import Any, List
-from utils import Singleton, StringUtils
+from spelling import SpellingIndex
+from utils import LRUCache, Singleton, StringUtils
 
 RULES = """
 
@@ -13,6 +18,7 @@ potion                                  =><Consumable>
 # Line below is inferred when anything is added to the Itemhandle.add_item method
 # sword                                 =><PickUpAble>
 # door                                  =><Unlockable>
+# dragon room                           =><Room>
 
 dragon,troll,snake,rat                  =><Creature>
 attack,fight,hit,punch                  =><FightVerb>
@@ -23,6 +29,7 @@ pick up,pickup,take                     =>get
 hold,grab,equip,wield                   =>hold
 kill                                    =>attack
 un lock                                 =>unlock
+go to,travel to                         =>goto
 
 # actions
 move|go|head <CompassDir>               =>[move] <CompassDir>
@@ -30,6 +37,7 @@ move|go|head <VerticalUp>               =>[move] above
 <VerticalUp>                            =>[move] above
 move|go <VerticalDown>                  =>[move] below
 <VerticalDown>                          =>[move] below
+goto <Room>                             =>[travel] <Room>
 
 <FightVerb> <Creature>                  =>[fight] <Creature> <FightVerb>
 use|drink|consume <Consumable>          =>[consume] <Consumable>
@@ -57,22 +65,551 @@ drop all                                =>[drop_all]
 
 """.strip().split("\n")
 
+def rules_hash(rules: List[str]) -> bytes:
+    return hashlib.sha256("\n".join(rules).encode("utf-8")).digest()
+
 @dataclass
 class Token(object):
     token: str
     data: Any
 
-@dataclass
+@dataclass(frozen=True)
 class ParseResult(object):
+    """
+    Results are cached and shared between callers (see Grammar.parse), so they are immutable: args is a tuple
+    holding, per token after the [method] token, the word it carries or a tuple of the words its rule consumed
+    """
     is_valid: bool
     method: str = ""
     args: Any = None
 
-class Parser(object, metaclass=Singleton):
-    StopWords = set("a,an,the".split(","))
+def freeze_args(data: List[Any]) -> tuple:
+    return tuple(tuple(d) if isinstance(d, list) else d for d in data)
+
+class CompiledGrammar(object):
+    """
+    Flattened form of the Parser FST. Vocabulary is interned to integer ids, the nested dictionaries are
+    numbered into states, and transitions out of the root are held in a dense array indexed by token id.
+    Deeper transitions live in a single dict keyed by state * num_symbols + token id.
+
+    Token ids in a token array are:
+        >= 0    a vocab token
+        -1      unknown token (dropped)
+        <= -2   frozen token (-2 - id), output of a terminal rule that is never rewritten again
+
+    Rules are layered when compiled: a rule's layer is one more than the highest layer of any rule producing
+    one of its lhs tokens, so rewriting needs at most max_passes passes. Rules whose rhs contains a [method]
+    token are terminal, their output is final. Identity rules (e.g. hold => hold) are no-ops.
+    """
+    def __init__(self, fst, vocab):
+        self.id2tok = sorted(vocab)
+        self.tok2id = dict((tok, i) for i, tok in enumerate(self.id2tok))
+        self.num_symbols = len(self.id2tok)
+        # token id -> method name, for tokens of the form [method]
+        self.methods = dict((i, tok[1:-1]) for i, tok in enumerate(self.id2tok) if tok.startswith("["))
+
+        self.root = array("i", [-1] * self.num_symbols)
+        self.transitions = dict()
+        # per state: rhs token ids (or None), whether the state has no children,
+        # whether the rule is terminal and whether it rewrites the tokens to themselves
+        self.emit = [None]
+        self.is_leaf = [not fst]
+        self.is_terminal = [False]
+        self.is_identity = [False]
+
+        rules = []
+        stack = [(0, fst, ())]
+        while stack:
+            state, dct, path = stack.pop()
+            for tok, (rhs, children) in dct.items():
+                next_state = len(self.emit)
+                tok_id = self.tok2id[tok]
+                lhs_ids = path + (tok_id,)
+                rhs_ids = tuple(self.tok2id[t] for t in rhs) if rhs else None
+                self.emit.append(rhs_ids)
+                self.is_leaf.append(not children)
+                self.is_terminal.append(bool(rhs_ids) and any(i in self.methods for i in rhs_ids))
+                self.is_identity.append(rhs_ids == lhs_ids)
+                if rhs_ids:
+                    rules.append((lhs_ids, rhs_ids, next_state))
+                if state == 0:
+                    self.root[tok_id] = next_state
+                else:
+                    self.transitions[state * self.num_symbols + tok_id] = next_state
+                stack.append((next_state, children, lhs_ids))
+
+        self.layers = self.__layer_rules(rules)
+        self.max_passes = max(self.layers.values(), default=0) + 1
+        self._consumers = None
+        self.rules = self.__rule_table()
+
+    def __rule_table(self):
+        # per state (rhs ids, rhs id set, is terminal, is identity), one lookup per match in rewrite
+        return [(rhs_ids, frozenset(rhs_ids) if rhs_ids else None, terminal, identity)
+                for rhs_ids, terminal, identity in zip(self.emit, self.is_terminal, self.is_identity)]
+
+    def __layer_rules(self, rules):
+        """
+        Assigns each rule (by emitting state) a layer, raising an Exception if the rules are cyclic
+
+        :param rules:   list of (lhs ids, rhs ids, state)
+        :return:        dict of state -> layer
+        """
+        # only non terminal, non identity rules produce tokens that can be rewritten again
+        producers = dict()
+        for lhs_ids, rhs_ids, state in rules:
+            if self.is_terminal[state] or self.is_identity[state]:
+                continue
+            for tok_id in rhs_ids:
+                producers.setdefault(tok_id, []).append(state)
+
+        rule_by_state = dict((state, (lhs_ids, rhs_ids)) for lhs_ids, rhs_ids, state in rules)
+        layers = dict()
+        visiting = set()
+
+        def layer(state):
+            if state in layers:
+                return layers[state]
+            if state in visiting:
+                lhs_ids, rhs_ids = rule_by_state[state]
+                raise Exception("Cyclic rules: " + " ".join(self.id2tok[i] for i in lhs_ids)
+                                + " => " + " ".join(self.id2tok[i] for i in rhs_ids))
+            visiting.add(state)
+            lhs_ids = rule_by_state[state][0]
+            deps = [layer(p) for tok_id in set(lhs_ids) for p in producers.get(tok_id, [])]
+            visiting.discard(state)
+            layers[state] = 1 + max(deps, default=0)
+            return layers[state]
+
+        for _, _, state in rules:
+            layer(state)
+        return layers
+
+    # Snapshot layout: header, then vocab and int arrays, each section padded to 8 bytes
+    SnapshotMagic = b"PCGG"
+    SnapshotFormat = 1
+    SnapshotHeader = struct.Struct("<4sI32sIIIIII")
+
+    def save(self, path: str, source_hash: bytes):
+        """
+        Writes the compiled tables to a binary snapshot
+
+        :param path:        file to write
+        :param source_hash: hash of the rule source the grammar was built from (see rules_hash)
+        """
+        num_states = len(self.emit)
+        vocab = "\n".join(self.id2tok).encode("utf-8")
+        keys = sorted(self.transitions)
+        trans_keys = array("q", keys)
+        trans_vals = array("i", [self.transitions[k] for k in keys])
+        emit_offsets, emit_ids = array("i", [0]), array("i")
+        for rhs_ids in self.emit:
+            emit_ids.extend(rhs_ids or ())
+            emit_offsets.append(len(emit_ids))
+        flags = array("b", [self.is_leaf[s] | (self.is_terminal[s] << 1) | (self.is_identity[s] << 2)
+                            for s in range(num_states)])
+        layers = array("i", [self.layers.get(s, 0) for s in range(num_states)])
+
+        header = self.SnapshotHeader.pack(self.SnapshotMagic, self.SnapshotFormat, source_hash,
+                                          self.num_symbols, num_states, len(keys), len(emit_ids),
+                                          len(vocab), self.max_passes)
+        with open(path, "wb") as f:
+            for section in (header, vocab, self.root.tobytes(), trans_keys.tobytes(), trans_vals.tobytes(),
+                            emit_offsets.tobytes(), emit_ids.tobytes(), flags.tobytes(), layers.tobytes()):
+                f.write(section)
+                f.write(b"\0" * (-len(section) % 8))
+
+    @classmethod
+    def load(cls, path: str, source_hash: bytes):
+        """
+        Loads a snapshot written by save via a read only memory map
+
+        :param path:        snapshot file
+        :param source_hash: expected hash of the rule source
+        :return:            CompiledGrammar, or None when the file is missing, stale or not a snapshot
+        """
+        try:
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        view = memoryview(buffer)
+        header_size = cls.SnapshotHeader.size
+        if len(view) < header_size:
+            return None
+        magic, fmt, file_hash, num_symbols, num_states, num_trans, num_emit, vocab_len, max_passes = \
+            cls.SnapshotHeader.unpack(view[:header_size])
+        if magic != cls.SnapshotMagic or fmt != cls.SnapshotFormat or file_hash != source_hash:
+            return None
+
+        offset = header_size + (-header_size % 8)
+        def section(length, fmt=None, item_size=1):
+            nonlocal offset
+            size = length * item_size
+            sect = view[offset:offset + size]
+            offset += size + (-size % 8)
+            return sect.cast(fmt) if fmt else sect
+
+        self = cls.__new__(cls)
+        vocab = bytes(section(vocab_len)).decode("utf-8")
+        self.id2tok = vocab.split("\n") if num_symbols else []
+        self.tok2id = dict((tok, i) for i, tok in enumerate(self.id2tok))
+        self.num_symbols = num_symbols
+        self.methods = dict((i, tok[1:-1]) for i, tok in enumerate(self.id2tok) if tok.startswith("["))
+
+        # root stays mapped, the rest is materialized into the structures the matcher uses
+        self.root = section(num_symbols, "i", 4)
+        self.transitions = dict(zip(section(num_trans, "q", 8), section(num_trans, "i", 4)))
+        emit_offsets, emit_ids = section(num_states + 1, "i", 4), section(num_emit, "i", 4)
+        self.emit = [tuple(emit_ids[emit_offsets[s]:emit_offsets[s + 1]]) or None for s in range(num_states)]
+        flags = section(num_states, "b")
+        self.is_leaf = [bool(f & 1) for f in flags]
+        self.is_terminal = [bool(f & 2) for f in flags]
+        self.is_identity = [bool(f & 4) for f in flags]
+        layers = section(num_states, "i", 4)
+        self.layers = dict((s, layer) for s, layer in enumerate(layers) if layer)
+        self.max_passes = max_passes
+        self._consumers = None
+        self.rules = self.__rule_table()
+        return self
+
+    def to_fst(self):
+        """
+        Rebuilds the nested dictionary form of the grammar, used by Parser once a snapshot needs new rules
+
+        :return: (fst, vocab)
+        """
+        num_states = len(self.emit)
+        dicts = [dict() for _ in range(num_states)]
+        def entry(state):
+            rhs_ids = self.emit[state]
+            rhs = [self.id2tok[i] for i in rhs_ids] if rhs_ids else None
+            return tuple([rhs, dicts[state]])
+
+        for tok_id, state in enumerate(self.root):
+            if state >= 0:
+                dicts[0][self.id2tok[tok_id]] = entry(state)
+        for key, state in self.transitions.items():
+            parent, tok_id = divmod(key, self.num_symbols)
+            dicts[parent][self.id2tok[tok_id]] = entry(state)
+        return dicts[0], set(self.id2tok)
+
+    def consumers(self):
+        """
+        Index used to layer rules added on top of this grammar (see LayeredGrammar)
+
+        :return: dict of token id -> states of the rules whose lhs contains the token
+        """
+        if self._consumers is None:
+            children = dict()
+            for tok_id, state in enumerate(self.root):
+                if state >= 0:
+                    children.setdefault(0, []).append((tok_id, state))
+            for key, state in self.transitions.items():
+                parent, tok_id = divmod(key, self.num_symbols)
+                children.setdefault(parent, []).append((tok_id, state))
+
+            consumers = dict()
+            stack = [(0, ())]
+            while stack:
+                state, path = stack.pop()
+                for tok_id, child in children.get(state, ()):
+                    lhs_ids = path + (tok_id,)
+                    if self.emit[child]:
+                        for lhs_id in set(lhs_ids):
+                            consumers.setdefault(lhs_id, []).append(child)
+                    stack.append((child, lhs_ids))
+            self._consumers = consumers
+        return self._consumers
+
+    def encode(self, tokens: List[str]) -> List[int]:
+        get = self.tok2id.get
+        return [get(t, -1) for t in tokens]
+
+    def decode(self, tok_id: int) -> int:
+        # strips the frozen marker
+        return tok_id if tok_id >= 0 else -2 - tok_id
+
+    def step(self, state: int, tok_id: int) -> int:
+        if state == 0:
+            return self.root[tok_id]
+        return self.transitions.get(state * self.num_symbols + tok_id, -1)
+
+    def rule(self, state: int):
+        """
+        :return: (rhs ids, rhs id set, is terminal, is identity) of the rule emitted at state
+        """
+        return self.rules[state]
+
+    def match(self, ids: List[int], ix: int, n: int):
+        """
+        Longest match of a rule starting at ids[ix]
+
+        :return: (state of the rule matched or -1, index after the last token walked)
+        """
+        state = self.root[ids[ix]]
+        if state < 0:
+            return -1, ix + 1
+
+        transitions, num_symbols, emit, is_leaf = self.transitions, self.num_symbols, self.emit, self.is_leaf
+        best_state = state if emit[state] else -1
+        end = ix + 1
+        while end < n and not is_leaf[state]:
+            tok_id = ids[end]
+            if tok_id < 0:
+                break
+            state = transitions.get(state * num_symbols + tok_id, -1)
+            if state < 0:
+                break
+            end += 1
+            if emit[state]:
+                best_state = state
+        return best_state, end
+
+    def rewrite(self, ids: List[int], data: List[Any]):
+        """
+        Single left to right pass over the token ids, matching the longest rule at each position
+
+        :param ids:     token ids
+        :param data:    data carried by each token (parallel to ids)
+        :return:        (new ids, new data, changed)
+        """
+        match, rules, id2tok = self.match, self.rules, self.id2tok
+        out_ids, out_data = [], []
+        append_id, append_data = out_ids.append, out_data.append
+        # mirrors the original fixed point check: stop once no rule matched, or the tokens did not change
+        rewritten = identity_matched = dropped = False
+        n = len(ids)
+        ix = 0
+        while ix < n:
+            tok_id = ids[ix]
+            if tok_id < 0:
+                if tok_id < -1:
+                    append_id(tok_id)
+                    append_data(data[ix])
+                else:
+                    dropped = True
+                ix += 1
+                continue
+
+            best_state, end = match(ids, ix, n)
+            if best_state < 0:
+                append_id(tok_id)
+                append_data(data[ix])
+                ix += 1
+                continue
+
+            best_rhs, best_set, frozen, identity = rules[best_state]
+            if identity:
+                identity_matched = True
+                out_ids.extend(ids[ix:end])
+                out_data.extend(data[ix:end])
+                ix = end
+                continue
+
+            rewritten = True
+            if end == ix + 1:
+                # single token rule, e.g. north => <CompassDir>
+                diff = [] if tok_id in best_set else [id2tok[tok_id]]
+                for rhs_id in best_rhs:
+                    append_id(-2 - rhs_id if frozen else rhs_id)
+                    append_data(data[ix] if rhs_id == tok_id else diff)
+            else:
+                diff = [id2tok[ids[i]] for i in range(ix, end) if ids[i] not in best_set]
+                # if token on both sides, carry over the data, e.g. move|go <CompassDir>  =>[move] <CompassDir>
+                carried = dict((ids[i], data[i]) for i in range(ix, end))
+                for rhs_id in best_rhs:
+                    append_id(-2 - rhs_id if frozen else rhs_id)
+                    append_data(carried.get(rhs_id, diff))
+            ix = end
+        return out_ids, out_data, rewritten or (identity_matched and dropped)
+
+    def process(self, ids: List[int], data: List[Any]):
+        """
+        Applies the rules until nothing changes, which takes at most max_passes passes
+
+        :param ids:     token ids
+        :param data:    data carried by each token (parallel to ids)
+        :return:        (token ids with frozen markers removed, data)
+        """
+        rewrite = self.rewrite
+        for _ in range(self.max_passes + 1):
+            ids, data, changed = rewrite(ids, data)
+            if not changed:
+                break
+            if not ids or max(ids) < -1:
+                # only frozen tokens left, the next pass would not change anything
+                break
+        # strips the frozen markers (see decode)
+        return [i if i >= 0 else -2 - i for i in ids], data
+
+class FallThrough(object):
+    """
+    Read only lookup over a layer's own entries, falling through to the shared base entries
+    """
+    __slots__ = ("own", "base")
+
+    def __init__(self, own: dict, base):
+        self.own = own
+        self.base = base
+
+    def __getitem__(self, key):
+        if key in self.own:
+            return self.own[key]
+        return self.base[key]
+
+    def __contains__(self, key):
+        return key in self.own or key in self.base
+
+class LayeredGrammar(CompiledGrammar):
+    """
+    Compiled form of a GrammarLayer. Only the layer's own tokens, states and transitions are stored, anything
+    else falls through to the base CompiledGrammar, which is shared and never modified.
+    New tokens are numbered after the base vocab, new states after the base states.
+    """
+    def __init__(self, base: CompiledGrammar, fst, vocab):
+        self.base = base
+        # the layer's own rules, kept for flatten
+        self.fst = fst
+        self.num_base_symbols = base.num_symbols
+        self.num_base_states = len(base.emit)
+
+        new_tokens = sorted(t for t in vocab if t not in base.tok2id)
+        self.own_tok2id = dict((tok, base.num_symbols + i) for i, tok in enumerate(new_tokens))
+        self.num_symbols = base.num_symbols + len(new_tokens)
+        self.id2tok = FallThrough(dict((i, tok) for tok, i in self.own_tok2id.items()), base.id2tok)
+        self.methods = FallThrough(dict((i, tok[1:-1]) for tok, i in self.own_tok2id.items() if tok.startswith("[")),
+                                   base.methods)
+
+        # (state << 32) | token id -> state, including new transitions out of base states
+        self.transitions = dict()
+        # state -> is leaf, for new states and for base states given new children
+        self.leaf = dict()
+        # state -> (rhs ids, rhs id set, is terminal, is identity)
+        self.own_rules = dict()
+        self.rules = FallThrough(self.own_rules, base.rules)
+        own_consumers = dict()
+
+        next_state = self.num_base_states
+        stack = [(0, fst, ())]
+        while stack:
+            state, dct, path = stack.pop()
+            for tok, (rhs, children) in dct.items():
+                tok_id = self.token_id(tok)
+                child = self.step(state, tok_id)
+                if child < 0:
+                    child = next_state
+                    next_state += 1
+                    self.transitions[(state << 32) | tok_id] = child
+                    self.leaf[state] = False
+                    self.leaf[child] = True
+                lhs_ids = path + (tok_id,)
+                if rhs:
+                    rhs_ids = tuple(self.token_id(t) for t in rhs)
+                    self.own_rules[child] = (rhs_ids, frozenset(rhs_ids), any(i in self.methods for i in rhs_ids),
+                                             rhs_ids == lhs_ids)
+                    for lhs_id in set(lhs_ids):
+                        own_consumers.setdefault(lhs_id, []).append(child)
+                stack.append((child, children, lhs_ids))
+
+        self.max_passes = base.max_passes + self.__chain_length(own_consumers)
+
+    def __chain_length(self, own_consumers):
+        """
+        Longest chain of rules starting at one of the layer's rules, raising an Exception if the rules are cyclic.
+        The base is acyclic, so any cycle has to pass through a rule of the layer.
+        """
+        base_consumers = self.base.consumers()
+        heights = dict()
+        visiting = set()
+
+        def height(state):
+            if state in heights:
+                return heights[state]
+            rhs_ids, _, terminal, identity = self.rule(state)
+            if state in visiting:
+                raise Exception("Cyclic rules: ... => " + " ".join(self.id2tok[i] for i in rhs_ids))
+            visiting.add(state)
+            longest = 0
+            if not (terminal or identity):
+                for tok_id in set(rhs_ids):
+                    for consumer in base_consumers.get(tok_id, []) + own_consumers.get(tok_id, []):
+                        longest = max(longest, height(consumer))
+            visiting.discard(state)
+            heights[state] = longest + 1
+            return heights[state]
+
+        return max((height(state) for state in self.own_rules), default=0)
+
+    def token_id(self, tok: str) -> int:
+        tok_id = self.base.tok2id.get(tok, -1)
+        if tok_id < 0:
+            tok_id = self.own_tok2id.get(tok, -1)
+        return tok_id
+
+    def encode(self, tokens: List[str]) -> List[int]:
+        return [self.token_id(t) for t in tokens]
+
+    def step(self, state: int, tok_id: int) -> int:
+        child = self.transitions.get((state << 32) | tok_id, -1)
+        if child < 0 and state < self.num_base_states and tok_id < self.num_base_symbols:
+            return self.base.step(state, tok_id)
+        return child
+
+    def match(self, ids: List[int], ix: int, n: int):
+        state = self.step(0, ids[ix])
+        if state < 0:
+            return -1, ix + 1
+
+        base = self.base
+        def has_emit(s):
+            return s in self.own_rules or (s < self.num_base_states and base.emit[s] is not None)
+        def is_leaf(s):
+            return self.leaf[s] if s in self.leaf else base.is_leaf[s]
+
+        best_state = state if has_emit(state) else -1
+        end = ix + 1
+        while end < n and not is_leaf(state):
+            tok_id = ids[end]
+            if tok_id < 0:
+                break
+            state = self.step(state, tok_id)
+            if state < 0:
+                break
+            end += 1
+            if has_emit(state):
+                best_state = state
+        return best_state, end
+
+    def flatten(self) -> CompiledGrammar:
+        """
+        The base and layer rules compiled together into one CompiledGrammar, e.g. to save as a snapshot
+        """
+        fst, vocab = self.base.to_fst()
+
+        def merge(into, own):
+            for tok, (rhs, children) in own.items():
+                if tok in into:
+                    base_rhs, base_children = into[tok]
+                    into[tok] = tuple([rhs or base_rhs, base_children])
+                    merge(base_children, children)
+                else:
+                    into[tok] = tuple([rhs, children])
 
-    def __init__(self):
-        self.build_fst(RULES)
+        merge(fst, self.fst)
+        vocab.update(self.own_tok2id)
+        return CompiledGrammar(fst, vocab)
+
+    def save(self, path: str, source_hash: bytes):
+        self.flatten().save(path, source_hash)
+
+class Grammar(object):
+    """
+    Rule building and parsing shared by the base Parser and the per world GrammarLayer.
+    Subclasses provide compiled() and _rules_changed(), plus the version / cache attributes.
+    """
+    StopWords = set("a,an,the".split(","))
 
     # handles | (or) tokens
     def generate_or_variants(self, tokens):
@@ -88,6 +625,11 @@ class Parser(object, metaclass=Singleton):
     def build_fst(self, rules):
         self.vocab = set()
         self.fst = dict()
+        self.known_rules = set()
+        self._rules_changed()
+        # the rule source, and the rules added to it since (see full_rules)
+        self.source_rules = list(rules)
+        self.added_rules = []
         for line in rules:
             line = line.strip()
             if not line or line.startswith("#"):
@@ -95,6 +637,8 @@ class Parser(object, metaclass=Singleton):
 
             left, right = line.split("=>")
             self.__add_new_rule(left, right)
+        # compile eagerly so cyclic rules are reported here rather than on the first parse
+        self.compiled()
 
     def try_add_new_rule(self, left, right):
         """
@@ -104,10 +648,20 @@ class Parser(object, metaclass=Singleton):
         :param right:   Right hand side
         :return:
         """
+        # every Item and Entrance of a world asks, and rules are never removed, so remember the answer
+        if left in self.known_rules:
+            return
         if not self.has_rule(left):
             self.__add_new_rule(left, right)
+            self.added_rules.append(f"{left} => {right}")
+        self.known_rules.add(left)
+
+    def __ensure_fst(self):
+        if self.fst is None:
+            self.fst, self.vocab = self._compiled.to_fst()
 
     def __add_new_rule(self, left, right):
+        self.__ensure_fst()
         left = left.strip().lower()
         right = right.strip().lower()
 
@@ -116,6 +670,10 @@ class Parser(object, metaclass=Singleton):
 
         rhs_phrases = [t.strip() for t in right.split(" ") if len(t.strip()) > 0]
         self.vocab.update(rhs_phrases)
+        if self.spelling is not None:
+            self.spelling.update(rhs_phrases)
+        # compiled tables are rebuilt on next use
+        self._rules_changed()
 
         for tokens in lhs_phrases:
             # remove empty tokens
@@ -127,6 +685,8 @@ class Parser(object, metaclass=Singleton):
             lst_tokens = self.generate_or_variants(raw_tokens)
             for tokens in lst_tokens:
                 self.vocab.update(tokens)
+                if self.spelling is not None:
+                    self.spelling.update(tokens)
                 # build dictionary for phrase
                 dct = self.fst
                 for tok in tokens[:-1]:
@@ -147,29 +707,216 @@ class Parser(object, metaclass=Singleton):
         return [phrase.strip().split(" ") for phrase in left.split(",") if phrase]
 
     def has_rule(self, left):
-        lhs_rules = self.__split_lhs(left)
-        for tokens in lhs_rules:
-            dct = self.fst
+        return all(self.has_phrase(tokens) for tokens in self.__split_lhs(left))
+
+    def has_phrase(self, tokens: List[str]) -> bool:
+        if self.fst is None:
+            # loaded from a snapshot, walk the compiled tables instead
+            grammar = self._compiled
+            state = 0
             for tok in tokens:
-                if tok not in dct:
+                tok_id = grammar.tok2id.get(tok, -1)
+                if tok_id < 0:
+                    return False
+                state = grammar.step(state, tok_id)
+                if state < 0:
                     return False
-                dct = dct[tok][1]
+            return True
+
+        dct = self.fst
+        for tok in tokens:
+            if tok not in dct:
+                return False
+            dct = dct[tok][1]
         return True
 
     def process_rules(self, tokens: List[Token]) -> List[Token]:
+        grammar = self.compiled()
+        ids, data = grammar.process(grammar.encode([t.token for t in tokens]), [t.data for t in tokens])
+        return [Token(token=grammar.id2tok[i], data=d) for i, d in zip(ids, data)]
+
+    def parse(self, s):
+        cleaned = StringUtils.clean(s)
+        if self.cache is None:
+            return self.parse_cleaned(cleaned)
+
+        if self.cache_version != self.version:
+            # grammar changed (e.g. Item or Entrance added a rule)
+            if len(self.cache):
+                self.cache_invalidations += 1
+            self.cache.clear()
+            self.cache_version = self.version
+
+        # cached results are shared between calls, ParseResult is immutable so callers cannot change them
+        result = self.cache.get(cleaned)
+        if result is None:
+            result = self.parse_cleaned(cleaned)
+            self.cache.put(cleaned, result)
+        return result
+
+    def parse_many(self, inputs, max_distinct: int = 100000):
+        """
+        Parse a stream of commands (e.g. a walkthrough or transcript), yielding one ParseResult per input, in order.
+        Identical inputs are only parsed once, and bypass the LRU cache bookkeeping used by parse.
+
+        :param inputs:          iterable of raw command strings
+        :param max_distinct:    distinct inputs remembered before the batch memo is reset (bounds memory)
+        :return:                generator of ParseResult
+        """
+        results = dict()
+        version = None
+        for s in inputs:
+            if version != self.version:
+                # grammar changed mid stream
+                results.clear()
+                version = self.version
+
+            cleaned = StringUtils.clean(s)
+            result = results.get(cleaned)
+            if result is None:
+                result = self.parse_cleaned(cleaned)
+                if len(results) >= max_distinct:
+                    results.clear()
+                results[cleaned] = result
+            yield result
+
+    def cache_stats(self):
+        stats = self.cache.stats() if self.cache is not None else dict()
+        stats["invalidations"] = self.cache_invalidations
+        stats["version"] = self.version
+        return stats
+
+    def enable_spelling(self, max_distance: int = 2):
+        """
+        Turns on typo correction: tokens not in the vocab are replaced by the closest vocab word, if any
+        (e.g. "atack trol" => "attack troll"). The index is kept up to date as rules are added.
+
+        :param max_distance:    largest edit distance corrected
+        """
+        self.build_spelling(max_distance)
+        self.correct_typos = True
+        if self.cache is not None:
+            self.cache.clear()
+
+    def build_spelling(self, max_distance: int = 2):
+        """
+        Builds the typo correction index over the vocab, without correcting this grammar's own parses
+        """
+        if self.spelling is None:
+            self.spelling = SpellingIndex(self.vocab if self.vocab is not None else self.compiled().id2tok,
+                                          max_distance=max_distance)
+
+    def correct_spelling(self, token: str):
+        """
+        :return: (closest vocab word or None, distance)
+        """
+        return self.spelling.lookup(token)
+
+    def parse_cleaned(self, cleaned):
+        words = [t for t in cleaned.split(" ") if t not in self.StopWords]
+        if not words:
+            return ParseResult(is_valid=False)
+
+        grammar = self.compiled()
+        ids = grammar.encode(words)
+        if self.correct_typos and -1 in ids:
+            for i, tok_id in enumerate(ids):
+                if tok_id < 0:
+                    correction, _ = self.correct_spelling(words[i])
+                    if correction is not None:
+                        words[i] = correction
+                        ids[i] = grammar.encode([correction])[0]
+
+        ids, data = grammar.process(ids, words)
+        methods = grammar.methods
+        for i, tok_id in enumerate(ids):
+            if tok_id in methods:
+                return ParseResult(is_valid=True, method=methods[tok_id], args=freeze_args(data[i + 1:]))
+
+        return ParseResult(is_valid=False)
+
+class Parser(Grammar, metaclass=Singleton):
+    """
+    The base grammar, built from RULES and shared by every world. Worlds add their own rules to a GrammarLayer
+    (see new_layer), rules added while no layer is active go into the base.
+    """
+    def __init__(self, snapshot: str = None):
+        """
+        :param snapshot: optional path of a grammar snapshot (see save_snapshot), used instead of building
+                         RULES when it is present and up to date
+        """
+        # bumped whenever a rule is added, cached parse results from older versions are discarded
+        self.version = 0
+        self.cache = LRUCache(max_size=4096)
+        self.cache_version = 0
+        self.cache_invalidations = 0
+        # layer receiving rules added through try_add_new_rule (see GrammarLayer.__enter__)
+        self.active_layer = None
+        # typo correction index and whether parse uses it, see enable_spelling
+        self.spelling = None
+        self.correct_typos = False
+        # when cleared, parse walks the fst dictionaries with the original fixed point loop instead of the compiled
+        # engine. Kept as the reference the engine is checked and benchmarked against (see __main__).
+        self.use_compiled = True
+        if not (snapshot and self.load_snapshot(snapshot)):
+            self.build_fst(RULES)
+
+    def _rules_changed(self):
+        self._compiled = None
+        self.version += 1
+
+    def try_add_new_rule(self, left, right):
+        # Item and Entrance add their rules through Parser(), route them to the world being built
+        if self.active_layer is not None:
+            self.active_layer.try_add_new_rule(left, right)
+        else:
+            super().try_add_new_rule(left, right)
+
+    def parse_cleaned(self, cleaned):
+        if self.use_compiled:
+            return super().parse_cleaned(cleaned)
+
+        tokens = [Token(data=t, token=t) for t in cleaned.split(" ")
+                  if t not in Parser.StopWords]
+
+        if not tokens:
+            return ParseResult(is_valid=False)
+
+        tokens = self.process_rules_dict(tokens)
+        for i in range(len(tokens)):
+            tok = tokens[i]
+            if tok.token.startswith("["):
+                method = tok.token[1:-1]
+                args = freeze_args([t.data for t in tokens[i + 1:]])
+                return ParseResult(is_valid=True, method=method, args=args)
+
+        return ParseResult(is_valid=False)
+
+    def process_rules_dict(self, tokens: List[Token], max_passes: int = 100) -> List[Token]:
+        """
+        The original rule loop: rewrite until the tokens stop changing. Unlike the compiled engine it re-matches
+        the output of [method] rules, so cyclic rules (e.g. up => [move] above, above => [move] above) never
+        settle, max_passes stops those with an Exception.
+        """
+        if self.fst is None:
+            # loaded from a snapshot
+            self.fst, self.vocab = self._compiled.to_fst()
+
         rule_matched = True
         def hash_tokens(toks):
             return  ",".join([t.token for t in toks])
 
         tok_hash = hash_tokens(tokens)
-        while rule_matched:
+        for _ in range(max_passes):
+            if not rule_matched:
+                return tokens
             tokens, rule_matched = self.process_rules_inner(tokens)
             new_tok_hash = hash_tokens(tokens)
             # Prevent loops - has the set of tokens changed?
             if new_tok_hash == tok_hash:
-                break
+                return tokens
             tok_hash = new_tok_hash
-        return tokens
+        raise Exception(f"Rules did not settle in {max_passes} passes: {tok_hash}")
 
     def process_rules_inner(self, tokens: List[Token]):
         output = []
@@ -208,7 +955,6 @@ class Parser(object, metaclass=Singleton):
                     matched = remainder[:num_tokens_matched]
                     diff = [t.token for t in matched if t.token not in best_rhs]
                     str2token = dict([(t.token, t) for t in matched])
-                    # print(matched, best_rhs)
                     for str_tok in best_rhs:
                         data = diff
                         if str_tok in str2token:
@@ -220,19 +966,225 @@ class Parser(object, metaclass=Singleton):
             ix += 1
         return output, rule_matched
 
-    def parse(self, s):
-        tokens = [Token(data=t, token=t) for t in StringUtils.clean(s).split(" ")
-                  if t not in Parser.StopWords]
+    def new_layer(self, cache_size: int = 256) -> 'GrammarLayer':
+        return GrammarLayer(self, cache_size=cache_size)
 
-        if not tokens:
-            return ParseResult(is_valid=False)
+    def full_rules(self) -> List[str]:
+        """
+        The rules the grammar holds: the source it was built from, then each rule added since (e.g. by a world's
+        Items built without a GrammarLayer active)
+        """
+        return self.source_rules + self.added_rules
 
-        tokens = self.process_rules(tokens)
-        for i in range(len(tokens)):
-            tok = tokens[i]
-            if tok.token.startswith("["):
-                method = tok.token[1:-1]
-                args = [t.data for t in tokens[i + 1:]]
-                return ParseResult(is_valid=True, method=method, args=args)
+    def save_snapshot(self, path: str):
+        """
+        Saves the fully built grammar (base rules plus any rules added since) to a binary snapshot.
+        The snapshot is tied to the hash of all of those rules, so one taken after a world added rules is only
+        loaded for those same rules (see load_snapshot).
+
+        :param path:    file to write
+        """
+        self.compiled().save(path, rules_hash(self.full_rules()))
+
+    def load_snapshot(self, path: str, rules: List[str] = RULES) -> bool:
+        """
+        Replaces the grammar with a snapshot written by save_snapshot, if it holds exactly the same rules.
+        Rules added afterwards (e.g. by Item or Entrance) are skipped when the snapshot already has them.
+
+        :param path:    snapshot file
+        :param rules:   rules the snapshot must hold, its full_rules() when it was saved. The default only
+                        accepts a snapshot of the pristine base grammar.
+        :return:        True if loaded, False if missing or stale (the current grammar is kept)
+        """
+        source_hash = rules_hash(rules)
+        grammar = CompiledGrammar.load(path, source_hash)
+        if grammar is None:
+            return False
+
+        self._compiled = grammar
+        # the dictionary form is only rebuilt if new rules are added
+        self.fst = None
+        self.vocab = None
+        self.known_rules = set()
+        self.source_rules = list(rules)
+        self.added_rules = []
+        self.version += 1
+        return True
+
+    def compiled(self) -> CompiledGrammar:
+        if self._compiled is None:
+            self._compiled = CompiledGrammar(self.fst, self.vocab)
+        return self._compiled
+
+class GrammarLayer(Grammar):
+    """
+    Copy on write layer of rules over the shared base Parser grammar, e.g. the <PickupAble> and <Unlockable>
+    rules added by the Items and Entrances of one world. Lookups fall through to the base, which the layer never
+    modifies, so worlds do not leak vocabulary into each other and dropping the layer frees its rules.
+
+        layer = Parser().new_layer()
+        with layer:
+            start_room = generate_world()   # rules added through Parser() go to the layer
+        layer.parse("get sword")
+    """
+    def __init__(self, base: Parser, cache_size: int = 256):
+        self.base = base
+        self.fst = dict()
+        self.vocab = set()
+        self.known_rules = set()
+        self.added_rules = []
+        self._compiled = None
+        self.layer_version = 0
+        self.cache = LRUCache(max_size=cache_size) if cache_size else None
+        self.cache_version = None
+        self.cache_invalidations = 0
+        self.previous_layers = []
+        self.spelling = None
+        self.correct_typos = False
+
+    @property
+    def version(self):
+        # changes when either the layer or the base gets new rules
+        return self.layer_version, self.base.version
+
+    def _rules_changed(self):
+        self._compiled = None
+        self.layer_version += 1
+
+    def has_phrase(self, tokens: List[str]) -> bool:
+        return self.base.has_phrase(tokens) or super().has_phrase(tokens)
+
+    def full_rules(self) -> List[str]:
+        return self.base.full_rules() + self.added_rules
+
+    def save_snapshot(self, path: str):
+        """
+        Saves the base and layer rules together as a snapshot, which Parser loads as its base grammar with
+        load_snapshot(path, rules=layer.full_rules())
+        """
+        self.compiled().save(path, rules_hash(self.full_rules()))
+
+    def enable_spelling(self, max_distance: int = 2):
+        # the base index is shared by every layer, so it is only built once. The base Parser's own parses are
+        # left uncorrected.
+        self.base.build_spelling(max_distance=max_distance)
+        super().enable_spelling(max_distance=max_distance)
+
+    def correct_spelling(self, token: str):
+        own, own_distance = self.spelling.lookup(token)
+        base, base_distance = self.base.correct_spelling(token)
+        if own is not None and (base is None or (own_distance, own) < (base_distance, base)):
+            return own, own_distance
+        return base, base_distance
+
+    def compiled(self) -> LayeredGrammar:
+        base = self.base.compiled()
+        if self._compiled is None or self._compiled.base is not base:
+            self._compiled = LayeredGrammar(base, self.fst, self.vocab)
+        return self._compiled
+
+    def __enter__(self):
+        self.previous_layers.append(self.base.active_layer)
+        self.base.active_layer = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.base.active_layer = self.previous_layers.pop()
+
+if __name__ == "__main__":
+
+    import argparse
+    import random
+    import time
+
+    # Item and Entrance add their rules to parser.Parser, which is not the Parser of this __main__ module
+    from parser import Parser, RULES
+
+    arg_parser = argparse.ArgumentParser(description="Check the compiled engine against the dict walk, and time both")
+    arg_parser.add_argument("--inputs", type=int, default=60000, help="random commands compared")
+    arg_parser.add_argument("--world", action="store_true", help="add the generate_world rules first")
+    arg_parser.add_argument("--bench", action="store_true",
+                            help="time typical commands on RULES and on RULES x100 instead of comparing")
+    args = arg_parser.parse_args()
+
+    parser = Parser()
+    parser.cache = None
+    if args.bench:
+        commands = ["go north", "get sword", "attack troll", "kill the dragon", "pick up potion", "drink potion",
+                    "hold sword", "unlock door", "look", "inventory", "go to dragon room", "drop all"]
+
+        def scale_rules(rules, copies):
+            # each rule with a lhs word is copied with numbered words, e.g. pick up => get, pick1 up1 => get
+            scaled = []
+            for line in rules:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                scaled.append(line)
+                left, right = line.split("=>")
+                if all(w.startswith("<") for w in left.replace(",", " ").split()):
+                    continue
+                for k in range(1, copies):
+                    phrases = [" ".join(w if w.startswith("<") else "|".join(f"{alt}{k}" for alt in w.split("|"))
+                                        for w in phrase.strip().split(" ")) for phrase in left.split(",")]
+                    scaled.append(",".join(phrases) + " => " + right.strip())
+            return scaled
+
+        def time_parses(num_parses=20000, repeats=5):
+            timings = dict()
+            for use_compiled in (False, True):
+                parser.use_compiled = use_compiled
+                best = float("inf")
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    for i in range(num_parses):
+                        parser.parse_cleaned(commands[i % len(commands)])
+                    best = min(best, time.perf_counter() - start)
+                timings[use_compiled] = best / num_parses * 1e6
+            return timings
+
+        for name, rules in (("RULES", RULES), ("RULES x100", scale_rules(RULES, 100))):
+            parser.build_fst(rules)
+            if args.world:
+                from game_world import generate_world
+                generate_world()
+            timings = time_parses()
+            num_rules = sum(1 for line in parser.full_rules() if line.strip() and not line.strip().startswith("#"))
+            print(f"{name:<12} {num_rules} rules, {len(parser.vocab)} vocab: "
+                  f"dict walk {timings[False]:.1f} us/parse, compiled {timings[True]:.1f} us/parse")
+        raise SystemExit(0)
+
+    if args.world:
+        from game_world import generate_world
+        generate_world()
+    words = sorted(set(w for tok in parser.compiled().id2tok if tok[0] not in "[<" for w in tok.split(" ")))
+    rng = random.Random(0)
+    inputs = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 5))) for _ in range(args.inputs)]
+
+    # The engines differ in one way: the dict walk re-matches the output of [method] rules. That shows as
+    # inputs it never settles on (up/down/above/below, which cycle back to [move] above) and as extra [fight]
+    # tokens, e.g. "fight dragon dragon" => [fight] <Creature> [fight] <Creature> <FightVerb>, passing
+    # Actions.fight an empty verb.
+    unsettled, differences = 0, []
+    dict_time = compiled_time = 0.0
+    for s in inputs:
+        parser.use_compiled = False
+        start = time.perf_counter()
+        try:
+            expected = parser.parse_cleaned(s)
+        except Exception:
+            unsettled += 1
+            continue
+        dict_time += time.perf_counter() - start
+        parser.use_compiled = True
+        start = time.perf_counter()
+        result = parser.parse_cleaned(s)
+        compiled_time += time.perf_counter() - start
+        if result != expected:
+            differences.append((s, expected, result))
 
-        return ParseResult(is_valid=False)
\ No newline at end of file
+    compared = len(inputs) - unsettled
+    print(f"{len(inputs)} inputs: {unsettled} never settle in the dict walk, {len(differences)} of {compared} differ")
+    for s, expected, result in differences:
+        print(f"  {s!r}: dict {expected.method} {expected.args}, compiled {result.method} {result.args}")
+    print(f"dict walk {dict_time / compared * 1e6:.1f} us/parse, compiled {compiled_time / compared * 1e6:.1f} us/parse")
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import time
+from multiprocessing import Pool
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
+
+from sessions import Session, SessionManager
+
+# one manager per worker process, created on first use (Parser and its caches are per process anyway)
+_manager: SessionManager = None
+
+def get_manager() -> SessionManager:
+    global _manager
+    if _manager is None:
+        _manager = SessionManager(max_sessions=1)
+    return _manager
+
+def read_script(path: str) -> Iterator[str]:
+    """
+    Streams the commands in a script file, one per line, skipping blank lines and # comments
+    """
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+def final_state(session: Session) -> Dict:
+    gs = session.gs
+    return {
+        "seed": session.seed,
+        "turns": session.turns,
+        "play": gs.play,
+        "location": gs.location.name if gs.location else None,
+        "visited": gs.visited,
+        "hp": gs.player.hp,
+        "is_alive": gs.player.is_alive,
+        "inventory": [item.name for item in gs.inventory.get_items()],
+        "hands": [item.name for item in gs.hands.get_items()],
+    }
+
+def run_script(commands: Iterable[str], transcript: TextIO = None, seed: int = None) -> Tuple[int, Dict]:
+    """
+    Plays commands against a fresh world until they run out or the game ends
+
+    :param commands:    any iterable of commands, consumed lazily
+    :param transcript:  if given, the output (with each command echoed as ">>> command") is written to it as it goes,
+                        after a "# seed: <seed>" line
+    :param seed:        seeds the game's dice, a random seed if None; the seed used is in the final state
+    :return: (number of commands run, final state)
+    """
+    manager = get_manager()
+    session_id, output = manager.create(seed=seed)
+    session = manager.get(session_id)
+    try:
+        if transcript is not None:
+            transcript.write(f"# seed: {session.seed}\n")
+            transcript.writelines(line + "\n" for line in output)
+        num_commands = 0
+        for command in commands:
+            if session.is_over:
+                break
+            output = session.handle(command)
+            num_commands += 1
+            if transcript is not None:
+                transcript.write(f">>> {command}\n")
+                transcript.writelines(line + "\n" for line in output)
+        return num_commands, final_state(session)
+    finally:
+        manager.close(session_id)
+
+def run_script_file(args: Tuple[str, str, int]) -> Tuple[str, int]:
+    """
+    Runs one script file, writing <name>.txt (transcript) and <name>.json (final state) to the output folder
+
+    :param args:    (script path, output folder, seed or None)
+    :return: (script path, number of commands run)
+    """
+    path, out_dir, seed = args
+    name = os.path.splitext(os.path.basename(path))[0]
+    with open(os.path.join(out_dir, name + ".txt"), "w") as transcript:
+        num_commands, state = run_script(read_script(path), transcript, seed=seed)
+    with open(os.path.join(out_dir, name + ".json"), "w") as f:
+        json.dump(state, f)
+    return path, num_commands
+
+def run_scripts(paths: List[str], out_dir: str, processes: int = None, chunk_size: int = 8, seed: int = None) -> Dict:
+    """
+    Runs each script against its own fresh world, spread over a process pool
+
+    :param paths:       script files
+    :param out_dir:     folder for the transcripts and final states
+    :param processes:   pool size, os.cpu_count() if None; 1 runs in this process
+    :param chunk_size:  scripts sent to a worker at a time
+    :param seed:        seeds every game's dice, so reruns are identical; random seeds (recorded) if None
+    :return: stats, including games and commands per second
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(path, out_dir, seed) for path in paths]
+    start = time.perf_counter()
+    if processes == 1:
+        results = [run_script_file(task) for task in tasks]
+    else:
+        with Pool(processes) as pool:
+            results = list(pool.imap_unordered(run_script_file, tasks, chunksize=chunk_size))
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    num_commands = sum(n for _, n in results)
+    return {
+        "games": len(results),
+        "commands": num_commands,
+        "seconds": elapsed,
+        "games_per_sec": len(results) / elapsed,
+        "commands_per_sec": num_commands / elapsed,
+    }
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Run scripted games headless")
+    arg_parser.add_argument("out_dir", help="folder for transcripts (.txt) and final states (.json)")
+    arg_parser.add_argument("scripts", nargs="+", help="script files, one command per line")
+    arg_parser.add_argument("--processes", type=int, default=None)
+    arg_parser.add_argument("--seed", type=int, default=None, help="to replay games recorded with this seed")
+    args = arg_parser.parse_args()
+
+    stats = run_scripts(args.scripts, args.out_dir, processes=args.processes, seed=args.seed)
+    print(f"{stats['games']} games, {stats['commands']} commands in {stats['seconds']:.2f}s: "
+          f"{stats['games_per_sec']:.1f} games/sec, {stats['commands_per_sec']:.0f} commands/sec")
@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, Tuple
+
+from sessions import SessionManager
+
+logger = logging.getLogger(__name__)
+
+class GameServer(object):
+    """
+    Line based TCP front end: each connection plays its own game in a SessionManager session, all on one event loop.
+    Every command gets its output back followed by a prompt line ("> ").
+
+    Backpressure: once a client stops reading and more than high_water bytes are queued for it, that client's
+    commands are not read until its buffer drains, so a slow client cannot grow the server's memory.
+    """
+    Prompt = "> "
+
+    def __init__(self, manager: SessionManager = None, idle_timeout: float = 300.0,
+                 high_water: int = 64 * 1024, max_line: int = 1024):
+        """
+        :param manager:         sessions to host (a new SessionManager by default, with its 1000 turn cap)
+        :param idle_timeout:    seconds without a command before a session is closed
+        :param high_water:      bytes queued for a client before reading from it pauses
+        :param max_line:        longest command accepted, longer lines close the connection
+        """
+        self.manager = manager if manager is not None else SessionManager()
+        self.idle_timeout = idle_timeout
+        self.high_water = high_water
+        self.max_line = max_line
+        # session id -> (writer, time of last command), checked by reap_idle rather than a timer per read
+        self.clients: Dict[str, Tuple[asyncio.StreamWriter, float]] = {}
+        # set by start, until close
+        self.server: asyncio.AbstractServer = None
+        self.reaper: asyncio.Task = None
+
+    async def send(self, writer: asyncio.StreamWriter, lines: List[str]):
+        text = "\n".join(lines)
+        writer.write((text + "\n" + self.Prompt if text else self.Prompt).encode())
+        await writer.drain()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.transport.set_write_buffer_limits(high=self.high_water)
+        try:
+            session_id, output = self.manager.create()
+        except Exception as e:
+            writer.write(f"{e}\n".encode())
+            await self.close_writer(writer)
+            return
+
+        try:
+            self.clients[session_id] = (writer, time.monotonic())
+            await self.send(writer, output)
+            while session_id in self.manager:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.clients[session_id] = (writer, time.monotonic())
+                command = line.decode(errors="replace").strip()
+                await self.send(writer, self.manager.handle(session_id, command))
+        except (ConnectionError, ValueError):
+            # client went away, or sent a line longer than max_line
+            pass
+        except Exception:
+            # a bug in a game command, only this client's game is dropped
+            logger.exception("Session %s failed", session_id)
+        finally:
+            self.clients.pop(session_id, None)
+            self.manager.close(session_id)
+            await self.close_writer(writer)
+
+    @staticmethod
+    async def close_writer(writer: asyncio.StreamWriter):
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def reap_idle(self):
+        """
+        Closes connections idle for longer than idle_timeout; their handle_client then reads EOF and cleans up
+        """
+        while True:
+            await asyncio.sleep(min(self.idle_timeout / 4, 5.0))
+            cutoff = time.monotonic() - self.idle_timeout
+            idle = [(sid, writer) for sid, (writer, last_seen) in self.clients.items() if last_seen < cutoff]
+            for session_id, writer in idle:
+                del self.clients[session_id]
+                writer.write(b"Idle timeout\n")
+                writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8023) -> asyncio.AbstractServer:
+        """
+        Starts listening, and closing idle sessions. Call close to stop both.
+        """
+        self.server = await asyncio.start_server(self.handle_client, host, port, limit=self.max_line, backlog=1024)
+        self.reaper = asyncio.create_task(self.reap_idle())
+        return self.server
+
+    async def close(self):
+        if self.reaper is not None:
+            self.reaper.cancel()
+            self.reaper = None
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8023):
+        server = await self.start(host, port)
+        try:
+            await server.serve_forever()
+        finally:
+            await self.close()
+
+async def read_reply(reader: asyncio.StreamReader, prompt: str = GameServer.Prompt) -> List[str]:
+    """
+    Reads one reply from a GameServer, up to and including its prompt line
+
+    :return: the lines output before the prompt. Raises asyncio.IncompleteReadError if the server hung up.
+    """
+    prompt = prompt.encode()
+    data = await reader.readuntil(prompt)
+    # a prompt only counts at the start of a line
+    while data != prompt and not data.endswith(b"\n" + prompt):
+        data += await reader.readuntil(prompt)
+    text = data[:-len(prompt)].decode(errors="replace")
+    return text.split("\n")[:-1] if text else []
+
+async def load_client(host: str, port: int, commands: List[str], interval: float, until: float,
+                      latencies: List[float]):
+    """
+    One simulated player: sends commands every interval seconds (with jitter) until the deadline, reconnecting
+    when its game ends, and records the time from sending each command to reading its reply
+    """
+    rng = random.Random()
+    await asyncio.sleep(rng.random() * interval)
+    while time.monotonic() < until:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            await read_reply(reader)
+            while time.monotonic() < until:
+                start = time.perf_counter()
+                writer.write((rng.choice(commands) + "\n").encode())
+                await read_reply(reader)
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(interval * (0.5 + rng.random()))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # game over, play a new one
+            pass
+        finally:
+            await GameServer.close_writer(writer)
+
+async def run_load(host: str, port: int, num_clients: int, rate: float, duration: float) -> List[float]:
+    """
+    Plays num_clients concurrent games against a running server, num_clients / rate seconds between each
+    client's commands, so the server sees about rate commands a second in total
+
+    :return: reply latencies in seconds
+    """
+    commands = ["look", "inventory", "go north", "go south", "go east", "go west", "get sword", "drop sword",
+                "hold sword", "help"]
+    latencies = []
+    until = time.monotonic() + duration
+    await asyncio.gather(*[load_client(host, port, commands, num_clients / rate, until, latencies)
+                           for _ in range(num_clients)])
+    return latencies
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Serve games over TCP")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8023)
+    arg_parser.add_argument("--max-sessions", type=int, default=10000)
+    arg_parser.add_argument("--idle-timeout", type=float, default=300.0)
+    arg_parser.add_argument("--spelling", action="store_true", help="correct typos in commands")
+    arg_parser.add_argument("--load", type=int, default=0,
+                            help="instead of serving, play this many clients against a server at host:port")
+    arg_parser.add_argument("--rate", type=float, default=600.0, help="commands a second sent by --load, in total")
+    arg_parser.add_argument("--duration", type=float, default=30.0, help="seconds --load runs for")
+    args = arg_parser.parse_args()
+
+    if args.load:
+        results = sorted(asyncio.run(run_load(args.host, args.port, args.load, args.rate, args.duration)))
+        if not results:
+            raise SystemExit("No replies")
+        def percentile(p):
+            return results[min(len(results) - 1, int(len(results) * p))] * 1000
+        print(f"{args.load} clients, {len(results) / args.duration:.0f} cmd/s: p50 {percentile(0.5):.2f} ms, "
+              f"p99 {percentile(0.99):.2f} ms, max {results[-1] * 1000:.1f} ms")
+        raise SystemExit(0)
+
+    manager = SessionManager(max_sessions=args.max_sessions, spelling=args.spelling)
+    game_server = GameServer(manager, idle_timeout=args.idle_timeout)
+    asyncio.run(game_server.serve(args.host, args.port))
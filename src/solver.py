@@ -0,0 +1,218 @@
+import argparse
+import time
+from functools import partial
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from entities import Location, WorldIndex
+from game_state import GameState
+from game_world import generate_grid_world, generate_world
+from output import NullSink
+from parser import GrammarLayer, Parser
+from state_hash import zobrist_key
+
+@dataclass
+class SolverReport(object):
+    # states expanded, and distinct states reached
+    nodes: int = 0
+    states: int = 0
+    # False if the node budget ran out, so the lists below may include things that are reachable
+    exhaustive: bool = False
+    # False for greedy searches, whose paths are valid but may not be the shortest
+    shortest: bool = True
+    seconds: float = 0.0
+    # goal ("room: <name>", "item: <name>" or "kill: <creature> in <room>", numbered when names repeat, e.g.
+    # "item: sword #2") -> shortest command sequence to it
+    paths: Dict[str, List[str]] = field(default_factory=dict)
+    unreachable_rooms: List[str] = field(default_factory=list)
+    unobtainable_items: List[str] = field(default_factory=list)
+    unkilled_creatures: List[str] = field(default_factory=list)
+
+    @property
+    def nodes_per_sec(self) -> float:
+        return self.nodes / max(self.seconds, 1e-9)
+
+class Solver(object):
+    """
+    Breadth first search over the commands GameState.valid_actions lists, from the start of a new world.
+    States are branched with snapshot / restore and deduplicated on state_hash, so each distinct state is expanded
+    once and the first path found to a goal is a shortest one. Fights are made deterministic by seeding the dice
+    from the state and command, so a fight in a given state always goes the same way.
+
+    Exhaustive search blows up on big worlds, as every set of items picked up (and every hit point total) is a
+    different state. With greedy=True the search restarts from the first state that makes progress (a new item,
+    an unlocked door or a kill) and forgets the rest. Nothing can be lost by picking up an item or unlocking a door,
+    so this finds the same rooms and items at a cost of about one search of the rooms per piece of progress, but
+    the paths are no longer the shortest and a fight taken early can leave too few hit points for a later one.
+
+    The search stops after max_nodes states are expanded, with report.exhaustive False, and then anything not reached
+    yet is reported as unreachable whether it is or not. generate_world takes 160 nodes. A 10x10 grid takes ~14k, but
+    on the 2000 room 50x40 grid the default 200k nodes (45s) run out with hundreds of rooms not reached, while greedy
+    reaches every room, item and creature in ~6k nodes (3s).
+    """
+    # never needed to reach a goal: nothing limits what can be carried
+    SkipMethods = ("drop", "drop_all")
+
+    def __init__(self, world_fn: Callable[[], Location] = generate_world, parser: GrammarLayer = None,
+                 max_nodes: int = 200000, seed: int = 0, skip_methods=SkipMethods, greedy: bool = False):
+        """
+        :param world_fn:        builds the world to solve, returning the starting Location
+        :param parser:          layer the world's rules are added to (a new layer over Parser() by default)
+        :param max_nodes:       budget of states to expand
+        :param seed:            mixed into the fight seeds, to try other rolls of the dice
+        :param skip_methods:    commands parsing to these methods are not tried
+        :param greedy:          restart the search from each state that makes progress (see above)
+        """
+        self.world_fn = world_fn
+        self.parser = parser if parser is not None else Parser().new_layer()
+        self.max_nodes = max_nodes
+        self.seed = seed
+        self.skip_methods = set(skip_methods)
+        self.greedy = greedy
+
+    def solve(self) -> SolverReport:
+        start_time = time.perf_counter()
+        with self.parser:
+            start_location = self.world_fn()
+        gs = GameState(sink=NullSink())
+        gs.update_location(start_location)
+        world = gs.world_index()
+        root = gs.snapshot()
+        all_goals = self.__goals(world)
+
+        report = SolverReport(shortest=not self.greedy)
+        goals = {}
+        self.__check_goals(gs, world, None, all_goals, goals)
+        seen = {gs.state_hash}
+        # (snapshot, path) with path a linked list of (parent path, command)
+        queue = deque([(root, None)])
+        while queue and report.nodes < self.max_nodes and len(goals) < len(all_goals):
+            snapshot, path = queue.popleft()
+            gs.restore(snapshot)
+            report.nodes += 1
+            commands = [cmd for cmd in gs.valid_actions(self.parser) if self.__worth_trying(gs, cmd)]
+            state_hash = gs.state_hash
+            for i, command in enumerate(commands):
+                if i > 0:
+                    gs.restore(snapshot)
+                parse_result = self.parser.parse(command)
+                if parse_result.method == "fight":
+                    gs.rng.reseed(state_hash ^ zobrist_key(("command", command, self.seed)))
+                gs.run_command(parse_result)
+                gs.flush()
+                if gs.state_hash in seen:
+                    continue
+                report.states += 1
+                seen.add(gs.state_hash)
+                child = (path, command)
+                progress = self.__check_goals(gs, world, child, all_goals, goals) or parse_result.method == "unlock"
+                if not gs.play:
+                    continue
+                if self.greedy and progress:
+                    seen = {gs.state_hash}
+                    queue.clear()
+                    queue.append((gs.snapshot(), child))
+                    break
+                queue.append((gs.snapshot(), child))
+
+        report.exhaustive = not queue or len(goals) == len(all_goals)
+        report.paths = {all_goals[goal]: self.__unwind(path) for goal, path in goals.items()}
+        # back to the start, to list what the world holds
+        gs.restore(root)
+        report.unreachable_rooms = [l.name for ix, l in enumerate(world.locations) if ("room", ix) not in goals]
+        report.unobtainable_items = [i.name for l in world.locations for i in l.items if ("item", id(i)) not in goals]
+        report.unkilled_creatures = [f"{c.name} in {l.name}" for l in world.locations for c in l.creatures.items
+                                     if ("kill", id(c)) not in goals]
+        report.seconds = time.perf_counter() - start_time
+        return report
+
+    def __worth_trying(self, gs: GameState, command: str) -> bool:
+        parse_result = self.parser.parse(command)
+        if parse_result.method in self.skip_methods:
+            return False
+        if parse_result.method == "hold":
+            # holding from the inventory commutes with moving, so it is only tried where there is something to fight,
+            # which prunes states without making any path longer. Taking an item straight into the hands is a pickup.
+            return any(c.is_alive for c in gs.location.creatures.items) or \
+                any(i.name == parse_result.args[0][0] for i in gs.location.items)
+        return True
+
+    @staticmethod
+    def __goals(world: WorldIndex) -> Dict[tuple, str]:
+        """
+        Goals are keyed by the room's index or the item's or creature's identity, not by name, so two swords are two
+        goals. Names can repeat, so repeated descriptions are numbered, e.g. "item: sword #2".
+
+        :return: dict of goal -> description, the key of its path in the report
+        """
+        goals = {}
+        for ix, location in enumerate(world.locations):
+            goals[("room", ix)] = f"room: {location.name}"
+            for item in location.items:
+                goals[("item", id(item))] = f"item: {item.name}"
+            for creature in location.creatures.items:
+                goals[("kill", id(creature))] = f"kill: {creature.name} in {location.name}"
+        counts = {}
+        for goal, description in goals.items():
+            counts[description] = counts.get(description, 0) + 1
+            if counts[description] > 1:
+                goals[goal] = f"{description} #{counts[description]}"
+        return goals
+
+    @staticmethod
+    def __check_goals(gs: GameState, world: WorldIndex, path, all_goals: Dict, goals: Dict) -> bool:
+        """
+        Records path against the goals the state reaches for the first time
+
+        :return: True if an item or kill goal was new
+        """
+        progress = False
+        location = gs.location
+        goal = ("room", world.location_ix[id(location)])
+        if goal not in goals:
+            goals[goal] = path
+        for item in gs.inventory.items + gs.hands.items:
+            goal = ("item", id(item))
+            if goal in all_goals and goal not in goals:
+                goals[goal] = path
+                progress = True
+        for creature in location.creatures.items:
+            if not creature.is_alive:
+                goal = ("kill", id(creature))
+                if goal not in goals:
+                    goals[goal] = path
+                    progress = True
+        return progress
+
+    @staticmethod
+    def __unwind(path) -> List[str]:
+        commands = []
+        while path is not None:
+            path, command = path
+            commands.append(command)
+        return commands[::-1]
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Search a world for unreachable rooms and items, and report the "
+                                                     "shortest paths to each goal and the node throughput")
+    arg_parser.add_argument("--grid", default=None, help="WIDTHxHEIGHT, solve generate_grid_world instead of generate_world")
+    arg_parser.add_argument("--greedy", action="store_true")
+    arg_parser.add_argument("--max_nodes", type=int, default=200000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    world_fn = generate_world
+    if args.grid:
+        width, height = map(int, args.grid.split("x"))
+        world_fn = partial(generate_grid_world, width=width, height=height)
+    report = Solver(world_fn, max_nodes=args.max_nodes, seed=args.seed, greedy=args.greedy).solve()
+    if not args.grid:
+        for goal, path in report.paths.items():
+            print(f"{goal}: {', '.join(path)}")
+    print(f"unreachable rooms: {report.unreachable_rooms}")
+    print(f"unobtainable items: {report.unobtainable_items}")
+    print(f"unkilled creatures: {report.unkilled_creatures}")
+    print(f"{report.nodes} nodes, {report.states} states in {report.seconds:.2f}s: {report.nodes_per_sec:.0f} nodes/sec"
+          f"{'' if report.exhaustive else ' (node budget ran out)'}")
@@ -0,0 +1,147 @@
+from typing import Iterable, Tuple, Union
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions), giving up once the distance
+    is known to exceed max_distance
+
+    :return: the distance, or max_distance + 1 if it is larger than max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    # common prefix and suffix do not change the distance, typos usually leave a core of a few chars
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        distance = len(a) + len(b)
+        return distance if distance <= max_distance else max_distance + 1
+
+    # only cells within max_distance of the diagonal can stay under the bound
+    too_far = max_distance + 1
+    prev_prev = None
+    prev = [j if j <= max_distance else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [too_far] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        row_min = too_far
+        for j in range(max(1, i - max_distance), min(len(b), i + max_distance) + 1):
+            d = prev[j - 1] if a[i - 1] == b[j - 1] else prev[j - 1] + 1
+            if prev[j] + 1 < d:
+                d = prev[j] + 1
+            if current[j - 1] + 1 < d:
+                d = current[j - 1] + 1
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1] and prev_prev[j - 2] + 1 < d:
+                d = prev_prev[j - 2] + 1
+            current[j] = d
+            if d < row_min:
+                row_min = d
+        if row_min > max_distance:
+            return too_far
+        prev_prev, prev = prev, current
+    return prev[-1] if prev[-1] <= max_distance else too_far
+
+class SpellingIndex(object):
+    """
+    Symmetric delete index over the words of a vocabulary (see SymSpell). Every word is stored under each
+    string obtained by deleting up to max_distance characters from it, so a misspelling only has to generate
+    its own deletes and verify the few words found under them, instead of comparing against every word.
+    """
+    def __init__(self, words: Iterable[str] = (), max_distance: int = 2, min_length: int = 3):
+        """
+        :param words:           initial vocabulary
+        :param max_distance:    largest edit distance corrected (words shorter than 5 chars allow 1)
+        :param min_length:      shorter tokens (e.g. "n", "i") are never corrected
+        """
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.words = set()
+        # deletes[m][s] lists the words that give s when m characters are deleted
+        self.deletes = [dict() for _ in range(max_distance + 1)]
+        self.update(words)
+
+    @staticmethod
+    def is_word(tok: str) -> bool:
+        # internal symbols such as <Creature> and [move] are never typed by the player
+        return bool(tok) and tok[0] not in "<["
+
+    def __distance_for(self, word: str) -> int:
+        return min(self.max_distance, 1 if len(word) < 5 else 2)
+
+    @staticmethod
+    def __delete_one(strings):
+        return set(s[:i] + s[i + 1:] for s in strings if len(s) > 1 for i in range(len(s)))
+
+    def update(self, words: Iterable[str]):
+        """
+        Adds any new words to the index (called as rules are added)
+        """
+        for word in words:
+            if word in self.words or not self.is_word(word):
+                continue
+            self.words.add(word)
+            level = {word}
+            for num_deletes in range(self.max_distance + 1):
+                deletes = self.deletes[num_deletes]
+                for delete in level:
+                    deletes.setdefault(delete, []).append(word)
+                if num_deletes < self.max_distance:
+                    level = self.__delete_one(level)
+
+    def lookup(self, token: str) -> Tuple[Union[str, None], int]:
+        """
+        Closest vocabulary word to token
+
+        :return: (word, distance), or (None, max_distance + 1) when nothing is close enough
+        """
+        if token in self.words:
+            return token, 0
+        if len(token) < self.min_length:
+            return None, self.max_distance + 1
+
+        max_distance = self.__distance_for(token)
+        best, best_distance = None, max_distance + 1
+        checked = set()
+        # A word within distance d shares a delete with the token that removes at most d characters from each.
+        # So search the token's deletes breadth first, only under words' deletes of at most the best distance
+        # found so far, and stop once the token's own deletions exceed it.
+        level = {token}
+        for num_deletes in range(max_distance + 1):
+            bound = min(best_distance, max_distance)
+            if num_deletes > bound:
+                break
+            for delete in level:
+                for word_deletes in range(bound + 1):
+                    for word in self.deletes[word_deletes].get(delete, ()):
+                        if word in checked:
+                            continue
+                        checked.add(word)
+                        if word_deletes == 0:
+                            # word is the token with num_deletes characters removed
+                            distance = num_deletes
+                        else:
+                            distance = edit_distance(token, word, min(best_distance, max_distance))
+                        if distance > max_distance:
+                            continue
+                        # ties go to the alphabetically first word, so corrections are stable
+                        if distance < best_distance or (distance == best_distance and word < best):
+                            best, best_distance = word, distance
+            if num_deletes < max_distance:
+                level = self.__delete_one(level)
+
+        if best is None:
+            return None, self.max_distance + 1
+        return best, best_distance
+
+    def correct(self, token: str) -> Union[str, None]:
+        return self.lookup(token)[0]
+
+    def __len__(self):
+        return len(self.words)
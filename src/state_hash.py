@@ -0,0 +1,97 @@
+import hashlib
+
+from entities import Entrance, Item, ItemHandler, LivingThing, Location
+
+def zobrist_key(part: tuple) -> int:
+    """
+    Random 64 bit key for a part of a state, derived from the part itself so hashes are stable across processes
+    """
+    return int.from_bytes(hashlib.blake2b(repr(part).encode("utf-8"), digest_size=8).digest(), "little")
+
+class StateHash(object):
+    """
+    Zobrist hash of the game state: the XOR of a key for each part of it (where each item is, creature and player
+    stats, locks, the current location). Mutations XOR the old part out and the new one in, so the hash is kept
+    up to date at a cost per change rather than per state. Which locations were visited only changes their
+    descriptions, so it is left out: states reached by different routes hash equally.
+
+    Parts are named by position in the WorldIndex, so equal states of the same world hash equally in any process.
+    """
+    # NOTE: requires self.hash_value = None in __init__, and world_index() (see GameState)
+
+    # keys a world remembers (see WorldIndex.hash_keys) before starting over, as player and creature stats make
+    # new parts all game
+    MaxHashKeys = 1 << 16
+
+    def zobrist_key(self, part: tuple) -> int:
+        keys = self.world.hash_keys
+        key = keys.get(part)
+        if key is None:
+            if len(keys) >= self.MaxHashKeys:
+                keys.clear()
+            key = keys[part] = zobrist_key(part)
+        return key
+
+    @property
+    def state_hash(self) -> int:
+        if self.hash_value is None:
+            self.hash_value = self.compute_hash()
+        return self.hash_value
+
+    def compute_hash(self) -> int:
+        """
+        Full recompute from the world, state_hash must always equal this
+        """
+        world = self.world_index()
+        parts = [self.player_part(), ("at", world.location_ix[id(self.location)])]
+        if not self.play:
+            parts.append(("over",))
+        for i, location in enumerate(world.locations):
+            parts.extend(self.item_parts(("location", i), location))
+            parts.extend(self.item_parts(("creatures", i), location.creatures))
+        parts.extend(self.item_parts(("inventory",), self.inventory))
+        parts.extend(self.item_parts(("hands",), self.hands))
+        parts.extend(self.entrance_part(e) for e in world.entrances if e.is_locked)
+        parts.extend(self.creature_part(c) for c in world.creatures)
+
+        value = 0
+        for part in parts:
+            value ^= self.zobrist_key(part)
+        return value
+
+    def toggle(self, part: tuple):
+        if self.hash_value is not None and part is not None:
+            self.hash_value ^= self.zobrist_key(part)
+
+    def replace_part(self, old: tuple, new: tuple):
+        if old != new:
+            self.toggle(old)
+            self.toggle(new)
+
+    def item_moved(self, holder_id: tuple, item: Item, position: int):
+        # XOR is its own inverse, so adding and removing are the same toggle. The position in the stack
+        # tells apart items with the same name, which would otherwise cancel out.
+        self.toggle(("item", holder_id, item.name, position))
+
+    @staticmethod
+    def item_parts(holder_id: tuple, holder: ItemHandler):
+        for stack in holder.stacks.values():
+            for position, item in enumerate(stack):
+                yield "item", holder_id, item.name, position
+
+    def player_part(self) -> tuple:
+        p = self.player
+        # held items' modifiers follow from the hands, so only the timed ones are added
+        return "player", p.hp, p.mp, p.attack, p.defense, p.max_hp, p.is_alive, p.modifiers.timed(self.turn)
+
+    def creature_part(self, creature: LivingThing) -> tuple:
+        ix = self.world.creature_ix.get(id(creature)) if self.world is not None else None
+        return None if ix is None else ("creature", ix, creature.hp, creature.is_alive)
+
+    def entrance_part(self, entrance: Entrance) -> tuple:
+        ix = self.world.entrance_ix.get(id(entrance)) if self.world is not None else None
+        return None if ix is None else ("locked", ix)
+
+    def location_part(self, location: Location) -> tuple:
+        ix = self.world.location_ix.get(id(location)) if self.world is not None and location is not None else None
+        return None if ix is None else ("at", ix)
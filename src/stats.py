@@ -0,0 +1,92 @@
+import heapq
+import itertools
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Tuple
+
+# tie breaker for the expiry heap, so sources are never compared
+_order = itertools.count()
+
+@dataclass(frozen=True, order=True)
+class Modifier(object):
+    # a LivingThing field, e.g. "attack", "defense", "hit_pct", "max_hp"
+    stat: str
+    amount: float
+    # turns it lasts once applied (e.g. a potion's effect), None for as long as its source is in effect (e.g. held)
+    turns: int = None
+
+class Modifiers(object):
+    """
+    The stat modifiers in effect on a LivingThing, by source (e.g. ("held", id(item))), with a running total per stat.
+    Totals are updated as modifiers are added and removed, so reading a derived stat (LivingThing.stat) is O(1)
+    however many are active. Timed modifiers are removed by tick(), at a cost per expiry rather than per turn.
+    """
+    __slots__ = ("totals", "active", "expiry")
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}
+        # source -> (modifiers, turn they expire or None)
+        self.active: Dict[Any, Tuple[Tuple[Modifier, ...], int]] = {}
+        # heap of (expiry turn, tie breaker, source)
+        self.expiry: List[Tuple[int, int, Any]] = []
+
+    def total(self, stat: str) -> float:
+        return self.totals.get(stat, 0)
+
+    def add(self, source, modifiers: Iterable[Modifier], expires: int = None):
+        """
+        :param source:      key to remove them by, replacing anything already added under it
+        :param modifiers:   modifiers to add
+        :param expires:     the turn tick() removes them on, if timed
+        """
+        modifiers = tuple(modifiers)
+        self.remove(source)
+        if not modifiers:
+            return
+        self.active[source] = (modifiers, expires)
+        for m in modifiers:
+            self.totals[m.stat] = self.totals.get(m.stat, 0) + m.amount
+        if expires is not None:
+            heapq.heappush(self.expiry, (expires, next(_order), source))
+
+    def remove(self, source):
+        entry = self.active.pop(source, None)
+        if entry is not None:
+            for m in entry[0]:
+                self.totals[m.stat] -= m.amount
+
+    def tick(self, turn: int) -> bool:
+        """
+        Removes the timed modifiers that expire by turn
+
+        :return: True if any did
+        """
+        expired = False
+        while self.expiry and self.expiry[0][0] <= turn:
+            expires, _, source = heapq.heappop(self.expiry)
+            entry = self.active.get(source)
+            # skip sources removed or re-added since
+            if entry is not None and entry[1] == expires:
+                self.remove(source)
+                expired = True
+        return expired
+
+    def timed(self, turn: int) -> tuple:
+        """
+        The timed modifiers and their turns remaining, in a stable order (part of the state hash)
+        """
+        if not self.expiry:
+            return ()
+        return tuple(sorted((expires - turn, modifiers) for modifiers, expires in self.active.values()
+                            if expires is not None))
+
+    def getstate(self) -> tuple:
+        return tuple(self.active.items()), tuple(self.expiry)
+
+    def setstate(self, state: tuple):
+        active, expiry = state
+        self.active = dict(active)
+        self.expiry = list(expiry)
+        self.totals = {}
+        for modifiers, _ in self.active.values():
+            for m in modifiers:
+                self.totals[m.stat] = self.totals.get(m.stat, 0) + m.amount
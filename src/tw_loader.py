@@ -0,0 +1,487 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, TextIO, Tuple
+
+from entities import Entrance, Item, Location
+from enums import CompassEnum, Opposite
+from parser import Parser
+
+class JsonStream(object):
+    """
+    Reads a JSON document a value at a time, so the arrays of a large file can be walked without holding the file,
+    or its parsed tree, in memory. Only the top level object and its arrays are walked by hand, the values in
+    them are parsed by json's own decoder.
+    """
+    def __init__(self, f: TextIO, chunk_size: int = 1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size: int) -> bool:
+        """
+        Reads size more characters, dropping those already consumed
+
+        :return: False at the end of the file
+        """
+        if self.eof:
+            return False
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        :return: the next character after any whitespace, "" at the end of the file
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill(self.chunk_size):
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise Exception(f"Bad JSON: expected one of {chars!r}, found {ch!r}")
+        self.pos += 1
+        return ch
+
+    def value(self):
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number may carry on into the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # reading twice as much each time keeps a long value linear to parse
+            self.fill(size)
+            size *= 2
+
+    def fields(self):
+        """
+        The keys of the object about to be read, the caller reads each one's value (with value() or elements())
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    def elements(self):
+        """
+        The values in the array about to be read
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+# TextWorld fact names -> the direction they give, e.g. north_of(a, b): a is north of b
+DirectionFacts = {f"{d}_of": d for d in CompassEnum.Values}
+# exit states, see CompiledWorld.exit_locked
+Open, Locked, Closed = 0, 1, 2
+# object types loaded as Items: objects, keys and food. Containers (c) and supporters (s) are scenery, their
+# contents are put in the room
+ItemTypes = ("o", "k", "f")
+
+def clean_desc(desc: str) -> str:
+    """
+    The first paragraph of a TextWorld description, without its Inform [if ...] markup. The rest lists the exits
+    and objects, which Location.describe already does.
+    """
+    desc = (desc or "").strip().split("\n\n")[0]
+    return re.sub(r"\s+", " ", re.sub(r"\[[^\]]*\]", "", desc)).strip()
+
+class CompiledWorld(object):
+    """
+    A TextWorld game as flat arrays: interned strings, rooms, exits and items, ready to be built into Locations.
+    Compiling is the slow part (see compile_textworld), so the arrays are saved as a binary cache next to the
+    JSON file and later loads skip the JSON entirely.
+
+    Rooms and items refer to strings by id. An item's holder is a room, or -1 for the player's inventory.
+    """
+    # Cache layout: header, then the strings and int arrays, each section padded to 8 bytes
+    CacheMagic = b"PCGW"
+    CacheFormat = 2
+    CacheHeader = struct.Struct("<4sIqqIIIIIii")
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.string_ix: Dict[str, int] = {}
+        self.room_names = array("i")
+        self.room_descs = array("i")
+        # per exit: rooms from and to, index into Directions, name (the door's, or -1), Open / Locked / Closed,
+        # key name (or -1)
+        self.exit_from = array("i")
+        self.exit_to = array("i")
+        self.exit_directions = array("b")
+        self.exit_names = array("i")
+        self.exit_locked = array("b")
+        self.exit_keys = array("i")
+        self.item_holders = array("i")
+        self.item_names = array("i")
+        self.start = 0
+        self.objective = -1
+
+    Directions = tuple(sorted(Opposite))
+
+    def intern(self, s: str) -> int:
+        ix = self.string_ix.get(s)
+        if ix is None:
+            ix = self.string_ix[s] = len(self.strings)
+            self.strings.append(s)
+        return ix
+
+    def build(self) -> Tuple[Location, List[Item]]:
+        """
+        Makes the world's objects, which add their rules to the grammar (see Item and Entrance)
+
+        :return: the player's starting Location and inventory
+        """
+        strings = self.strings
+        rooms = [Location(name=strings[n], desc=strings[d]) for n, d in zip(self.room_names, self.room_descs)]
+        # (from, direction) -> Entrance, to join each exit to the way back
+        exits = {}
+        for i in range(len(self.exit_from)):
+            source, direction = self.exit_from[i], self.Directions[self.exit_directions[i]]
+            name = strings[self.exit_names[i]] if self.exit_names[i] >= 0 else None
+            if self.exit_keys[i] >= 0:
+                key_name = strings[self.exit_keys[i]]
+            else:
+                # a closed door opens without a key
+                key_name = None if self.exit_locked[i] == Closed else "-"
+            entrance = Entrance(rooms[self.exit_to[i]], is_locked=bool(self.exit_locked[i]), name=name,
+                                key_name=key_name)
+            setattr(rooms[source], direction, entrance)
+            exits[(source, direction)] = entrance
+            back = exits.get((self.exit_to[i], Opposite[direction]))
+            if back is not None and back.location is rooms[source]:
+                entrance.cloney, back.cloney = back, entrance
+        inventory = []
+        for holder, name in zip(self.item_holders, self.item_names):
+            item = Item(name=strings[name])
+            if holder < 0:
+                inventory.append(item)
+            else:
+                rooms[holder].add_item(item)
+        return rooms[self.start], inventory
+
+    @staticmethod
+    def section_sizes(num_rooms: int, num_exits: int, num_items: int) -> List[int]:
+        """
+        Bytes in each array section of the cache, in order (see save)
+        """
+        return [4 * num_rooms] * 2 + [4 * num_exits] * 2 + [num_exits, 4 * num_exits, num_exits, 4 * num_exits] + \
+               [4 * num_items] * 2
+
+    def save(self, path: str, source_size: int, source_mtime: int) -> bool:
+        """
+        Writes the arrays to a binary cache, tied to the size and modification time of the JSON it came from.
+        The file is written alongside and then moved into place, so an interrupted save leaves no partial cache.
+
+        :return: False if it couldn't be written, e.g. to a read only directory
+        """
+        blob = "\0".join(self.strings).encode("utf-8")
+        arrays = (self.room_names, self.room_descs, self.exit_from, self.exit_to, self.exit_directions,
+                  self.exit_names, self.exit_locked, self.exit_keys, self.item_holders, self.item_names)
+        header = self.CacheHeader.pack(self.CacheMagic, self.CacheFormat, source_size, source_mtime,
+                                       len(self.strings), len(blob), len(self.room_names), len(self.exit_from),
+                                       len(self.item_names), self.start, self.objective)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                for section in (header, blob) + tuple(a.tobytes() for a in arrays):
+                    f.write(section)
+                    f.write(b"\0" * (-len(section) % 8))
+            os.replace(temp_path, path)
+            return True
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+    @classmethod
+    def load(cls, path: str, source_size: int, source_mtime: int):
+        """
+        :return: CompiledWorld, or None when the cache is missing, stale, truncated or not a cache
+        """
+        try:
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        view = memoryview(buffer)
+        header_size = cls.CacheHeader.size
+        if len(view) < header_size:
+            return None
+        magic, fmt, size, mtime, num_strings, blob_len, num_rooms, num_exits, num_items, start, objective = \
+            cls.CacheHeader.unpack(view[:header_size])
+        if magic != cls.CacheMagic or fmt != cls.CacheFormat or (size, mtime) != (source_size, source_mtime):
+            return None
+        # the header's counts give the exact file size, anything else is a partial or damaged file
+        sizes = [header_size, blob_len] + cls.section_sizes(num_rooms, num_exits, num_items)
+        if len(view) != sum(size + (-size % 8) for size in sizes) or not (0 <= start < max(num_rooms, 1)):
+            return None
+
+        offset = header_size + (-header_size % 8)
+        def section(length, fmt="b", item_size=1):
+            nonlocal offset
+            size = length * item_size
+            sect = array(fmt)
+            sect.frombytes(view[offset:offset + size])
+            offset += size + (-size % 8)
+            return sect
+
+        self = cls()
+        try:
+            self.strings = bytes(view[offset:offset + blob_len]).decode("utf-8").split("\0") if num_strings else []
+        except UnicodeDecodeError:
+            return None
+        if len(self.strings) != num_strings:
+            return None
+        offset += blob_len + (-blob_len % 8)
+        self.string_ix = {s: i for i, s in enumerate(self.strings)}
+        self.room_names, self.room_descs = section(num_rooms, "i", 4), section(num_rooms, "i", 4)
+        self.exit_from, self.exit_to = section(num_exits, "i", 4), section(num_exits, "i", 4)
+        self.exit_directions = section(num_exits)
+        self.exit_names = section(num_exits, "i", 4)
+        self.exit_locked = section(num_exits)
+        self.exit_keys = section(num_exits, "i", 4)
+        self.item_holders, self.item_names = section(num_items, "i", 4), section(num_items, "i", 4)
+        self.start, self.objective = start, objective
+        view.release()
+        buffer.close()
+        # ids out of range would fail in build, -1 is none (no door name, no key, the inventory)
+        num_strings = len(self.strings)
+        for ids, low, limit in ((self.room_names, 0, num_strings), (self.room_descs, 0, num_strings),
+                                (self.exit_from, 0, num_rooms), (self.exit_to, 0, num_rooms),
+                                (self.exit_directions, 0, len(self.Directions)), (self.exit_locked, 0, Closed + 1),
+                                (self.exit_names, -1, num_strings), (self.exit_keys, -1, num_strings),
+                                (self.item_holders, -1, num_rooms), (self.item_names, 0, num_strings)):
+            if ids and not (low <= min(ids) and max(ids) < limit):
+                return None
+        if objective >= num_strings:
+            return None
+        return self
+
+def compile_textworld(path: str) -> CompiledWorld:
+    """
+    Streams a TextWorld JSON file (the "world" facts and the "infos" naming each entity) into a CompiledWorld.
+    Facts name entities (e.g. r_2) that infos describe further on in the file, so they are kept as ids until
+    the end.
+    """
+    # entity id -> info, and the facts used, by name
+    infos: Dict[str, dict] = {}
+    facts: Dict[str, List[Tuple[str, ...]]] = {}
+    wanted = {"at", "in", "on", "link", "locked", "closed", "match"} | set(DirectionFacts)
+    objective = ""
+    with open(path, encoding="utf-8") as f:
+        stream = JsonStream(f)
+        for key in stream.fields():
+            if key == "world":
+                for fact in stream.elements():
+                    if fact["name"] in wanted:
+                        facts.setdefault(fact["name"], []).append(tuple(a["name"] for a in fact["arguments"]))
+            elif key == "infos":
+                for entity_id, info in stream.elements():
+                    # only what's used, the rest of each info is dropped as it's read
+                    infos[entity_id] = {"type": info["type"], "name": info["name"], "desc": info["desc"]}
+            elif key == "objective":
+                objective = stream.value()
+            else:
+                stream.value()
+
+    world = CompiledWorld()
+    world.objective = world.intern(objective) if objective else -1
+    room_ix = {}
+    for entity_id, info in infos.items():
+        if info["type"] == "r":
+            room_ix[entity_id] = len(world.room_names)
+            world.room_names.append(world.intern(info["name"] or entity_id))
+            world.room_descs.append(world.intern(clean_desc(info["desc"])))
+
+    def name(entity_id: str) -> str:
+        # lower case, as commands are (see Parser.parse and ItemHandler.key)
+        return (infos.get(entity_id, {}).get("name") or entity_id).lower()
+
+    # door between two rooms, its key. A closed door is locked without one, "open <door>" opens it (see Entrance)
+    doors = {(a, b): d for a, d, b in facts.get("link", ())}
+    locked = set(d for d, in facts.get("locked", ()))
+    closed = set(d for d, in facts.get("closed", ())) - locked
+    keys = {target: k for k, target in facts.get("match", ())}
+    for fact, direction in DirectionFacts.items():
+        # e.g. north_of(a, b): going north from b leads to a
+        for a, b in facts.get(fact, ()):
+            door = doors.get((b, a))
+            world.exit_from.append(room_ix[b])
+            world.exit_to.append(room_ix[a])
+            world.exit_directions.append(CompiledWorld.Directions.index(direction))
+            world.exit_names.append(world.intern(name(door)) if door else -1)
+            world.exit_locked.append(Locked if door in locked else Closed if door in closed else Open)
+            world.exit_keys.append(world.intern(name(keys[door])) if door in locked and door in keys else -1)
+
+    # where each thing is: a room, "I" (the inventory), or another thing it is in or on
+    holders = {x: holder for fact in ("at", "in", "on") for x, holder in facts.get(fact, ())}
+    for entity_id, holder in holders.items():
+        if entity_id == "P":
+            world.start = room_ix[holder]
+            continue
+        if infos.get(entity_id, {}).get("type") not in ItemTypes:
+            continue
+        # things in containers (or on supporters) are put where the container is
+        seen = set()
+        while holder in holders and holder not in room_ix and holder not in seen:
+            seen.add(holder)
+            holder = holders[holder]
+        world.item_holders.append(room_ix[holder] if holder in room_ix else -1)
+        world.item_names.append(world.intern(name(entity_id)))
+    return world
+
+@dataclass
+class TextWorldGame(object):
+    start: Location
+    # what the player starts out carrying
+    inventory: List[Item]
+    objective: str
+
+def load_textworld(path: str, cache_path: str = None, use_cache: bool = True) -> TextWorldGame:
+    """
+    Loads a TextWorld JSON game, from its binary cache when that is up to date (writing it when not).
+    Call within a GrammarLayer to keep the world's rules to it, as with generate_world.
+
+    Not everything is mapped as a TextWorld engine would. The rules aren't added in bulk: each Item and Entrance
+    adds its own as build() makes it, as in generate_world, and repeats of a name stop at try_add_new_rule's
+    known_rules check (collecting them first was slower). Room names become <Room>s when the game's world is
+    indexed (see GameState.index_world). Closed doors are locked Entrances with no key, opened with "open <door>".
+    No LivingThings are made, as TextWorld games have no creatures, and containers and supporters are scenery.
+
+    :param cache_path:  where the cache is kept, by default next to the JSON file
+    :param use_cache:   False to always compile from the JSON, and not write a cache
+    """
+    cache_path = cache_path or path + ".pcgw"
+    stat = os.stat(path)
+    world = CompiledWorld.load(cache_path, stat.st_size, stat.st_mtime_ns) if use_cache else None
+    if world is None:
+        world = compile_textworld(path)
+        if use_cache:
+            world.save(cache_path, stat.st_size, stat.st_mtime_ns)
+    start, inventory = world.build()
+    objective = world.strings[world.objective] if world.objective >= 0 else ""
+    return TextWorldGame(start=start, inventory=inventory, objective=objective)
+
+def write_grid_game(path: str, width: int, height: int):
+    """
+    Writes a width x height grid of rooms in TextWorld's JSON format, with a locked door and its key every
+    tenth room and an object in every room, for benchmarking loads (see __main__)
+    """
+    def room(x, y):
+        return f"r_{y * width + x}"
+
+    def fact(name, *args):
+        return json.dumps({"name": name, "arguments": [{"name": a, "type": a.split("_")[0]} for a in args]})
+
+    def info(entity_id, kind, name, desc):
+        return json.dumps([entity_id, {"id": entity_id, "type": kind, "name": name, "noun": name, "adj": None,
+                                       "desc": desc, "room_type": None, "definite": None, "indefinite": None,
+                                       "synonyms": None}])
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"version": 1, "world": [')
+        first = True
+        def write(s):
+            nonlocal first
+            f.write(s if first else ", " + s)
+            first = False
+        write(fact("at", "P", room(0, 0)))
+        for y in range(height):
+            for x in range(width):
+                i = y * width + x
+                write(fact("at", f"o_{i}", room(x, y)))
+                if x + 1 < width:
+                    write(fact("east_of", room(x + 1, y), room(x, y)))
+                    write(fact("west_of", room(x, y), room(x + 1, y)))
+                    if i % 10 == 0:
+                        write(fact("link", room(x, y), f"d_{i}", room(x + 1, y)))
+                        write(fact("link", room(x + 1, y), f"d_{i}", room(x, y)))
+                        write(fact("locked", f"d_{i}"))
+                        write(fact("match", f"k_{i}", f"d_{i}"))
+                        write(fact("at", f"k_{i}", room(x, y)))
+                if y + 1 < height:
+                    write(fact("south_of", room(x, y + 1), room(x, y)))
+                    write(fact("north_of", room(x, y), room(x, y + 1)))
+        f.write('], "infos": [')
+        first = True
+        for y in range(height):
+            for x in range(width):
+                i = y * width + x
+                write(info(room(x, y), "r", f"room {x} {y}",
+                           f"You are in room {x} {y}. [if d_{i} is open]It is bright.[otherwise]It is dim.[end if]\n\n "
+                           f"There is an exit to the east."))
+                write(info(f"o_{i}", "o", f"thing {i}", "It's a thing."))
+                if x + 1 < width and i % 10 == 0:
+                    write(info(f"d_{i}", "d", f"door {i}", "A door."))
+                    write(info(f"k_{i}", "k", f"key {i}", "A key."))
+        f.write('], "objective": "Wander."}')
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Benchmark loading TextWorld games, from JSON and from the cache")
+    arg_parser.add_argument("--grid", default="100x100", help="WIDTHxHEIGHT of the generated game")
+    arg_parser.add_argument("--path", default="/tmp/tw_grid.json")
+    args = arg_parser.parse_args()
+
+    width, height = map(int, args.grid.split("x"))
+    write_grid_game(args.path, width, height)
+    print(f"{width * height} rooms, {os.path.getsize(args.path) / 1e6:.1f} MB of JSON")
+
+    start_time = time.perf_counter()
+    with open(args.path, encoding="utf-8") as f:
+        json.load(f)
+    print(f"json.load alone:          {time.perf_counter() - start_time:6.2f}s")
+
+    for label, use_cache in (("compile (no cache)", False), ("compile and write cache", True), ("from cache", True)):
+        with Parser().new_layer():
+            start_time = time.perf_counter()
+            if use_cache and label.startswith("from"):
+                stat = os.stat(args.path)
+                world = CompiledWorld.load(args.path + ".pcgw", stat.st_size, stat.st_mtime_ns)
+            else:
+                world = compile_textworld(args.path)
+                if use_cache:
+                    stat = os.stat(args.path)
+                    world.save(args.path + ".pcgw", stat.st_size, stat.st_mtime_ns)
+            compiled = time.perf_counter()
+            world.build()
+            built = time.perf_counter()
+        print(f"{label + ':':<25} {compiled - start_time:6.2f}s, then {built - compiled:.2f}s to build the objects")
+    os.remove(args.path + ".pcgw")
@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 class Singleton(type):
     _instances = {}
     def __call__(cls, *args, **kwargs):
@@ -15,4 +17,43 @@ class StringUtils(object):
     def clean(s):
         if not s:
             return ""
-        return str(s).replace("-", " ").strip().lower()
\ No newline at end of file
+        return str(s).replace("-", " ").strip().lower()
+
+class LRUCache(object):
+    """
+    Bounded least recently used cache, with hit / miss / eviction counters for sizing
+    """
+    def __init__(self, max_size: int = 1024):
+        assert max_size > 0, f"max_size must be positive: {max_size}"
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        if key in self.data:
+            self.hits += 1
+            self.data.move_to_end(key)
+            return self.data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.data.clear()
+
+    def stats(self):
+        return {
+            "size": len(self.data), "max_size": self.max_size,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions
+        }
+
+    def __len__(self):
+        return len(self.data)
@@ -0,0 +1,239 @@
+import argparse
+import time
+from array import array
+from typing import Dict, Iterable, List, Set
+
+from entities import Entrance, WorldIndex
+from enums import CompassEnum, VerticalEnum
+
+# edge states, see WorldGraph.state
+Open, Locked, Hidden = 0, 1, 2
+
+class WorldGraph(object):
+    """
+    The exits of a world as adjacency arrays, for route finding without walking the Location objects.
+    The exits of location i are the edges offsets[i] to offsets[i + 1] - 1, and edge e leads to location targets[e].
+    WorldIndex lists each location's entrances together, in location order, so edge e is world.entrances[e] and a
+    lock is mirrored by set_locked(e, ...) (GameState does this as doors are unlocked and snapshots restored).
+
+    Locations are numbered as in the WorldIndex. Searches are breadth first and stop at the target, so a short
+    trip costs a few rooms' worth of work however big the world is.
+    """
+    Directions = tuple(sorted(CompassEnum.Values)) + tuple(sorted(VerticalEnum.Values))
+
+    def __init__(self, world: WorldIndex):
+        self.world = world
+        self.offsets = array("l", [0])
+        self.targets = array("l")
+        # per edge: the location it leaves, the edge back (the cloney, -1 if one way), index into Directions,
+        # Open / Locked / Hidden, and index into key_names (-1 if none)
+        self.sources = array("l")
+        self.reverse = array("l")
+        self.directions = array("b")
+        self.state = bytearray()
+        self.keys = array("l")
+        self.key_names: List[str] = []
+        self.key_ix: Dict[str, int] = {}
+        direction_ix = {d: i for i, d in enumerate(self.Directions)}
+
+        for i, location in enumerate(world.locations):
+            for direction in location.get_entrance_directions():
+                entrance: Entrance = getattr(location, direction)
+                assert world.entrances[len(self.targets)] is entrance, "WorldIndex entrances are not grouped by location"
+                self.targets.append(world.location_ix[id(entrance.location)])
+                self.sources.append(i)
+                self.reverse.append(world.entrance_ix.get(id(entrance.cloney), -1))
+                self.directions.append(direction_ix[direction])
+                self.state.append(self.edge_state(entrance))
+                key = -1
+                if entrance.key_name in self.key_ix:
+                    key = self.key_ix[entrance.key_name]
+                elif entrance.is_locked:
+                    key = self.key_ix[entrance.key_name] = len(self.key_names)
+                    self.key_names.append(entrance.key_name)
+                self.keys.append(key)
+            self.offsets.append(len(self.targets))
+
+        # lower case name -> first location with it
+        self.name_ix: Dict[str, int] = {}
+        for i, location in enumerate(world.locations):
+            self.name_ix.setdefault(location.name.lower(), i)
+
+        # the locations joined by edges open both ways are labelled as one component (so each can reach the others),
+        # relabelled on the first query after a lock changes. The edges between components (doors: locked or one way)
+        # are few, so reachable() searches them instead.
+        self.component: array = None
+        self.members: List[List[int]] = None
+        self.doors: List[List[int]] = None
+
+    @staticmethod
+    def edge_state(entrance: Entrance) -> int:
+        if not entrance.is_visible:
+            return Hidden
+        return Locked if entrance.is_locked else Open
+
+    def set_locked(self, edge: int, is_locked: bool):
+        entrance = self.world.entrances[edge]
+        if is_locked and entrance.key_name not in self.key_ix:
+            self.key_ix[entrance.key_name] = len(self.key_names)
+            self.key_names.append(entrance.key_name)
+        self.keys[edge] = self.key_ix.get(entrance.key_name, -1)
+        state = self.edge_state(entrance)
+        if self.state[edge] != state:
+            self.state[edge] = state
+            self.component = None
+
+    def label_components(self):
+        offsets, targets, state, reverse = self.offsets, self.targets, self.state, self.reverse
+        component = array("l", [-1]) * (len(offsets) - 1)
+        members = []
+        for root in range(len(component)):
+            if component[root] >= 0:
+                continue
+            c = len(members)
+            component[root] = c
+            group = [root]
+            # group doubles as the stack: locations are labelled when pushed
+            i = 0
+            while i < len(group):
+                u = group[i]
+                i += 1
+                for e in range(offsets[u], offsets[u + 1]):
+                    v = targets[e]
+                    if component[v] < 0 and not state[e] and reverse[e] >= 0 and not state[reverse[e]]:
+                        component[v] = c
+                        group.append(v)
+            members.append(group)
+        # component -> edges out of it
+        doors = [[] for _ in members]
+        for e, (u, v) in enumerate(zip(self.sources, targets)):
+            if state[e] != Hidden and component[u] != component[v]:
+                doors[component[u]].append(e)
+        self.component, self.members, self.doors = component, members, doors
+
+    def find(self, name: str) -> int:
+        """
+        :return: the location called name (any case), None if there is none
+        """
+        return self.name_ix.get(name.strip().lower())
+
+    def search(self, source: int, target: int = None, keys: Iterable[str] = ()) -> Dict[int, int]:
+        """
+        Breadth first search over the open edges, and locked edges whose key is in keys
+
+        :return: location -> edge it was first reached by (-1 for source), for every location reached
+                 (stopping early once target is)
+        """
+        key_ids = set(self.key_ix[k] for k in keys if k in self.key_ix)
+        offsets, targets, state, edge_keys = self.offsets, self.targets, self.state, self.keys
+        parent = {source: -1}
+        if source == target:
+            return parent
+        frontier = [source]
+        while frontier:
+            next_frontier = []
+            for u in frontier:
+                for e in range(offsets[u], offsets[u + 1]):
+                    v = targets[e]
+                    if v in parent:
+                        continue
+                    s = state[e]
+                    if s and not (s == Locked and edge_keys[e] in key_ids):
+                        continue
+                    parent[v] = e
+                    if v == target:
+                        return parent
+                    next_frontier.append(v)
+            frontier = next_frontier
+        return parent
+
+    def reachable_components(self, source: int, keys: Iterable[str] = ()) -> Set[int]:
+        if self.component is None:
+            self.label_components()
+        key_ids = set(self.key_ix[k] for k in keys if k in self.key_ix)
+        component, state, edge_keys, targets = self.component, self.state, self.keys, self.targets
+        reached = {component[source]}
+        pending = [component[source]]
+        while pending:
+            for e in self.doors[pending.pop()]:
+                c = component[targets[e]]
+                if c not in reached and (state[e] == Open or edge_keys[e] in key_ids):
+                    reached.add(c)
+                    pending.append(c)
+        return reached
+
+    def path(self, source: int, target: int, keys: Iterable[str] = ()) -> List[int]:
+        """
+        A shortest route, unlocking the doors keys open
+
+        :return: the edges taken in order, None if target can't be reached
+        """
+        keys = list(keys)
+        if self.component is None:
+            self.label_components()
+        if self.component[target] not in self.reachable_components(source, keys):
+            # without searching the whole world to find out
+            return None
+        parent = self.search(source, target, keys)
+        if target not in parent:
+            return None
+        edges = []
+        location = target
+        while location != source:
+            e = parent[location]
+            edges.append(e)
+            location = self.sources[e]
+        return edges[::-1]
+
+    def reachable(self, source: int, keys: Iterable[str] = ()) -> Set[int]:
+        """
+        The locations that can be reached from source now, or once keys are held
+        """
+        reached = set()
+        for c in self.reachable_components(source, keys):
+            reached.update(self.members[c])
+        return reached
+
+    def is_reachable(self, source: int, target: int, keys: Iterable[str] = ()) -> bool:
+        if self.component is None:
+            self.label_components()
+        return self.component[target] in self.reachable_components(source, keys)
+
+    def moves(self, edges: List[int]) -> List[str]:
+        """
+        The directions to go in to follow a path, e.g. ["north", "east"]
+        """
+        return [self.Directions[self.directions[e]] for e in edges]
+
+if __name__ == "__main__":
+
+    from game_world import generate_grid_world
+
+    arg_parser = argparse.ArgumentParser(description="Time WorldGraph queries on a grid world")
+    arg_parser.add_argument("--grid", default="250x400", help="WIDTHxHEIGHT")
+    args = arg_parser.parse_args()
+
+    width, height = map(int, args.grid.split("x"))
+    start = time.perf_counter()
+    world = WorldIndex(generate_grid_world(width=width, height=height))
+    indexed = time.perf_counter()
+    graph = WorldGraph(world)
+    built = time.perf_counter()
+    print(f"{len(world.locations)} rooms: world built and indexed in {indexed - start:.2f}s, graph in {built - indexed:.2f}s")
+
+    far = graph.find(f"room {width - 1} {height - 1}")
+    near = graph.find("room 3 3")
+    all_keys = graph.key_names
+    start = time.perf_counter()
+    graph.label_components()
+    print(f"{len(graph.members)} components labelled in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for label, fn in (("reachable now", lambda: graph.reachable(0)),
+                      ("reachable with all keys", lambda: graph.reachable(0, all_keys)),
+                      ("path to far corner", lambda: graph.path(0, far, all_keys)),
+                      ("path to room 3 3", lambda: graph.path(0, near, all_keys))):
+        n = 1000 if label.endswith("3 3") else 5
+        start = time.perf_counter()
+        for _ in range(n):
+            result = fn()
+        elapsed = (time.perf_counter() - start) / n
+        print(f"{label:<24} {elapsed * 1000:8.3f} ms ({len(result)} {'rooms' if label.startswith('reach') else 'moves'})")
@@ -0,0 +1,376 @@
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import fields
+from typing import Dict, Iterable, Tuple
+
+from entities import Entrance, Item, LivingThing, Location, WorldIndex
+from enums import Opposite
+from parser import GrammarLayer, Parser
+from stats import Modifier
+
+Callbacks = ("consume_fn", "pickup_fn", "drop_fn")
+
+def encode_fn(fn) -> str:
+    if fn is None:
+        return None
+    if "<" in fn.__qualname__:
+        raise Exception(f"Only module level functions can be stored, not {fn.__qualname__}")
+    return f"{fn.__module__}:{fn.__qualname__}"
+
+# "module:name" -> function
+_functions = {}
+
+def decode_fn(ref: str):
+    if ref is None:
+        return None
+    fn = _functions.get(ref)
+    if fn is None:
+        module, name = ref.split(":")
+        fn = _functions[ref] = getattr(importlib.import_module(module), name)
+    return fn
+
+def non_defaults(obj, skip=()) -> dict:
+    # the fields set away from their defaults, which keeps records small
+    return {f.name: getattr(obj, f.name) for f in fields(obj)
+            if f.name not in skip and getattr(obj, f.name) != f.default}
+
+def encode_item(item: Item) -> dict:
+    record = non_defaults(item, skip=Callbacks + ("effects",))
+    if item.effects:
+        record["effects"] = [[m.stat, m.amount, m.turns] for m in item.effects]
+    for name in Callbacks:
+        if getattr(item, name) is not None:
+            record[name] = encode_fn(getattr(item, name))
+    return record
+
+def decode_item(record: dict) -> Item:
+    record = dict(record)
+    if "effects" in record:
+        record["effects"] = tuple(Modifier(*m) for m in record["effects"])
+    for name in Callbacks:
+        if name in record:
+            record[name] = decode_fn(record[name])
+    return Item(**record)
+
+def encode_location(location: Location, targets: Dict[int, Tuple[int, bool]]) -> str:
+    """
+    :param targets:     id(Entrance) -> (room id it leads to, whether the way back is its cloney)
+    """
+    exits = []
+    for direction in location.get_entrance_directions():
+        e: Entrance = getattr(location, direction)
+        target, two_way = targets[id(e)]
+        exits.append([direction, target, e.name, e.short_name, e.is_locked, e.is_visible, e.key_name, two_way])
+    record = {
+        "name": location.name, "initial_desc": location.initial_desc, "desc": location.desc,
+        "visited": location.visited,
+        "items": [encode_item(i) for i in location.items],
+        "creatures": [non_defaults(c, skip=("modifiers",)) for c in location.creatures.items],
+        "exits": exits,
+    }
+    return json.dumps(record, separators=(",", ":"))
+
+class WorldStore(object):
+    """
+    A world on disk: one JSON record per room in an sqlite table, keyed by room id, plus the vocabulary its items and
+    entrances add to the grammar. Rooms are read and written one at a time, so a world needn't fit in memory.
+    """
+    Format = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS rooms (id INTEGER PRIMARY KEY, record TEXT)")
+        fmt = self.get_meta("format")
+        if fmt is None:
+            self.set_meta("format", self.Format)
+        elif fmt != self.Format:
+            raise Exception(f"{path} is a format {fmt} world store, expected format {self.Format}")
+
+    def get_meta(self, key: str):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_meta(self, key: str, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    @property
+    def start(self) -> int:
+        return self.get_meta("start")
+
+    def get(self, room_id: int) -> str:
+        row = self.db.execute("SELECT record FROM rooms WHERE id = ?", (room_id,)).fetchone()
+        if row is None:
+            raise Exception(f"No room {room_id} in {self.path}")
+        return row[0]
+
+    def put(self, room_id: int, record: str):
+        self.db.execute("INSERT OR REPLACE INTO rooms VALUES (?, ?)", (room_id, record))
+
+    def put_many(self, records: Iterable[Tuple[int, str]]):
+        self.db.executemany("INSERT OR REPLACE INTO rooms VALUES (?, ?)", records)
+
+    def commit(self):
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM rooms").fetchone()[0]
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def create_store(path: str, overwrite: bool = False) -> WorldStore:
+    """
+    A new, empty store at path
+
+    :param overwrite:   replace the file at path if there is one, else that is an Exception
+    """
+    if os.path.exists(path):
+        if not overwrite:
+            raise Exception(f"{path} already exists, pass overwrite=True to replace it")
+        os.remove(path)
+    return WorldStore(path)
+
+def save_world(start: Location, path: str, overwrite: bool = False) -> WorldStore:
+    """
+    Writes the world reachable from start to a new store at path, start is room 0
+
+    :param overwrite:   replace the file at path if there is one, else that is an Exception
+    """
+    store = create_store(path, overwrite=overwrite)
+    world = WorldIndex(start)
+    targets = {}
+    for location in world.locations:
+        for direction in location.get_entrance_directions():
+            e = getattr(location, direction)
+            back = getattr(e.location, Opposite[direction])
+            targets[id(e)] = world.location_ix[id(e.location)], e.cloney is not None and e.cloney is back
+    store.put_many((i, encode_location(l, targets)) for i, l in enumerate(world.locations))
+    store.set_meta("start", 0)
+    store.set_meta("items", sorted(set(i.name for l in world.locations for i in l.items)))
+    store.set_meta("entrances", sorted(set((e.name, e.short_name) for e in world.entrances)))
+    store.commit()
+    return store
+
+class PagedWorld(object):
+    """
+    Plays a WorldStore without loading all of it. The rooms within radius moves of the player are kept in memory
+    (GameState calls enter() as the player moves), so every exit out of the player's room leads to a loaded
+    Location. Further out, an Entrance's location is None until the room it leads to is loaded.
+
+    Rooms are kept least recently entered first, and once more than max_rooms are loaded the oldest outside the
+    player's neighbourhood are evicted, written back first if they changed (items taken, creatures killed, doors
+    unlocked or just visited). Memory use is set by max_rooms, whatever the size of the world.
+
+    The whole world is never in memory, so what needs a WorldIndex (snapshots, state_hash, world_graph and travel)
+    isn't supported.
+    """
+    def __init__(self, store: WorldStore, parser: GrammarLayer = None, radius: int = 2, max_rooms: int = 2000):
+        """
+        :param store:       the world
+        :param parser:      layer the world's rules are added to (else they go to the active layer, or the base)
+        :param radius:      moves from the player within which rooms are loaded, at least 1
+        :param max_rooms:   rooms kept in memory, more if the neighbourhood needs them
+        """
+        assert radius >= 1, "Rooms next to the player must be loaded, to move into"
+        self.store = store
+        self.parser = parser
+        self.radius = radius
+        self.max_rooms = max_rooms
+        # room id -> Location, least recently entered first
+        self.rooms: OrderedDict = OrderedDict()
+        self.room_ids: Dict[int, int] = {}
+        # room id -> record it was loaded from, to tell if it changed
+        self.records: Dict[int, str] = {}
+        # id(Entrance) -> (room id it leads to, two way), and room id -> the loaded entrances leading to it, by id
+        self.targets: Dict[int, Tuple[int, bool]] = {}
+        self.incoming: Dict[int, Dict[int, Entrance]] = {}
+        self.loads = 0
+        self.writes = 0
+        self.evictions = 0
+        # rules now rather than as rooms load, which would change the grammar mid game
+        rules = [rule for name in store.get_meta("items") or () for rule in Item.grammar_rules(name)]
+        rules += [rule for name, short_name in store.get_meta("entrances") or ()
+                  for rule in Entrance.grammar_rules(name, short_name)]
+        with self.rules():
+            parser = Parser()
+            for left, right in rules:
+                parser.try_add_new_rule(left=left, right=right)
+
+    def rules(self):
+        return self.parser if self.parser is not None else contextlib.nullcontext()
+
+    def start(self) -> Location:
+        return self.load_neighbourhood(self.store.start)
+
+    def enter(self, location: Location):
+        room_id = self.room_ids.get(id(location))
+        if room_id is None:
+            raise Exception(f"{location.name} is not a room of this PagedWorld")
+        self.load_neighbourhood(room_id)
+
+    def load_neighbourhood(self, room_id: int) -> Location:
+        """
+        Loads the rooms within radius of room_id, then evicts down to max_rooms
+
+        :return: the room
+        """
+        with self.rules():
+            near = {room_id}
+            frontier = [room_id]
+            for _ in range(self.radius):
+                next_frontier = []
+                for r in frontier:
+                    for e in self.load(r).get_entrances():
+                        target = self.targets[id(e)][0]
+                        if target not in near:
+                            near.add(target)
+                            next_frontier.append(target)
+                frontier = next_frontier
+            for r in frontier:
+                self.load(r)
+        for r in near:
+            self.rooms.move_to_end(r)
+        self.evict(protected=near)
+        return self.rooms[room_id]
+
+    def load(self, room_id: int) -> Location:
+        location = self.rooms.get(room_id)
+        if location is not None:
+            return location
+        record = self.store.get(room_id)
+        data = json.loads(record)
+        location = Location(name=data["name"], initial_desc=data["initial_desc"], desc=data["desc"],
+                            visited=data["visited"])
+        for item in data["items"]:
+            location.add_item(decode_item(item))
+        for creature in data["creatures"]:
+            location.add_creature(LivingThing(**creature))
+        for direction, target, name, short_name, is_locked, is_visible, key_name, two_way in data["exits"]:
+            e = Entrance(self.rooms.get(target), is_locked=is_locked, is_visible=is_visible, name=name,
+                         short_name=short_name, key_name=key_name)
+            self.targets[id(e)] = target, two_way
+            setattr(location, direction, e)
+            self.incoming.setdefault(target, {})[id(e)] = e
+            if two_way and e.location is not None:
+                back = getattr(e.location, Opposite[direction])
+                e.cloney, back.cloney = back, e
+
+        self.rooms[room_id] = location
+        self.room_ids[id(location)] = room_id
+        self.records[room_id] = record
+        for e in self.incoming.get(room_id, {}).values():
+            e.location = location
+        self.loads += 1
+        return location
+
+    def evict(self, protected=()):
+        evicted = False
+        while len(self.rooms) > self.max_rooms:
+            room_id = next(iter(self.rooms))
+            if room_id in protected:
+                # the rest were entered more recently still
+                break
+            location = self.rooms.pop(room_id)
+            self.write_back(room_id, location)
+            del self.room_ids[id(location)]
+            del self.records[room_id]
+            # kept, to be relinked if it's loaded again
+            for e in self.incoming.get(room_id, {}).values():
+                e.location = None
+            for e in location.get_entrances():
+                if e.cloney is not None:
+                    e.cloney.cloney = None
+                target = self.targets.pop(id(e))[0]
+                incoming = self.incoming[target]
+                del incoming[id(e)]
+                if not incoming:
+                    del self.incoming[target]
+            self.evictions += 1
+            evicted = True
+        if evicted:
+            self.store.commit()
+
+    def write_back(self, room_id: int, location: Location):
+        record = encode_location(location, self.targets)
+        if record != self.records[room_id]:
+            self.store.put(room_id, record)
+            self.records[room_id] = record
+            self.writes += 1
+
+    def save(self):
+        """
+        Writes back every loaded room that changed, e.g. at the end of a game
+        """
+        for room_id, location in self.rooms.items():
+            self.write_back(room_id, location)
+        self.store.commit()
+
+def grid_records(width: int, height: int):
+    """
+    (room id, record) for a width x height grid of bare rooms, without making any Locations (see __main__)
+    """
+    for y in range(height):
+        for x in range(width):
+            exits = []
+            for direction, dx, dy in (("north", 0, -1), ("south", 0, 1), ("west", -1, 0), ("east", 1, 0)):
+                if 0 <= x + dx < width and 0 <= y + dy < height:
+                    exits.append([direction, (y + dy) * width + x + dx, "passageway", "passageway", False, True, "-", True])
+            yield y * width + x, json.dumps({
+                "name": f"room {x} {y}", "initial_desc": f"You are in a bare room, at {x}, {y}.",
+                "desc": f"You are in a bare room, at {x}, {y}.", "visited": False,
+                "items": [{"name": "potion"}] if (x * 7 + y * 13) % 50 == 0 else [], "creatures": [], "exits": exits,
+            }, separators=(",", ":"))
+
+if __name__ == "__main__":
+
+    import random
+    import resource
+
+    from game_state import GameState
+    from output import NullSink
+
+    arg_parser = argparse.ArgumentParser(description="Walk a grid world played from a WorldStore, reporting memory use")
+    arg_parser.add_argument("--grid", default="1000x1000", help="WIDTHxHEIGHT")
+    arg_parser.add_argument("--path", default="/tmp/grid_world.db", help="replaced if it exists")
+    arg_parser.add_argument("--moves", type=int, default=20000)
+    arg_parser.add_argument("--max_rooms", type=int, default=2000)
+    args = arg_parser.parse_args()
+
+    width, height = map(int, args.grid.split("x"))
+    start_time = time.perf_counter()
+    store = create_store(args.path, overwrite=True)
+    store.put_many(grid_records(width, height))
+    store.set_meta("start", 0)
+    store.set_meta("items", ["potion"])
+    store.set_meta("entrances", [["passageway", "passageway"]])
+    store.commit()
+    print(f"wrote {len(store)} rooms in {time.perf_counter() - start_time:.1f}s")
+
+    layer = Parser().new_layer()
+    pages = PagedWorld(store, parser=layer, max_rooms=args.max_rooms)
+    gs = GameState(sink=NullSink(), seed=0, pager=pages)
+    gs.update_location(pages.start())
+    rng = random.Random(0)
+    start_time = time.perf_counter()
+    # wander with a drift south east, picking up what is found
+    for move in range(args.moves):
+        if gs.location.items:
+            gs.run_command(layer.parse("get potion"))
+        directions = gs.location.get_entrance_directions()
+        weights = [1.2 if d in ("south", "east") else 1 for d in directions]
+        gs.run_command(layer.parse(f"go {rng.choices(directions, weights)[0]}"))
+        gs.flush()
+    elapsed = time.perf_counter() - start_time
+    pages.save()
+    print(f"{args.moves} moves in {elapsed:.2f}s ({elapsed / args.moves * 1e6:.0f} us per move), now in {gs.location.name}")
+    print(f"rooms loaded {pages.loads}, written back {pages.writes}, evicted {pages.evictions}, in memory {len(pages.rooms)}")
+    print(f"potions carried {gs.inventory.count('potion')}, max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
@@ -0,0 +1,84 @@
+import math
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from combat import simulate_fights, sweep
+from entities import Item, LivingThing, Location, Player
+from game_state import GameState
+from output import NullSink
+from parser import Parser
+
+Troll = LivingThing(name="troll", hp=20, attack=15, defense=2, attack_verb="hit")
+Rat = LivingThing(name="rat", hp=5, attack=12, defense=1, attack_verb="bite")
+Dragon = LivingThing(name="dragon", hp=20, attack=35, defense=5, attack_verb="slash")
+# loses often enough for the odds to be checked both ways
+ElderDragon = LivingThing(name="dragon", hp=40, attack=40, defense=5, attack_verb="slash")
+
+def play_fights(creature: LivingThing, hold_sword: bool, num_fights: int, max_turns: int = 100):
+    """
+    Fights played through the game's fight action
+
+    :return: (wins, turns of each win)
+    """
+    parser = Parser().new_layer()
+    wins, turns_to_kill = 0, []
+    for seed in range(num_fights):
+        with parser:
+            room = Location(name="arena", desc="An arena.")
+            room.add_item(Item(name="sword", attack=10))
+        fighting = replace(creature)
+        room.creatures.add_item(fighting)
+        gs = GameState(sink=NullSink(), seed=seed)
+        gs.update_location(room, describe=False)
+        if hold_sword:
+            gs.run_command(parser.parse("hold sword"))
+        for turn in range(1, max_turns + 1):
+            gs.run_command(parser.parse(f"attack {creature.name}"))
+            gs.flush()
+            if not fighting.is_alive:
+                wins += 1
+                turns_to_kill.append(turn)
+                break
+            if not gs.player.is_alive:
+                break
+    return wins, turns_to_kill
+
+@pytest.mark.parametrize("creature, hold_sword", [(Troll, False), (Troll, True), (Rat, False), (Dragon, True),
+                                                     (ElderDragon, False), (ElderDragon, True)])
+def test_simulated_odds_match_the_fight_action(creature, hold_sword):
+    num_fights = 1500
+    wins, turns_to_kill = play_fights(creature, hold_sword, num_fights)
+    with Parser().new_layer():
+        items = [Item(name="sword", attack=10)] if hold_sword else []
+    result = simulate_fights(Player(), creature, items, num_fights=200000, seed=0)
+
+    # within 4 standard errors of the game's win rate
+    game_win_pct = wins / num_fights
+    std_err = math.sqrt(max(result.win_pct * (1 - result.win_pct), 1e-4) / num_fights)
+    assert abs(game_win_pct - result.win_pct) < 4 * std_err
+    if wins > 100:
+        turns_std_err = np.std(turns_to_kill) / math.sqrt(wins)
+        assert abs(np.mean(turns_to_kill) - result.mean_turns_to_kill) < 4 * turns_std_err + 0.05
+
+def test_results_add_up_and_are_reproducible():
+    first = simulate_fights(Player(), Troll, num_fights=10000, seed=3)
+    second = simulate_fights(Player(), Troll, num_fights=10000, seed=3)
+    assert first.wins + first.losses + first.unfinished == first.num_fights
+    assert first.turns_to_kill.sum() == first.wins
+    assert first.hp_lost.sum() == first.num_fights
+    assert np.array_equal(first.turns_to_kill, second.turns_to_kill)
+    assert np.array_equal(first.hp_lost, second.hp_lost)
+
+def test_sweep():
+    results = sweep(Player(), Dragon, {"creature.attack": [20, 40], "player.attack": [5, 15]}, num_fights=5000)
+    assert [stats for stats, _ in results] == [
+        {"creature.attack": 20, "player.attack": 5}, {"creature.attack": 20, "player.attack": 15},
+        {"creature.attack": 40, "player.attack": 5}, {"creature.attack": 40, "player.attack": 15},
+    ]
+    win_pcts = [result.win_pct for _, result in results]
+    # a weaker creature or a stronger player wins more often
+    assert win_pcts[0] > win_pcts[2] and win_pcts[1] > win_pcts[0] and win_pcts[3] > win_pcts[2]
+    with pytest.raises(Exception, match="Unknown stat"):
+        sweep(Player(), Troll, {"dragon.hp": [1]}, num_fights=10)
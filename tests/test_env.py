@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from env import TextEnv, VectorEnv
+from game_world import generate_world
+
+# commands that never end the game, so no env is reset with a random seed part way
+Commands = ["look", "inventory", "go north", "go south", "go east", "go west", "get sword", "hold sword",
+            "drop sword", "get potion", "help", "dance"]
+
+def broken_world():
+    raise ValueError("broken world")
+
+class BrokenWorld(object):
+    # a world_fn that fails on the given reset, counted per process
+    def __init__(self, fail_on: int):
+        self.fail_on = fail_on
+        self.resets = 0
+
+    def __call__(self):
+        self.resets += 1
+        if self.resets == self.fail_on:
+            raise ValueError("broken world")
+        return generate_world()
+
+def play_text_envs(seeds, commands):
+    envs = [TextEnv() for _ in seeds]
+    first = [env.reset(seed) for env, seed in zip(envs, seeds)]
+    steps = [[env.step(command) for env, command in zip(envs, step)] for step in commands]
+    return first, steps
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_vector_env_matches_text_envs(processes):
+    seeds = [1, 2, 3, 4, 5]
+    rng = random.Random(0)
+    commands = [[rng.choice(Commands) for _ in seeds] for _ in range(30)]
+    expected_first, expected_steps = play_text_envs(seeds, commands)
+
+    vec = VectorEnv(len(seeds), processes=processes)
+    try:
+        observations, infos = vec.reset(seeds)
+        assert list(zip(observations, infos)) == expected_first
+        for step, expected in zip(commands, expected_steps):
+            results = vec.step(step)
+            assert list(zip(*results)) == expected
+    finally:
+        vec.close()
+    assert vec.closed
+    with pytest.raises(Exception, match="closed"):
+        vec.step(["look"] * len(seeds))
+
+def test_worker_exceptions_are_raised_in_the_parent():
+    vec = VectorEnv(4, processes=2, world_fn=broken_world)
+    try:
+        with pytest.raises(ValueError, match="broken world") as error:
+            vec.reset()
+        assert "VectorEnv worker traceback" in str(error.value.__cause__)
+        # every worker answered, so the next call still lines up
+        with pytest.raises(ValueError, match="broken world"):
+            vec.reset()
+    finally:
+        vec.close()
+
+def test_worker_keeps_serving_after_an_exception():
+    # each worker's second env fails its first reset, and the next reset works
+    vec = VectorEnv(4, processes=2, world_fn=BrokenWorld(fail_on=2))
+    try:
+        with pytest.raises(ValueError, match="broken world"):
+            vec.reset([1, 2, 3, 4])
+        observations, infos = vec.reset([1, 2, 3, 4])
+        assert [info["seed"] for info in infos] == [1, 2, 3, 4]
+        observations, rewards, dones, infos = vec.step(["look"] * 4)
+        assert not any(dones)
+    finally:
+        vec.close()
@@ -0,0 +1,62 @@
+import gc
+import weakref
+
+from game_world import generate_world
+from parser import Parser
+from sessions import SessionManager
+
+def lantern_world():
+    start = generate_world()
+    Parser().try_add_new_rule("lantern", "<PickUpAble>")
+    return start
+
+def test_layers_do_not_see_each_others_rules():
+    base = Parser()
+    base_rules = len(base.full_rules())
+    lantern, plain = base.new_layer(), base.new_layer()
+    with lantern:
+        lantern_world()
+    with plain:
+        generate_world()
+
+    assert lantern.parse("get lantern").method == "pickup"
+    assert not plain.parse("get lantern").is_valid
+    assert not base.parse("get lantern").is_valid
+    # the base never gets a world's rules
+    assert not base.parse("get sword").is_valid
+    assert plain.parse("get sword").method == "pickup"
+    assert len(base.full_rules()) == base_rules
+    assert base.active_layer is None
+
+def test_nested_layers_restore_the_active_layer():
+    base = Parser()
+    outer, inner = base.new_layer(), base.new_layer()
+    with outer:
+        with inner:
+            base.try_add_new_rule("lantern", "<PickUpAble>")
+        assert base.active_layer is outer
+        base.try_add_new_rule("lamp", "<PickUpAble>")
+    assert base.active_layer is None
+    assert inner.parse("get lantern").is_valid and not inner.parse("get lamp").is_valid
+    assert outer.parse("get lamp").is_valid and not outer.parse("get lantern").is_valid
+
+def test_sessions_are_isolated():
+    manager = SessionManager(world_fn=lantern_world)
+    plain_manager = SessionManager()
+    lantern_id, _ = manager.create(seed=1)
+    plain_id, _ = plain_manager.create(seed=1)
+    assert manager.get(lantern_id).parser is not plain_manager.get(plain_id).parser
+    assert manager.get(lantern_id).parser.parse("get lantern").is_valid
+    assert not plain_manager.get(plain_id).parser.parse("get lantern").is_valid
+
+def test_closed_sessions_free_their_layers():
+    manager = SessionManager()
+    layers = []
+    for i in range(50):
+        session_id, _ = manager.create(seed=i)
+        manager.handle(session_id, "get sword")
+        layers.append(weakref.ref(manager.get(session_id).parser))
+        manager.close(session_id)
+    gc.collect()
+    assert all(layer() is None for layer in layers)
+    assert Parser().active_layer is None
@@ -0,0 +1,73 @@
+import pytest
+
+from game_world import generate_world
+from parser import CompiledGrammar, Parser, RULES, rules_hash
+
+Commands = ["go north", "get sword", "attack troll", "kill the dragon", "pick up potion", "drink potion",
+            "hold sword", "unlock door", "look", "inventory", "go to dragon room", "drop all", "up", "dance"]
+
+@pytest.fixture
+def parser():
+    # snapshots are only loaded for the rules they were saved with, so start from the pristine base grammar
+    parser = Parser()
+    parser.build_fst(RULES)
+    yield parser
+    # and leave it that way for other tests
+    parser.build_fst(RULES)
+
+def parse_all(grammar):
+    return [grammar.parse(command) for command in Commands]
+
+def test_base_snapshot_round_trip(parser, tmp_path):
+    path = str(tmp_path / "base.pcgg")
+    expected = parse_all(parser)
+    parser.save_snapshot(path)
+    assert parser.load_snapshot(path)
+    assert parser.fst is None
+    assert parse_all(parser) == expected
+
+def test_stale_snapshot_is_not_loaded(parser, tmp_path):
+    path = str(tmp_path / "world.pcgg")
+    parser.try_add_new_rule("lantern", "<PickUpAble>")
+    parser.save_snapshot(path)
+    version = parser.version
+
+    # the snapshot holds a rule RULES does not
+    assert not parser.load_snapshot(path)
+    assert not parser.load_snapshot(path, rules=RULES + ["lamp => <PickUpAble>"])
+    assert CompiledGrammar.load(path, rules_hash(RULES)) is None
+    assert parser.version == version
+
+    assert parser.load_snapshot(path, rules=parser.full_rules())
+    assert parser.parse("get lantern").method == "pickup"
+
+@pytest.mark.parametrize("contents", [b"", b"PCGG", b"not a snapshot" * 10])
+def test_missing_or_corrupt_snapshot_is_not_loaded(parser, tmp_path, contents):
+    path = tmp_path / "bad.pcgg"
+    assert not parser.load_snapshot(str(path))
+    path.write_bytes(contents)
+    assert not parser.load_snapshot(str(path))
+    assert parser.parse("go north").method == "move"
+
+def test_rules_added_after_loading(parser, tmp_path):
+    path = str(tmp_path / "base.pcgg")
+    parser.save_snapshot(path)
+    assert parser.load_snapshot(path)
+    parser.try_add_new_rule("lantern", "<PickUpAble>")
+    assert parser.fst is not None
+    assert parser.parse("get lantern").method == "pickup"
+    assert parser.parse("go north").method == "move"
+
+def test_layered_snapshot_round_trip(parser, tmp_path):
+    path = str(tmp_path / "layer.pcgg")
+    layer = parser.new_layer()
+    with layer:
+        generate_world()
+    expected = parse_all(layer)
+    assert parser.parse("get sword") != layer.parse("get sword")
+    layer.save_snapshot(path)
+
+    # saved for the base plus layer rules, so only those load it
+    assert not parser.load_snapshot(path)
+    assert parser.load_snapshot(path, rules=layer.full_rules())
+    assert parse_all(parser) == expected
@@ -0,0 +1,30 @@
+from entities import Item, ItemHandler
+
+def test_items_keep_insertion_order():
+    handler = ItemHandler()
+    names = ["potion", "sword", "potion", "shield", "sword", "potion"]
+    items = [Item(name=name) for name in names]
+    for item in items:
+        handler.add_item(item)
+    assert handler.items == items
+    assert [i is j for i, j in zip(handler.items, items)] == [True] * len(items)
+
+    handler.remove_item("sword")
+    assert [i.name for i in handler.items] == ["potion", "sword", "potion", "shield", "potion"]
+    late = Item(name="sword")
+    handler.add_item(late)
+    assert handler.items[-1] is late
+
+    # as GameState.restore sets them
+    handler.items = list(reversed(handler.items))
+    assert handler.items[0] is late and handler.items[-1] is items[0]
+
+def test_get_item_is_the_item_removed():
+    handler = ItemHandler()
+    potions = [Item(name="potion", hp=hp) for hp in (10, 20, 30)]
+    for potion in potions:
+        handler.add_item(potion)
+    while handler.count("potion"):
+        item = handler.get_item("potion")
+        assert handler.remove_item("potion") is item
+    assert handler.get_item("potion") is None and handler.remove_item("potion") is None
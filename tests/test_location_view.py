@@ -0,0 +1,39 @@
+from entities import Entrance, Item, Location
+from parser import Parser
+
+def make_rooms():
+    with Parser().new_layer():
+        hall = Location(name="hall", desc="A hall.")
+        vault = Location(name="vault", desc="A vault.")
+        key = Item(name="iron key")
+    return hall, vault, key
+
+def test_views_are_cached_until_the_location_changes():
+    hall, _, key = make_rooms()
+    # the first view, unvisited, shows the initial description
+    hall.view()
+    view = hall.view()
+    assert hall.view() is view
+    text = view.render()
+    assert view.render() is text
+    hall.add_item(key)
+    assert hall.view() is not view
+    assert "iron key" in hall.describe()
+
+def test_unlocking_a_two_way_entrance_refreshes_both_sides():
+    hall, vault, key = make_rooms()
+    with Parser().new_layer():
+        hall.add_east(Entrance(vault, is_locked=True, name="iron door", key_name="iron key"))
+    assert "locked iron door" in hall.describe() and "locked iron door" in vault.describe()
+    assert hall.east.unlock(key)
+    assert "locked" not in hall.describe() and "locked" not in vault.describe()
+
+def test_unlocking_a_one_way_entrance_refreshes_where_it_leads():
+    hall, vault, key = make_rooms()
+    with Parser().new_layer():
+        hall.add_east(Entrance(vault, is_locked=True, name="iron door", key_name="iron key"), two_way=False)
+    vault.view()
+    vault_view = vault.view()
+    assert hall.east.unlock(key)
+    assert not hall.east.is_locked
+    assert vault.view() is not vault_view
@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+from entities import Item
+from game_state import GameState
+from game_world import generate_world
+from output import NullSink, OutputSink, TextSink, render, render_events
+from parser import Parser
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, s):
+        self.writes += 1
+        return super().write(s)
+
+    def flush(self):
+        self.flushes += 1
+
+def new_items(*names):
+    with Parser().new_layer():
+        return tuple(Item(name=name) for name in names)
+
+@pytest.mark.parametrize("items, expected", [
+    ((), "Your inventory is empty."),
+    (("sword",), "Your inventory has 1 item:\n  a sword"),
+    (("sword", "apple"), "Your inventory has 2 items:\n  a sword\n  an apple"),
+])
+def test_render_inventory(items, expected):
+    assert render(("inventory", new_items(*items))) == expected
+
+def test_render_holding_stats_and_text():
+    assert render(("holding", ())) == "You are holding nothing."
+    assert render(("holding", new_items("sword"))) == "You are holding:\n  a sword"
+    assert render(("stats", (10, 2, 5, 1))) == "Health:  10\nMagic:   2\nAttack:  5\nDefense: 1"
+    assert render(("text", "Hello")) == "Hello"
+    with pytest.raises(KeyError):
+        render(("unknown", None))
+
+def test_output_sink_buffers_events_until_flush():
+    sink = OutputSink()
+    sink.emit("text", "one")
+    sink.emit("stats", (1, 2, 3, 4))
+    events = sink.flush()
+    assert events == [("text", "one"), ("stats", (1, 2, 3, 4))]
+    assert sink.flush() == []
+
+def test_text_sink_writes_once_per_turn():
+    stream = CountingStream()
+    sink = TextSink(stream)
+    sink.emit("text", "one")
+    sink.emit("text", "two")
+    events = sink.flush()
+    assert stream.getvalue() == "one\ntwo\n"
+    assert (stream.writes, stream.flushes) == (1, 1)
+    assert render_events(events) == ["one", "two"]
+    # an empty turn writes nothing
+    sink.flush()
+    assert (stream.writes, stream.flushes) == (1, 1)
+
+def test_null_sink_discards():
+    sink = NullSink()
+    sink.emit("text", "one")
+    assert sink.flush() == []
+
+def test_game_output_is_structured():
+    layer = Parser().new_layer()
+    with layer:
+        start = generate_world()
+    stream = CountingStream()
+    gs = GameState(sink=TextSink(stream), seed=1)
+    gs.update_location(start)
+    gs.flush()
+
+    kinds = []
+    for command in ["look", "get sword", "inventory", "hold sword", "holding", "info"]:
+        gs.run_command(layer.parse(command))
+        events = gs.sink.events[:]
+        kinds.extend(kind for kind, _ in events)
+        gs.flush()
+        # rendered text is what the console gets
+        assert stream.getvalue().endswith("\n".join(render_events(events)) + "\n")
+    assert {"location", "inventory", "holding", "stats"} <= set(kinds)
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from parser import Parser
+
+Inputs = ["go north", "head west", "get sword", "pick up the potion", "take potion", "attack troll", "kill the dragon",
+          "headbutt rat", "drink potion", "use potion", "hold sword", "unlock door", "un lock door", "look",
+          "describe room", "where am i", "inventory", "holding", "what am i holding", "drop all", "drop potion",
+          "go to dragon room", "help", "quit", "climb", "sword", "north south", "dance", "a the an", ""]
+
+# the dict walk re-matches the output of [method] rules, see parser.py __main__
+FightDifferences = [
+    ("fight dragon dragon", (("dragon",), (), ("dragon",), ("fight",)), (("dragon",), ("fight",), ("dragon",))),
+    ("attack snake rat", (("snake",), (), ("rat",), ("attack",)), (("snake",), ("attack",), ("rat",))),
+]
+Unsettled = ["up", "go up", "climb down", "below", "above north"]
+
+@pytest.fixture
+def parser():
+    parser = Parser()
+    yield parser
+    parser.use_compiled = True
+
+def parse_both(parser, s):
+    parser.use_compiled = False
+    expected = parser.parse_cleaned(s)
+    parser.use_compiled = True
+    return expected, parser.parse_cleaned(s)
+
+@pytest.mark.parametrize("s", Inputs)
+def test_compiled_matches_dict_walk(parser, s):
+    expected, result = parse_both(parser, s)
+    assert result == expected
+
+def test_compiled_matches_dict_walk_random(parser):
+    words = sorted(set(w for tok in parser.compiled().id2tok if tok[0] not in "[<" for w in tok.split(" "))
+                   - {"up", "down", "above", "below"})
+    rng = random.Random(0)
+    for _ in range(2000):
+        s = " ".join(rng.choice(words) for _ in range(rng.randint(1, 4)))
+        expected, result = parse_both(parser, s)
+        if expected.method == "fight" and expected.args.count(()) > result.args.count(()):
+            continue
+        assert result == expected, s
+
+@pytest.mark.parametrize("s, dict_args, compiled_args", FightDifferences)
+def test_dict_walk_rematches_fight(parser, s, dict_args, compiled_args):
+    expected, result = parse_both(parser, s)
+    assert expected.method == result.method == "fight"
+    assert expected.args == dict_args
+    assert result.args == compiled_args
+
+@pytest.mark.parametrize("s", Unsettled)
+def test_dict_walk_never_settles_on_vertical_moves(parser, s):
+    parser.use_compiled = False
+    with pytest.raises(Exception, match="did not settle"):
+        parser.parse_cleaned(s)
+    parser.use_compiled = True
+    result = parser.parse_cleaned(s)
+    assert result.is_valid and result.method == "move"
+
+def test_adding_rule_invalidates_cache():
+    layer = Parser().new_layer()
+    assert not layer.parse("get lantern").is_valid
+    layer.try_add_new_rule("lantern", "<PickUpAble>")
+    result = layer.parse("get lantern")
+    assert result.is_valid and result.method == "pickup"
+    assert result.args == (("lantern",),)
+    assert layer.cache_stats()["invalidations"] == 1
+
+def test_cached_results_share_no_mutable_state():
+    layer = Parser().new_layer()
+    first = layer.parse("attack troll")
+    second = layer.parse("attack troll")
+    assert first is second
+    assert isinstance(first.args, tuple) and all(isinstance(arg, (tuple, str)) for arg in first.args)
+    with pytest.raises(AttributeError):
+        first.args = ()
+    assert first.args == (("troll",), ("attack",))
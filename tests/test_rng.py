@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from rng import BlockRandom
+
+def draws(rng: BlockRandom, n: int):
+    return [rng.rand_float() if i % 3 else rng.rand(20, low=5) for i in range(n)]
+
+def test_draws_follow_the_seed():
+    rng = BlockRandom(seed=42, block_size=8)
+    floats = [rng.rand_float() for _ in range(30)]
+    assert floats == np.random.default_rng(42).random(32).tolist()[:30]
+    assert draws(BlockRandom(seed=7), 200) == draws(BlockRandom(seed=7), 200)
+    assert draws(BlockRandom(seed=7), 200) != draws(BlockRandom(seed=8), 200)
+
+def test_rand_is_inclusive():
+    rng = BlockRandom(seed=0)
+    values = [rng.rand(3, low=1) for _ in range(2000)]
+    assert set(values) == {1, 2, 3}
+    assert set(rng.rand(0) for _ in range(10)) == {0}
+
+def test_seed_is_random_when_not_given():
+    first, second = BlockRandom(), BlockRandom()
+    assert first.seed != second.seed
+    replay = BlockRandom(seed=first.seed)
+    assert draws(first, 100) == draws(replay, 100)
+
+@pytest.mark.parametrize("before", [0, 1, 7, 8, 9, 50])
+def test_setstate_replays(before):
+    rng = BlockRandom(seed=3, block_size=8)
+    draws(rng, before)
+    state = rng.getstate()
+    expected = draws(rng, 40)
+    # several times, after drawing across blocks
+    for _ in range(3):
+        draws(rng, 25)
+        rng.setstate(state)
+        assert draws(rng, 40) == expected
+
+@pytest.mark.parametrize("before", [0, 5, 20])
+def test_setstate_into_another_instance(before):
+    rng = BlockRandom(seed=11, block_size=8)
+    draws(rng, before)
+    state = rng.getstate()
+    expected = draws(rng, 30)
+
+    other = BlockRandom(seed=99, block_size=8)
+    draws(other, 13)
+    other.setstate(state)
+    assert other.seed == 11
+    assert draws(other, 30) == expected
+
+def test_reseed():
+    rng = BlockRandom(seed=1)
+    draws(rng, 10)
+    rng.reseed(5)
+    assert draws(rng, 50) == draws(BlockRandom(seed=5), 50)
@@ -0,0 +1,61 @@
+import json
+import os
+
+from runner import read_script, run_scripts
+from sessions import SessionManager
+
+Scripts = [
+    ["look", "get sword", "hold sword", "go north", "attack troll", "attack troll", "inventory"],
+    ["# a comment", "", "drink potion", "go south", "go east", "go west", "drop all", "look"],
+    ["attack dragon", "attack dragon", "attack dragon", "attack dragon", "look"],
+    ["help", "quit", "look"],
+]
+
+def write_scripts(folder):
+    paths = []
+    for i, commands in enumerate(Scripts * 3):
+        path = folder / f"script_{i}.txt"
+        path.write_text("\n".join(commands) + "\n")
+        paths.append(str(path))
+    return paths
+
+def read_outputs(folder, paths):
+    outputs = dict()
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(os.path.join(folder, name + ".txt")) as f:
+            transcript = f.read()
+        with open(os.path.join(folder, name + ".json")) as f:
+            outputs[name] = (transcript, json.load(f))
+    return outputs
+
+def play_serially(commands, seed):
+    manager = SessionManager()
+    session_id, output = manager.create(seed=seed)
+    session = manager.get(session_id)
+    lines = [f"# seed: {seed}"] + output
+    for command in commands:
+        if session.is_over:
+            break
+        lines.append(f">>> {command}")
+        lines.extend(session.handle(command))
+    return "".join(line + "\n" for line in lines)
+
+def test_read_script_skips_comments_and_blank_lines(tmp_path):
+    path = write_scripts(tmp_path)[1]
+    assert list(read_script(path)) == Scripts[1][2:]
+
+def test_pool_matches_serial_play(tmp_path):
+    paths = write_scripts(tmp_path)
+    pooled = run_scripts(paths, str(tmp_path / "pooled"), processes=2, chunk_size=2, seed=5)
+    in_process = run_scripts(paths, str(tmp_path / "serial"), processes=1, seed=5)
+    assert pooled["games"] == in_process["games"] == len(paths)
+    assert pooled["commands"] == in_process["commands"]
+
+    outputs = read_outputs(tmp_path / "pooled", paths)
+    assert outputs == read_outputs(tmp_path / "serial", paths)
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        transcript, state = outputs[name]
+        assert transcript == play_serially(read_script(path), seed=5)
+        assert state["seed"] == 5
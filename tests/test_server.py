@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from server import GameServer, read_reply
+from sessions import SessionManager
+
+def run_with_server(client, **kwargs):
+    """
+    Starts a GameServer on a free localhost port, runs client(server, reader, writer) against it and stops it
+    """
+    async def main():
+        server = GameServer(SessionManager(), **kwargs)
+        listener = await server.start("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            await asyncio.wait_for(client(server, reader, writer), timeout=10)
+        finally:
+            writer.close()
+            await server.close()
+    asyncio.run(main())
+
+def test_session_and_quit():
+    async def client(server, reader, writer):
+        opening = await read_reply(reader)
+        assert opening
+        assert len(server.manager) == 1
+
+        writer.write(b"look\n")
+        assert await read_reply(reader)
+
+        writer.write(b"quit\n")
+        assert await read_reply(reader)
+        # the game is over, so the server hangs up
+        assert await reader.read() == b""
+        assert len(server.manager) == 0
+        assert not server.clients
+    run_with_server(client)
+
+def test_idle_timeout():
+    async def client(server, reader, writer):
+        await read_reply(reader)
+        assert await reader.readline() == b"Idle timeout\n"
+        assert await reader.read() == b""
+        await asyncio.sleep(0.05)
+        assert len(server.manager) == 0
+    run_with_server(client, idle_timeout=0.2)
+
+def test_line_over_max_line():
+    async def client(server, reader, writer):
+        await read_reply(reader)
+        writer.write(b"look\n")
+        await read_reply(reader)
+        writer.write(b"x" * 200 + b"\n")
+        # the connection is closed rather than the line being run
+        with pytest.raises(asyncio.IncompleteReadError):
+            await read_reply(reader)
+        await asyncio.sleep(0.05)
+        assert len(server.manager) == 0
+    run_with_server(client, max_line=64)
@@ -0,0 +1,53 @@
+import pytest
+
+from sessions import SessionManager
+
+Commands = ["look", "get sword", "go north", "attack troll", "inventory", "drink potion", "go south"]
+
+def test_max_sessions():
+    manager = SessionManager(max_sessions=3)
+    ids = [manager.create(seed=i)[0] for i in range(3)]
+    with pytest.raises(Exception, match="Too many sessions"):
+        manager.create()
+    manager.close(ids[0])
+    assert ids[0] not in manager
+    manager.create(seed=3)
+    assert len(manager) == 3
+
+def test_duplicate_and_unknown_sessions():
+    manager = SessionManager()
+    manager.create(session_id="player")
+    with pytest.raises(Exception, match="already exists"):
+        manager.create(session_id="player")
+    with pytest.raises(Exception, match="Unknown session"):
+        manager.handle("nobody", "look")
+    # closing twice is harmless
+    manager.close("player")
+    manager.close("player")
+
+def test_max_turns_ends_the_game():
+    manager = SessionManager(max_turns=3)
+    session_id, _ = manager.create(seed=1)
+    for _ in range(2):
+        manager.handle(session_id, "look")
+    assert session_id in manager
+    manager.handle(session_id, "look")
+    assert session_id not in manager
+
+def test_quit_closes_the_session():
+    manager = SessionManager()
+    session_id, opening = manager.create(seed=1)
+    assert opening
+    output = manager.handle(session_id, "quit")
+    assert output
+    assert session_id not in manager
+
+def test_sessions_with_the_same_seed_play_the_same():
+    manager = SessionManager()
+    first, first_opening = manager.create(seed=7)
+    second, second_opening = manager.create(seed=7)
+    assert first_opening == second_opening
+    for command in Commands:
+        if first not in manager:
+            break
+        assert manager.handle(first, command) == manager.handle(second, command)
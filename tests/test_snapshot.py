@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from game_state import GameState, PlayerFields
+from game_world import generate_grid_world, generate_world
+from output import OutputSink
+from parser import Parser
+
+def new_game(world_fn, seed: int = 1):
+    parser = Parser().new_layer()
+    with parser:
+        start = world_fn()
+    gs = GameState(sink=OutputSink(), seed=seed)
+    gs.update_location(start)
+    gs.flush()
+    return gs, parser
+
+def fingerprint(gs: GameState):
+    """
+    Everything a player can observe, plus the dice
+    """
+    world = gs.world_index()
+    return (
+        gs.location.name, tuple(gs.visited), gs.play, gs.turn,
+        tuple(getattr(gs.player, name) for name in PlayerFields), gs.player.modifiers.getstate(),
+        tuple(i.name for i in gs.inventory.get_items()), tuple(i.name for i in gs.hands.get_items()),
+        # view() would mark every location visited
+        tuple((location.visited, location.build_view().render(),
+               tuple((c.name, c.hp, c.is_alive) for c in location.creatures.get_items()))
+              for location in world.locations),
+        gs.rng.getstate(),
+    )
+
+def play(gs, parser, rng, steps):
+    for _ in range(steps):
+        if not gs.play:
+            break
+        actions = gs.valid_actions(parser) or ["look"]
+        gs.run_command(parser.parse(rng.choice(actions)))
+        gs.flush()
+
+@pytest.mark.parametrize("world_fn", [generate_world, lambda: generate_grid_world(6, 6)])
+def test_restore_puts_everything_back(world_fn):
+    gs, parser = new_game(world_fn)
+    rng = random.Random(0)
+    play(gs, parser, rng, 5)
+    snapshot = gs.snapshot()
+    expected = fingerprint(gs)
+    expected_hash = gs.state_hash
+
+    for _ in range(5):
+        play(gs, parser, rng, 20)
+        gs.restore(snapshot)
+        assert fingerprint(gs) == expected
+        assert gs.state_hash == expected_hash == gs.compute_hash()
+
+def test_restored_games_play_the_same():
+    gs, parser = new_game(generate_world)
+    snapshot = gs.snapshot()
+    commands = ["get sword", "hold sword", "go north", "attack troll", "attack troll", "attack troll", "look"]
+
+    outputs = []
+    for _ in range(2):
+        gs.restore(snapshot)
+        output = []
+        for command in commands:
+            gs.run_command(parser.parse(command))
+            output.extend(gs.flush())
+        outputs.append(([str(event) for event in output], fingerprint(gs)))
+    assert outputs[0] == outputs[1]
+
+def test_snapshot_is_not_changed_by_later_play():
+    gs, parser = new_game(generate_world)
+    snapshot = gs.snapshot()
+    copy = tuple(snapshot)
+    play(gs, parser, random.Random(1), 30)
+    assert snapshot == copy
+
+def test_snapshots_of_different_points():
+    gs, parser = new_game(generate_world)
+    rng = random.Random(2)
+    points = []
+    for _ in range(6):
+        points.append((gs.snapshot(), fingerprint(gs)))
+        play(gs, parser, rng, 4)
+    # restore out of order
+    for snapshot, expected in reversed(points[::2] + points[1::2]):
+        gs.restore(snapshot)
+        assert fingerprint(gs) == expected
@@ -0,0 +1,70 @@
+from functools import partial
+
+import pytest
+
+from entities import Entrance, Item, Location
+from game_state import GameState
+from game_world import generate_grid_world, generate_world
+from output import NullSink
+from parser import Parser
+from solver import Solver
+
+def two_swords():
+    hall = Location(name="hall", desc="A hall.")
+    armoury = Location(name="armoury", desc="An armoury.")
+    hall.add_east(Entrance(armoury))
+    hall.add_item(Item(name="sword"))
+    armoury.add_item(Item(name="sword"))
+    return hall
+
+def replay(world_fn, commands):
+    parser = Parser().new_layer()
+    with parser:
+        start = world_fn()
+    gs = GameState(sink=NullSink())
+    gs.update_location(start)
+    for command in commands:
+        gs.run_command(parser.parse(command))
+    return gs
+
+@pytest.mark.parametrize("greedy", [False, True])
+def test_solves_generate_world(greedy):
+    report = Solver(generate_world, greedy=greedy).solve()
+    assert report.exhaustive
+    assert report.shortest == (not greedy)
+    assert not report.unreachable_rooms and not report.unobtainable_items and not report.unkilled_creatures
+    assert {"room: dragon room", "item: sword", "kill: dragon in dragon room"} <= set(report.paths)
+
+    # room and item paths replay without depending on the dice
+    for goal, path in report.paths.items():
+        kind, name = goal.split(": ")
+        gs = replay(generate_world, path)
+        if kind == "room":
+            assert gs.location.name == name
+        elif kind == "item":
+            assert name in [i.name for i in gs.inventory.get_items() + gs.hands.get_items()]
+
+def test_shortest_paths():
+    report = Solver(generate_world).solve()
+    # the treasure room is behind a door locked with the gold key
+    assert report.paths["room: treasure room"] == ["get gold key", "unlock wooden door", "go east"]
+    assert report.paths["item: sword"] == ["get sword"]
+
+def test_items_with_the_same_name_are_separate_goals():
+    report = Solver(two_swords).solve()
+    assert report.exhaustive
+    assert report.paths["item: sword"] == ["get sword"]
+    # the armoury's sword is its own goal, not found by picking up the hall's
+    assert report.paths["item: sword #2"] == ["go east", "get sword"]
+    assert not report.unobtainable_items
+
+def test_node_budget():
+    world_fn = partial(generate_grid_world, width=10, height=10)
+    report = Solver(world_fn, max_nodes=50).solve()
+    assert report.nodes == 50
+    assert not report.exhaustive
+    assert report.unreachable_rooms
+
+    greedy = Solver(world_fn, greedy=True).solve()
+    assert greedy.exhaustive
+    assert not greedy.unreachable_rooms and not greedy.unobtainable_items
@@ -0,0 +1,81 @@
+import random
+import string
+
+import pytest
+
+from parser import Parser
+from sessions import SessionManager
+from spelling import SpellingIndex, edit_distance
+
+def osa_distance(a: str, b: str) -> int:
+    # unbounded optimal string alignment distance, the reference for edit_distance
+    d = [[i + j if i * j == 0 else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[-1][-1]
+
+def brute_force_lookup(index: SpellingIndex, token: str):
+    if token in index.words:
+        return token, 0
+    if len(token) < index.min_length:
+        return None, index.max_distance + 1
+    max_distance = min(index.max_distance, 1 if len(token) < 5 else 2)
+    matches = [(edit_distance(token, word, max_distance), word) for word in index.words]
+    matches = [(distance, word) for distance, word in matches if distance <= max_distance]
+    if not matches:
+        return None, index.max_distance + 1
+    distance, word = min(matches)
+    return word, distance
+
+def typo(rng: random.Random, word: str) -> str:
+    for _ in range(rng.randint(1, 3)):
+        i = rng.randrange(len(word) + 1)
+        edit = rng.choice("insert delete replace swap")
+        if edit == "insert" or not word:
+            word = word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+        elif edit == "delete":
+            word = word[:i] + word[i + 1:]
+        elif edit == "replace":
+            word = word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+        elif len(word) > 1:
+            i = min(i, len(word) - 2)
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+def test_edit_distance_matches_reference():
+    rng = random.Random(0)
+    words = sorted(w for w in Parser().compiled().id2tok if SpellingIndex.is_word(w))
+    for _ in range(2000):
+        a, b = rng.choice(words), typo(rng, rng.choice(words))
+        expected = osa_distance(a, b)
+        for max_distance in (1, 2, 3):
+            distance = edit_distance(a, b, max_distance)
+            assert distance == (expected if expected <= max_distance else max_distance + 1), (a, b)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_lookup_matches_brute_force(seed):
+    rng = random.Random(seed)
+    words = ["".join(rng.choice("abcdefgh") for _ in range(rng.randint(3, 9))) for _ in range(300)]
+    index = SpellingIndex(words[:150])
+    # words added after the index was built
+    index.update(words[150:])
+    for _ in range(300):
+        token = typo(rng, rng.choice(words))
+        assert index.lookup(token) == brute_force_lookup(index, token), token
+
+def test_sessions_correct_spelling_when_enabled():
+    manager = SessionManager(spelling=True)
+    session_id, _ = manager.create(seed=1)
+    parser = manager.get(session_id).parser
+    assert parser.parse("atack trol").method == "fight"
+    assert parser.parse("get swrod").args == (("sword",),)
+
+    plain = SessionManager()
+    plain_id, _ = plain.create(seed=1)
+    assert not plain.get(plain_id).parser.parse("atack trol").is_valid
+    # the shared index is built, but the base grammar's own parses are left alone
+    assert not Parser().correct_typos
+    assert not Parser().parse("atack trol").is_valid
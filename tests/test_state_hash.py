@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from game_state import GameState
+from game_world import generate_grid_world, generate_world
+from output import OutputSink
+from parser import Parser
+
+# commands valid_actions leaves out, some of which change nothing
+ExtraCommands = ["look", "inventory", "drop all", "wait", "hold potion", "drink potion", "go north", "up"]
+
+def play_randomly(world_fn, seed: int, steps: int = 400):
+    rng = random.Random(seed)
+    parser = Parser().new_layer()
+    with parser:
+        start = world_fn()
+    gs = GameState(sink=OutputSink(), seed=seed)
+    gs.update_location(start)
+    assert gs.state_hash == gs.compute_hash()
+
+    snapshots = []
+    for _ in range(steps):
+        roll = rng.random()
+        if roll < 0.1:
+            snapshots.append(gs.snapshot())
+        elif roll < 0.2 and snapshots:
+            gs.restore(rng.choice(snapshots))
+        else:
+            actions = gs.valid_actions(parser)
+            command = rng.choice(actions) if actions and rng.random() < 0.85 else rng.choice(ExtraCommands)
+            gs.run_command(parser.parse(command))
+            gs.flush()
+        assert gs.state_hash == gs.compute_hash()
+        if not gs.play:
+            # keep going from an earlier state, or stop
+            if not snapshots:
+                break
+            gs.restore(snapshots[0])
+            assert gs.state_hash == gs.compute_hash()
+
+@pytest.mark.parametrize("seed", range(5))
+def test_hash_matches_recompute_default_world(seed):
+    play_randomly(generate_world, seed)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_hash_matches_recompute_grid_world(seed):
+    play_randomly(lambda: generate_grid_world(width=6, height=6, num_creatures=8, seed=seed), seed)
+
+def test_hash_keys_are_per_world_and_bounded():
+    gs = GameState(sink=OutputSink(), seed=0)
+    with Parser().new_layer():
+        gs.update_location(generate_world())
+    gs.state_hash
+    assert gs.world.hash_keys
+    gs.MaxHashKeys = 8
+    for hp in range(100):
+        gs.zobrist_key(("player", hp))
+        assert len(gs.world.hash_keys) <= 8
+    assert gs.state_hash == gs.compute_hash()
@@ -0,0 +1,87 @@
+import gc
+
+from entities import Item, Location
+from game_state import GameState
+from output import OutputSink
+from parser import Parser
+from stats import Modifier, Modifiers
+
+def test_totals():
+    modifiers = Modifiers()
+    modifiers.add("sword", [Modifier("attack", 10)])
+    modifiers.add("ring", [Modifier("attack", 2), Modifier("defense", 3)])
+    assert (modifiers.total("attack"), modifiers.total("defense"), modifiers.total("hp")) == (12, 3, 0)
+
+    # adding under a source replaces what it had
+    modifiers.add("ring", [Modifier("defense", 1)])
+    assert (modifiers.total("attack"), modifiers.total("defense")) == (10, 1)
+    modifiers.remove("sword")
+    modifiers.remove("sword")
+    assert (modifiers.total("attack"), modifiers.total("defense")) == (0, 1)
+    modifiers.add("ring", [])
+    assert modifiers.total("defense") == 0 and not modifiers.active
+
+def test_expiry():
+    modifiers = Modifiers()
+    modifiers.add("potion", [Modifier("attack", 5, turns=2)], expires=3)
+    modifiers.add("elixir", [Modifier("attack", 1, turns=5)], expires=6)
+    modifiers.add("sword", [Modifier("attack", 10)])
+    assert modifiers.timed(1) == ((2, (Modifier("attack", 5, turns=2),)), (5, (Modifier("attack", 1, turns=5),)))
+
+    assert not modifiers.tick(2)
+    assert modifiers.total("attack") == 16
+    assert modifiers.tick(3)
+    assert modifiers.total("attack") == 11
+    # re-added with a later expiry, the earlier expiry no longer applies
+    modifiers.add("elixir", [Modifier("attack", 1, turns=5)], expires=9)
+    assert not modifiers.tick(6)
+    assert modifiers.tick(9)
+    assert modifiers.total("attack") == 10
+    assert modifiers.timed(9) == ()
+
+def test_getstate_setstate():
+    modifiers = Modifiers()
+    modifiers.add("potion", [Modifier("attack", 5, turns=2)], expires=3)
+    modifiers.add("sword", [Modifier("attack", 10)])
+    state = modifiers.getstate()
+
+    modifiers.tick(3)
+    modifiers.add("ring", [Modifier("defense", 3)])
+    modifiers.remove("sword")
+    assert (modifiers.total("attack"), modifiers.total("defense")) == (0, 3)
+
+    for _ in range(2):
+        modifiers.setstate(state)
+        assert (modifiers.total("attack"), modifiers.total("defense")) == (15, 0)
+        # the restored timed modifier still expires
+        assert modifiers.tick(3)
+        assert modifiers.total("attack") == 10
+
+    other = Modifiers()
+    other.setstate(state)
+    assert other.total("attack") == 15 and other.timed(1) == modifiers.timed(1) + ((2, (Modifier("attack", 5, turns=2),)),)
+
+def test_consumed_effects_stack_and_expire():
+    parser = Parser().new_layer()
+    room = Location(name="hall", desc="A hall.")
+    gs = GameState(sink=OutputSink())
+    gs.update_location(room)
+    base_attack = gs.get_attack_points()
+
+    for _ in range(2):
+        with parser:
+            room.add_item(Item(name="potion", effects=(Modifier("attack", 5, turns=2),)))
+        gs.run_command(parser.parse("drink potion"))
+        # the drunk potion is freed, and its id can be reused by the next one
+        gc.collect()
+    assert gs.get_attack_points() == base_attack + 10
+    assert gs.consumed == 2
+
+    snapshot = gs.snapshot()
+    for _ in range(3):
+        gs.run_command(parser.parse("look"))
+    assert gs.get_attack_points() == base_attack
+
+    gs.restore(snapshot)
+    assert gs.consumed == 2
+    assert gs.get_attack_points() == base_attack + 10
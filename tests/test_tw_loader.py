@@ -0,0 +1,75 @@
+import os
+import shutil
+
+import pytest
+
+from entities import WorldIndex
+from game_state import GameState
+from output import OutputSink
+from parser import Parser
+from tw_loader import CompiledWorld, compile_textworld, load_textworld
+
+CustomGame = os.path.join(os.path.dirname(__file__), "..", "tw_games", "custom_game.json")
+
+def describe_game(game):
+    """
+    The rooms, their exits and items, and the player's inventory, for comparing builds
+    """
+    rooms = []
+    for location in WorldIndex(game.start).locations:
+        exits = [(d, e.name, e.is_locked, e.key_name, e.location.name)
+                 for d, e in zip(location.get_entrance_directions(), location.get_entrances())]
+        rooms.append((location.name, location.desc, exits, [item.name for item in location.items]))
+    return rooms, [item.name for item in game.inventory], game.objective
+
+def load(path, **kwargs):
+    with Parser().new_layer():
+        return load_textworld(path, **kwargs)
+
+@pytest.fixture
+def game_path(tmp_path):
+    # the cache is written next to the game
+    path = str(tmp_path / "custom_game.json")
+    shutil.copy(CustomGame, path)
+    return path
+
+def test_cached_build_matches_json_build(game_path):
+    expected = describe_game(load(game_path, use_cache=False))
+    assert not os.path.exists(game_path + ".pcgw")
+    # compiles and writes the cache, then loads from it
+    assert describe_game(load(game_path)) == expected
+    stat = os.stat(game_path)
+    cached = CompiledWorld.load(game_path + ".pcgw", stat.st_size, stat.st_mtime_ns)
+    assert cached is not None and vars(cached) == vars(compile_textworld(game_path))
+    assert describe_game(load(game_path)) == expected
+
+# bytes kept, -1 is one byte short
+@pytest.mark.parametrize("keep", [0, 10, 100, 300, -1])
+def test_truncated_cache_falls_back_to_json(game_path, keep):
+    expected = describe_game(load(game_path, use_cache=False))
+    load(game_path)
+    cache_path = game_path + ".pcgw"
+    with open(cache_path, "rb") as f:
+        data = f.read()
+    with open(cache_path, "wb") as f:
+        f.write(data[:keep])
+    assert describe_game(load(game_path)) == expected
+    # and the cache is rewritten
+    with open(cache_path, "rb") as f:
+        assert f.read() == data
+
+def test_closed_door_opens_without_a_key(game_path):
+    layer = Parser().new_layer()
+    with layer:
+        game = load_textworld(game_path, use_cache=False)
+    door = game.start.south
+    assert door.is_closed and door.cloney.is_closed
+    gs = GameState(sink=OutputSink())
+    gs.update_location(game.start)
+    assert "open door" in gs.valid_actions(layer)
+    gs.run_command(layer.parse("go south"))
+    assert gs.location is game.start
+    gs.run_command(layer.parse("open door"))
+    assert not door.is_locked and not door.cloney.is_locked
+    gs.run_command(layer.parse("go south"))
+    assert gs.location.name == "bedchamber"
@@ -0,0 +1,58 @@
+import pytest
+
+from entities import Entrance, Item, Location
+from enums import Opposite
+from game_state import GameState
+from output import OutputSink
+from parser import Parser
+from stats import Modifier
+
+def make_room(name):
+    return Location(name=name, desc=f"The {name}.")
+
+def test_every_open_exit_is_a_valid_action():
+    hub = make_room("hub")
+    for direction in sorted(Opposite):
+        getattr(hub, f"add_{direction}")(Entrance(make_room(f"{direction} room")))
+    parser = Parser().new_layer()
+    gs = GameState(sink=OutputSink())
+    gs.update_location(hub)
+    actions = gs.valid_actions(parser)
+
+    # each exit's command is listed, and running it goes through that exit
+    destinations = set()
+    for command in actions:
+        gs.update_location(hub, describe=False)
+        gs.run_command(parser.parse(command))
+        destinations.add(gs.location.name)
+    assert destinations == set(getattr(hub, d).location.name for d in hub.get_entrance_directions())
+    assert len(actions) == len(hub.get_entrance_directions())
+
+def test_locked_exits_are_not_moves():
+    hub, loft = make_room("hub"), make_room("loft")
+    hub.add_above(Entrance(loft, is_locked=True, key_name="brass key"))
+    gs = GameState(sink=OutputSink())
+    gs.update_location(hub)
+    assert "up" not in gs.valid_actions(Parser().new_layer())
+
+@pytest.mark.parametrize("consume_fn, effects, consumable", [
+    (None, (), False),
+    (lambda item, gs: None, (), True),
+    (None, (Modifier("attack", 5, turns=3),), True),
+    (None, (Modifier("defense", 2),), True),
+])
+def test_consumable_items(consume_fn, effects, consumable):
+    hub = make_room("hub")
+    parser = Parser().new_layer()
+    with parser:
+        hub.add_item(Item(name="potion", consume_fn=consume_fn, effects=effects))
+    gs = GameState(sink=OutputSink())
+    gs.update_location(hub)
+    assert ("drink potion" in gs.valid_actions(parser)) == consumable
+
+    if consumable:
+        attack = gs.get_attack_points()
+        gs.run_command(parser.parse("drink potion"))
+        assert not hub.get_items()
+        if effects and effects[0].stat == "attack":
+            assert gs.get_attack_points() == attack + 5
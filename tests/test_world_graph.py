@@ -0,0 +1,29 @@
+from entities import Entrance, Location
+from game_state import GameState
+from output import OutputSink
+from parser import Parser
+from sessions import SessionManager
+
+def test_rooms_are_added_to_the_grammar_when_indexed():
+    layer = Parser().new_layer()
+    with layer:
+        hall = Location(name="hall", desc="A hall.")
+        hall.add_north(Entrance(Location(name="the attic", desc="An attic.")))
+        hall.add_south(Entrance(Location(desc="A placeholder.")))
+    assert layer.parse("go to hall").method != "travel"
+
+    gs = GameState(sink=OutputSink())
+    gs.update_location(hall)
+    gs.index_world(parser=layer)
+    assert layer.parse("go to hall").method == "travel"
+    # neither could be named in a command
+    assert [r for r in layer.added_rules if r.endswith("<Room>")] == ["hall => <Room>"]
+    assert Location.grammar_rules("(Name)") == [] and Location.grammar_rules("the attic") == []
+    assert not Parser().has_rule("hall")
+
+def test_travel_in_a_session():
+    manager = SessionManager()
+    session_id, _ = manager.create(seed=1)
+    manager.handle(session_id, "go north")
+    output = manager.handle(session_id, "go to large cavern")
+    assert any("You travel" in line for line in output)
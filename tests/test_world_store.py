@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from game_state import GameState, PlayerFields
+from game_world import generate_grid_world
+from output import NullSink
+from parser import Parser
+from world_store import PagedWorld, WorldStore, save_world
+
+def commands_here(gs: GameState, rng: random.Random):
+    """
+    Takes what is here, fights what is here, unlocks what it can, then moves on
+    """
+    location = gs.location
+    commands = [f"get {item.name}" for item in location.items]
+    commands += [f"attack {creature.name}" for creature in location.creatures.items if creature.is_alive] * 3
+    held = set(item.name for item in gs.inventory.items) | set(item.name for item in location.items)
+    commands += [f"unlock {e.name}" for e in location.get_entrances() if e.is_locked and e.key_name in held]
+    return commands + [f"go {rng.choice(location.get_entrance_directions())}"]
+
+def test_paged_play_matches_in_memory_play(tmp_path):
+    path = str(tmp_path / "world.db")
+    layer = Parser().new_layer()
+    with layer:
+        start = generate_grid_world(width=6, height=5, num_locked=4, num_creatures=4, seed=0)
+        save_world(start, path)
+        in_memory = generate_grid_world(width=6, height=5, num_locked=4, num_creatures=4, seed=0)
+
+    pages = PagedWorld(WorldStore(path), parser=layer, radius=1, max_rooms=6)
+    paged_gs = GameState(sink=NullSink(), seed=0, pager=pages)
+    paged_gs.update_location(pages.start())
+    gs = GameState(sink=NullSink(), seed=0)
+    gs.update_location(in_memory)
+
+    rng = random.Random(0)
+    for _ in range(150):
+        for command in commands_here(gs, rng):
+            gs.run_command(layer.parse(command))
+            paged_gs.run_command(layer.parse(command))
+            assert paged_gs.location.name == gs.location.name
+        if not gs.play:
+            break
+    assert pages.evictions > 0 and pages.writes > 0
+    # some doors unlocked (each has two sides), some not
+    assert 0 < sum(e.is_locked for e in gs.world_index().entrances) < 8
+    pages.save()
+
+    # every room as it was left, evicted or not
+    expected = save_world(in_memory, str(tmp_path / "expected.db"))
+    assert len(pages.store) == len(expected)
+    for room_id in range(len(expected)):
+        assert pages.store.get(room_id) == expected.get(room_id)
+
+    # and the same game state, with the whole saved world loaded
+    whole = PagedWorld(pages.store, parser=layer, radius=20, max_rooms=1000)
+    whole.start()
+    loaded_gs = GameState(sink=NullSink())
+    loaded_gs.update_location(whole.rooms[pages.room_ids[id(paged_gs.location)]], describe=False)
+    for item in paged_gs.inventory.items:
+        loaded_gs.inventory.add_item(item)
+    for name in PlayerFields:
+        setattr(loaded_gs.player, name, getattr(paged_gs.player, name))
+    loaded_gs.play = paged_gs.play
+    assert loaded_gs.state_hash == gs.state_hash == gs.compute_hash()
+
+def test_save_world_does_not_overwrite(tmp_path):
+    path = str(tmp_path / "world.db")
+    with Parser().new_layer():
+        start = generate_grid_world(width=3, height=2, num_locked=1, num_creatures=1)
+    save_world(start, path).close()
+    with pytest.raises(Exception, match="already exists"):
+        save_world(start, path)
+    assert len(save_world(start, path, overwrite=True)) == 6